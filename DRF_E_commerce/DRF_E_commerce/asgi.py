@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DRF_E_commerce.settings')
+from DRF_E_commerce.settings import base
+
+if base.DEBUG:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DRF_E_commerce.settings.local')
+else:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DRF_E_commerce.settings.production')
 
 application = get_asgi_application()
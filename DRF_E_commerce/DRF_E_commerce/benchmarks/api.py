@@ -0,0 +1,247 @@
+"""
+Benchmark the catalog API at several catalog sizes.
+
+Every endpoint is called through the full Django stack with the test client against a
+throwaway database seeded in bulk. For each catalog size and operation the results
+hold latency percentiles, the number of queries and the peak Python memory of one
+request. Run from the directory of manage.py:
+
+    python -m DRF_E_commerce.benchmarks.api --sizes 1000 10000 100000 --output bench.json
+
+and diff two runs, e.g. before and after a change:
+
+    python -m DRF_E_commerce.benchmarks.api --compare bench-main.json bench.json
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from DRF_E_commerce.benchmarks.utils import (
+    benchmark_database,
+    metadata,
+    setup_django,
+    summarize,
+    write_json,
+)
+
+
+def operations(rng):
+    """
+    Return ``{name: callable(client)}`` for every benchmarked request. The ids are
+    picked at random among the seeded rows, creates use unique names.
+    """
+    from django.db.models import F
+
+    from DRF_E_commerce.product.models import Brand, Category, Product
+
+    product_ids = list(Product.objects.values_list("id", flat=True))
+    brand_ids = list(Brand.objects.values_list("id", flat=True))
+    category_ids = list(Category.objects.values_list("id", flat=True))
+    brand_names = list(Brand.objects.values_list("names", flat=True)[:100])
+    # leaves have rght == lft + 1
+    leaf_names = list(
+        Category.objects.filter(rght=F("lft") + 1).values_list("names", flat=True)[:100]
+    )
+    root_id = Category.objects.filter(parent=None).values_list("id", flat=True).first()
+    counter = itertools.count()
+
+    def product_payload():
+        return {
+            "names": "Bench product %d" % next(counter),
+            "description": "benchmark",
+            "is_digital": False,
+            "brand": rng.choice(brand_names),
+            "category": rng.choice(leaf_names),
+        }
+
+    return {
+        "product.list": lambda c: c.get("/api/product/"),
+        "product.list_by_category_tree": lambda c: c.get(
+            "/api/product/", {"category": root_id, "include_descendants": "true"}
+        ),
+        "product.retrieve": lambda c: c.get("/api/product/%d/" % rng.choice(product_ids)),
+        "product.search": lambda c: c.get("/api/product/search/", {"q": "product 1"}),
+        "product.facets": lambda c: c.get("/api/product/facets/"),
+        "autocomplete": lambda c: c.get("/api/autocomplete/", {"q": "prod"}),
+        "product.create": lambda c: c.post("/api/product/", product_payload(), format="json"),
+        "product.update": lambda c: c.put(
+            "/api/product/%d/" % rng.choice(product_ids), product_payload(), format="json"
+        ),
+        "brand.list": lambda c: c.get("/api/brand/"),
+        "brand.retrieve": lambda c: c.get("/api/brand/%d/" % rng.choice(brand_ids)),
+        "brand.create": lambda c: c.post(
+            "/api/brand/", {"names": "Bench brand %d" % next(counter)}, format="json"
+        ),
+        "brand.update": lambda c: c.put(
+            "/api/brand/%d/" % rng.choice(brand_ids),
+            {"names": "Bench brand %d" % next(counter)},
+            format="json",
+        ),
+        "category.list": lambda c: c.get("/api/category/"),
+        "category.tree": lambda c: c.get("/api/category/tree/"),
+        "category.retrieve": lambda c: c.get("/api/category/%d/" % rng.choice(category_ids)),
+        "category.create": lambda c: c.post(
+            "/api/category/", {"names": "Bench category %d" % next(counter)}, format="json"
+        ),
+        "category.update": lambda c: c.put(
+            "/api/category/%d/" % rng.choice(category_ids),
+            {"names": "Bench category %d" % next(counter)},
+            format="json",
+        ),
+    }
+
+
+def measure(operation, client, repeat, warmup):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for _ in range(warmup):
+        operation(client)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = operation(client)
+    # read the count now, the next request clears connection.queries
+    query_count = len(queries)
+    status = response.status_code
+
+    tracemalloc.start()
+    operation(client)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples, errors = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = operation(client)
+        samples.append((time.perf_counter() - start) * 1000)
+        errors += response.status_code >= 400
+    return {
+        "status": status,
+        "errors": errors,
+        "queries": query_count,
+        "peak_memory_kib": round(peak / 1024, 1),
+        **summarize(samples),
+    }
+
+
+def run(args):
+    from django.conf import settings
+    from django.core.management import call_command
+    from rest_framework.test import APIClient
+
+    from DRF_E_commerce.benchmarks.seed import seed_catalog
+
+    if not args.with_cache:
+        # measure the endpoints, not the response cache
+        settings.RESPONSE_CACHE = {**getattr(settings, "RESPONSE_CACHE", {}), "ENABLED": False}
+
+    results = []
+    with benchmark_database(args.database):
+        for size in args.sizes:
+            call_command("flush", interactive=False, verbosity=0)
+            started = time.perf_counter()
+            seed_catalog(size, brands=args.brands, categories=args.categories, fanout=args.fanout)
+            seed_seconds = time.perf_counter() - started
+            print("seeded %d products in %.1fs" % (size, seed_seconds), file=sys.stderr)
+
+            rng = random.Random(args.seed)
+            client = APIClient()
+            for name, operation in operations(rng).items():
+                if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                    continue
+                result = measure(operation, client, args.repeat, args.warmup)
+                result.update(size=size, operation=name)
+                results.append(result)
+                print(
+                    "%8d %-32s p50 %8.2fms p95 %8.2fms %3d queries %9.1f KiB"
+                    % (
+                        size,
+                        name,
+                        result["p50_ms"],
+                        result["p95_ms"],
+                        result["queries"],
+                        result["peak_memory_kib"],
+                    ),
+                    file=sys.stderr,
+                )
+
+    write_json(
+        args.output,
+        {
+            "meta": metadata(
+                sizes=args.sizes,
+                brands=args.brands,
+                categories=args.categories,
+                repeat=args.repeat,
+                response_cache=args.with_cache,
+            ),
+            "results": results,
+        },
+    )
+
+
+def compare(baseline_path, current_path, threshold):
+    """
+    Print the p50 latency and query count changes between two result files, return
+    the number of operations whose p50 grew by more than ``threshold`` percent or that
+    run more queries
+    """
+    with open(baseline_path) as baseline_file, open(current_path) as current_file:
+        baseline = json.load(baseline_file)["results"]
+        current = json.load(current_file)["results"]
+    before = {(row["size"], row["operation"]): row for row in baseline}
+    regressions = 0
+    for row in current:
+        old = before.get((row["size"], row["operation"]))
+        if old is None:
+            continue
+        change = (row["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0
+        regressed = change > threshold or row["queries"] > old["queries"]
+        regressions += regressed
+        print(
+            "%8d %-32s p50 %8.2f -> %8.2fms (%+6.1f%%) queries %3d -> %3d%s"
+            % (
+                row["size"],
+                row["operation"],
+                old["p50_ms"],
+                row["p50_ms"],
+                change,
+                old["queries"],
+                row["queries"],
+                "  REGRESSION" if regressed else "",
+            )
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--brands", type=int, default=100)
+    parser.add_argument("--categories", type=int, default=1000)
+    parser.add_argument("--fanout", type=int, default=10, help="children per category")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the picked ids")
+    parser.add_argument("--only", nargs="*", help="operation name prefixes, e.g. product.list")
+    parser.add_argument("--with-cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--database", help="SQLite file to use instead of memory")
+    parser.add_argument("--output", default="-", help="JSON results file, - for stdout")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="diff two result files"
+    )
+    parser.add_argument("--threshold", type=float, default=20.0, help="p50 regression in %%")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    setup_django()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Compare the sync viewsets and the native async views under ASGI.
+
+The ASGI application from ``asgi.py`` is driven in-process by an asyncio client that
+keeps ``--concurrency`` requests in flight, first against the sync viewsets
+(``/api/...``), then against the async views (``/api/async/...``). For each path the
+results hold the throughput and the latency percentiles. Run from the directory of
+manage.py:
+
+    python -m DRF_E_commerce.benchmarks.asgi --size 10000 --concurrency 1 10 50
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from DRF_E_commerce.benchmarks.utils import (
+    benchmark_database,
+    metadata,
+    setup_django,
+    summarize,
+    write_json,
+)
+
+
+async def call(application, path, query_string=""):
+    """
+    Run one GET request through the ASGI application, return the status code
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "headers": [(b"host", b"testserver"), (b"accept", b"application/json")],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    status = None
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # nothing else to send, wait like a connected client would
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await application(scope, receive, send)
+    return status
+
+
+async def load(application, requests, concurrency):
+    """
+    Send ``requests`` (a list of ``(path, query_string)``) with at most
+    ``concurrency`` of them in flight, return the wall time, latencies and errors
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    samples, errors = [], 0
+
+    async def one(path, query_string):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            status = await call(application, path, query_string)
+            samples.append((time.perf_counter() - start) * 1000)
+            errors += status is None or status >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(path, query) for path, query in requests))
+    return time.perf_counter() - started, samples, errors
+
+
+def workloads(rng, count):
+    """
+    Return ``{name: [(path, query_string), ...]}`` with the same random picks for the
+    sync and the async prefix
+    """
+    from DRF_E_commerce.product.models import Brand, Product
+
+    product_ids = list(Product.objects.values_list("id", flat=True))
+    brand_ids = list(Brand.objects.values_list("id", flat=True))
+    return {
+        "product.list": [("product/", "")] * count,
+        "product.retrieve": [("product/%d/" % rng.choice(product_ids), "") for _ in range(count)],
+        "brand.retrieve": [("brand/%d/" % rng.choice(brand_ids), "") for _ in range(count)],
+    }
+
+
+def run(args):
+    from django.conf import settings
+
+    from DRF_E_commerce.asgi import application
+    from DRF_E_commerce.benchmarks.seed import seed_catalog
+
+    # both paths have to hit the database, the async views have no response cache
+    settings.RESPONSE_CACHE = {**getattr(settings, "RESPONSE_CACHE", {}), "ENABLED": False}
+
+    results = []
+    with benchmark_database(args.database):
+        seed_catalog(args.size, brands=args.brands, categories=args.categories)
+        print("seeded %d products" % args.size, file=sys.stderr)
+
+        for name, requests in workloads(random.Random(args.seed), args.requests).items():
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            for concurrency in args.concurrency:
+                for mode, prefix in (("sync", "/api/"), ("async", "/api/async/")):
+                    batch = [(prefix + path, query) for path, query in requests]
+                    asyncio.run(load(application, batch[: args.warmup], concurrency))
+                    elapsed, samples, errors = asyncio.run(load(application, batch, concurrency))
+                    result = {
+                        "operation": name,
+                        "mode": mode,
+                        "concurrency": concurrency,
+                        "errors": errors,
+                        "requests_per_second": round(len(batch) / elapsed, 1),
+                        **summarize(samples),
+                    }
+                    results.append(result)
+                    print(
+                        "%-20s %-5s c=%-4d %8.1f req/s p50 %8.2fms p95 %8.2fms"
+                        % (
+                            name,
+                            mode,
+                            concurrency,
+                            result["requests_per_second"],
+                            result["p50_ms"],
+                            result["p95_ms"],
+                        ),
+                        file=sys.stderr,
+                    )
+
+    write_json(
+        args.output,
+        {
+            "meta": metadata(
+                size=args.size,
+                requests=args.requests,
+                concurrency=args.concurrency,
+            ),
+            "results": results,
+        },
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--brands", type=int, default=100)
+    parser.add_argument("--categories", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the picked ids")
+    parser.add_argument("--only", nargs="*", help="operation name prefixes, e.g. product.list")
+    parser.add_argument("--database", help="SQLite file to use instead of memory")
+    parser.add_argument("--output", default="-", help="JSON results file, - for stdout")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""
+Load test the router endpoints with a concurrent read/write mix.
+
+``--concurrency`` worker threads each send one request after the other for
+``--duration`` seconds, picking the operation at random with the weights of
+``--mix``. Every ``--interval`` seconds a line reports the throughput, latency
+percentiles, errors and SQLite "database is locked" errors of that window. The JSON
+results hold the windows and a summary per operation.
+
+By default the requests go in process through Django's WSGI handler, against a
+throwaway SQLite file seeded like the other benchmarks. Unlike the test client the
+handler runs the request_started/finished signals, so database connections are
+opened and closed like under a real server. Threads share the GIL: compare runs
+with each other rather than with a multi process server. With ``--url`` the
+requests go to a running server instead, e.g. ``manage.py runserver``, and the ids
+and names to use are read from its API. Run from the directory of manage.py:
+
+    python -m DRF_E_commerce.benchmarks.load --concurrency 16 --duration 30
+    python -m DRF_E_commerce.benchmarks.load --url http://127.0.0.1:8000 \\
+        --mix product.list=5 product.create=5
+"""
+import argparse
+import http.client
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from DRF_E_commerce.benchmarks.utils import (
+    benchmark_database,
+    metadata,
+    setup_django,
+    summarize,
+    write_json,
+)
+
+DEFAULT_MIX = {
+    "product.list": 20,
+    "product.retrieve": 25,
+    "brand.list": 10,
+    "brand.retrieve": 10,
+    "category.list": 5,
+    "category.tree": 5,
+    "category.retrieve": 5,
+    "product.create": 8,
+    "product.update": 7,
+    "brand.create": 2,
+    "brand.update": 1,
+    "category.create": 2,
+}
+
+LOCKED = b"database is locked"
+
+
+def mix_item(item):
+    """
+    argparse type of ``--mix``: ``"product.list=3"`` to ``("product.list", 3.0)``
+    """
+    name, _, weight = item.partition("=")
+    if name not in DEFAULT_MIX:
+        raise argparse.ArgumentTypeError(
+            "unknown operation %s, one of %s" % (name, ", ".join(DEFAULT_MIX))
+        )
+    try:
+        weight = float(weight or 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid weight in %s" % item)
+    if weight < 0:
+        raise argparse.ArgumentTypeError("negative weight in %s" % item)
+    return name, weight
+
+
+class Catalog:
+    """
+    Ids and names the operations pick from, read through the API of the target
+    """
+
+    def __init__(self, product_ids, brands, categories):
+        self.product_ids = product_ids
+        self.brands = brands
+        self.categories = categories
+        self.counter = itertools.count()
+        # names stay unique across runs against the same server
+        self.run = uuid.uuid4().hex[:8]
+
+    @classmethod
+    def discover(cls, target):
+        products = target.get_json("/api/product/", {"page_size": 500})["results"]
+        brands = target.get_json("/api/brand/", {"limit": 500})["results"]
+        categories, stack = [], target.get_json("/api/category/tree/", {})
+        while stack:
+            node = stack.pop()
+            categories.append((node["id"], node["names"]))
+            stack.extend(node["children"])
+        if not products or not brands or not categories:
+            raise SystemExit("the target has no products, brands or categories to use")
+        return cls(
+            [product["id"] for product in products],
+            [(brand["id"], brand["names"]) for brand in brands],
+            categories,
+        )
+
+    def unique(self, prefix):
+        return "%s %s-%d" % (prefix, self.run, next(self.counter))
+
+
+def operations(catalog):
+    """
+    Return ``{name: callable(rng) -> (method, path, query, body)}``
+    """
+
+    def product_payload(rng):
+        return {
+            "names": catalog.unique("Load product"),
+            "description": "load test",
+            "is_digital": False,
+            "brand": rng.choice(catalog.brands)[1],
+            "category": rng.choice(catalog.categories)[1],
+        }
+
+    return {
+        "product.list": lambda rng: ("GET", "/api/product/", {}, None),
+        "product.retrieve": lambda rng: (
+            "GET",
+            "/api/product/%d/" % rng.choice(catalog.product_ids),
+            {},
+            None,
+        ),
+        "brand.list": lambda rng: ("GET", "/api/brand/", {"limit": 50}, None),
+        "brand.retrieve": lambda rng: (
+            "GET",
+            "/api/brand/%d/" % rng.choice(catalog.brands)[0],
+            {},
+            None,
+        ),
+        "category.list": lambda rng: ("GET", "/api/category/", {"limit": 50}, None),
+        "category.tree": lambda rng: ("GET", "/api/category/tree/", {}, None),
+        "category.retrieve": lambda rng: (
+            "GET",
+            "/api/category/%d/" % rng.choice(catalog.categories)[0],
+            {},
+            None,
+        ),
+        "product.create": lambda rng: ("POST", "/api/product/", {}, product_payload(rng)),
+        "product.update": lambda rng: (
+            "PUT",
+            "/api/product/%d/" % rng.choice(catalog.product_ids),
+            {},
+            product_payload(rng),
+        ),
+        "brand.create": lambda rng: (
+            "POST",
+            "/api/brand/",
+            {},
+            {"names": catalog.unique("Load brand")},
+        ),
+        "brand.update": lambda rng: (
+            "PUT",
+            "/api/brand/%d/" % rng.choice(catalog.brands)[0],
+            {},
+            {"names": catalog.unique("Load brand")},
+        ),
+        "category.create": lambda rng: (
+            "POST",
+            "/api/category/",
+            {},
+            {"names": catalog.unique("Load category")},
+        ),
+    }
+
+
+class InProcessTarget:
+    """
+    Send requests through Django's WSGI handler in this process
+    """
+
+    def __init__(self):
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.core.signals import got_request_exception
+
+        self.handler = WSGIHandler()
+        self.local = threading.local()
+        got_request_exception.connect(self.record_exception)
+        # 500s are counted, not logged with their traceback
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+
+    def record_exception(self, sender, request=None, **kwargs):
+        self.local.exception = sys.exc_info()[1]
+
+    def request(self, method, path, query, body):
+        self.local.exception = None
+        payload = json.dumps(body).encode() if body is not None else b""
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "QUERY_STRING": urlencode(query),
+            "SERVER_NAME": "testserver",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": "127.0.0.1",
+            "HTTP_HOST": "testserver",
+            "HTTP_ACCEPT": "application/json",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(payload)),
+            "wsgi.input": io.BytesIO(payload),
+            "wsgi.errors": sys.stderr,
+            "wsgi.url_scheme": "http",
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            "wsgi.version": (1, 0),
+        }
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+
+        response = self.handler(environ, start_response)
+        try:
+            content = b"".join(response)
+        finally:
+            # fires request_finished, which closes the database connection
+            response.close()
+        exception = self.local.exception
+        return started["status"], content, exception is not None and LOCKED in str(
+            exception
+        ).encode()
+
+    def get_json(self, path, query):
+        status, content, _ = self.request("GET", path, query, None)
+        if status != 200:
+            raise SystemExit("GET %s returned %d" % (path, status))
+        return json.loads(content)
+
+
+class HTTPTarget:
+    """
+    Send requests to a running server, one keep-alive connection per thread. Locked
+    errors are recognized in the error page, so run the server with DEBUG on.
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return self.local.connection
+
+    def request(self, method, path, query, body):
+        url = self.prefix + path + ("?" + urlencode(query) if query else "")
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Accept": "application/json", "Content-Type": "application/json"}
+        try:
+            connection = self.connection()
+            connection.request(method, url, payload, headers)
+            response = connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self.local.connection = None
+            return None, b"", False
+        return response.status, content, response.status >= 500 and LOCKED in content
+
+    def get_json(self, path, query):
+        status, content, _ = self.request("GET", path, query, None)
+        if status != 200:
+            raise SystemExit("GET %s returned %s" % (path, status))
+        return json.loads(content)
+
+
+class Recorder:
+    """
+    Samples of every request as (seconds since start, operation, ms, status, locked)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+        self.start = time.perf_counter()
+
+    def add(self, operation, started, status, locked):
+        now = time.perf_counter()
+        with self.lock:
+            self.samples.append(
+                (started - self.start, operation, (now - started) * 1000, status, locked)
+            )
+
+    def since(self, index):
+        with self.lock:
+            return self.samples[index:], len(self.samples)
+
+
+def window_stats(samples, seconds):
+    errors = sum(1 for sample in samples if sample[3] is None or sample[3] >= 400)
+    return {
+        "requests": len(samples),
+        "requests_per_second": round(len(samples) / seconds, 1) if seconds else None,
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0,
+        "locked": sum(1 for sample in samples if sample[4]),
+        **summarize([sample[2] for sample in samples]),
+    }
+
+
+def windows(samples, interval):
+    """
+    Split the samples in ``interval`` seconds windows, by request start
+    """
+    grouped = defaultdict(list)
+    for sample in samples:
+        grouped[int(sample[0] // interval)].append(sample)
+    return [
+        {"start_s": round(index * interval, 3), **window_stats(grouped[index], interval)}
+        for index in range(max(grouped) + 1 if grouped else 0)
+    ]
+
+
+def worker(target, mix, ops, recorder, deadline, seed):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, query, body = ops[name](rng)
+        started = time.perf_counter()
+        status, _, locked = target.request(method, path, query, body)
+        recorder.add(name, started, status, locked)
+
+
+def report(line):
+    print(
+        "%7.1fs %8.1f req/s p50 %8.2fms p95 %8.2fms p99 %8.2fms %5d errors %5d locked"
+        % (
+            line["start_s"],
+            line["requests_per_second"],
+            line.get("p50_ms") or 0,
+            line.get("p95_ms") or 0,
+            line.get("p99_ms") or 0,
+            line["errors"],
+            line["locked"],
+        ),
+        file=sys.stderr,
+    )
+
+
+def load(target, mix, concurrency, duration, interval, seed=0):
+    """
+    Run the load and return the recorder, printing a line per window meanwhile
+    """
+    ops = operations(Catalog.discover(target))
+    recorder = Recorder()
+    deadline = recorder.start + duration
+    threads = [
+        threading.Thread(
+            target=worker, args=(target, mix, ops, recorder, deadline, seed + index)
+        )
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    index, tick = 0, 0
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(max(0, recorder.start + (tick + 1) * interval - time.perf_counter()))
+        tick += 1
+        samples, index = recorder.since(index)
+        report({"start_s": (tick - 1) * interval, **window_stats(samples, interval)})
+    for thread in threads:
+        thread.join()
+    return recorder
+
+
+def summary(samples, duration, interval):
+    per_operation = defaultdict(list)
+    for sample in samples:
+        per_operation[sample[1]].append(sample)
+    return {
+        "total": window_stats(samples, duration),
+        "operations": {
+            name: window_stats(rows, duration) for name, rows in sorted(per_operation.items())
+        },
+        "windows": windows(samples, interval),
+    }
+
+
+def run(args):
+    mix = dict(args.mix) if args.mix else DEFAULT_MIX
+    if args.url:
+        recorder = load(
+            HTTPTarget(args.url), mix, args.concurrency, args.duration, args.interval, args.seed
+        )
+    else:
+        from django.conf import settings
+        from django.db import connection
+
+        from DRF_E_commerce.benchmarks.seed import seed_catalog
+
+        if not args.with_cache:
+            settings.RESPONSE_CACHE = {
+                **getattr(settings, "RESPONSE_CACHE", {}),
+                "ENABLED": False,
+            }
+        # threads need a database file they can all open, not an in-memory database
+        directory = None if args.database else tempfile.mkdtemp(prefix="load-")
+        database = args.database or os.path.join(directory, "load.sqlite3")
+        settings.DATABASES["default"].setdefault("OPTIONS", {})["timeout"] = args.sqlite_timeout
+        try:
+            with benchmark_database(database):
+                seed_catalog(args.size, brands=args.brands, categories=args.categories)
+                # the workers open their own connections
+                connection.close()
+                print("seeded %d products" % args.size, file=sys.stderr)
+                recorder = load(
+                    InProcessTarget(),
+                    mix,
+                    args.concurrency,
+                    args.duration,
+                    args.interval,
+                    args.seed,
+                )
+        finally:
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    results = summary(recorder.samples, args.duration, args.interval)
+    total = results["total"]
+    print(
+        "%d requests, %.1f req/s, p50 %.2fms p99 %.2fms, %.2f%% errors, %d locked"
+        % (
+            total["requests"],
+            total["requests_per_second"],
+            total.get("p50_ms") or 0,
+            total.get("p99_ms") or 0,
+            total["error_rate"] * 100,
+            total["locked"],
+        ),
+        file=sys.stderr,
+    )
+    write_json(
+        args.output,
+        {
+            "meta": metadata(
+                url=args.url,
+                size=None if args.url else args.size,
+                concurrency=args.concurrency,
+                duration=args.duration,
+                mix=mix,
+            ),
+            "results": results,
+        },
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="base URL of a running server, in process otherwise")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--interval", type=float, default=1, help="report window, seconds")
+    parser.add_argument(
+        "--mix",
+        nargs="*",
+        type=mix_item,
+        metavar="OPERATION=WEIGHT",
+        help="replaces the default mix",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=10000, help="seeded products")
+    parser.add_argument("--brands", type=int, default=100)
+    parser.add_argument("--categories", type=int, default=1000)
+    parser.add_argument("--with-cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--database", help="SQLite file to seed, a temporary one otherwise")
+    parser.add_argument(
+        "--sqlite-timeout", type=float, default=5, help="seconds a write waits for the lock"
+    )
+    parser.add_argument("--output", default="-", help="JSON results file, - for stdout")
+    args = parser.parse_args(argv)
+    if args.mix is not None and not any(weight for _, weight in args.mix):
+        parser.error("the mix needs a positive weight")
+
+    if not args.url:
+        setup_django()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Fast seeding of large catalogs for the benchmarks.
+
+Rows are built with the test factories (``build``, never ``create``) and written with
+``bulk_create``. The category tree gets its lft/rght/tree_id/level values computed
+here, so no mptt renumbering or rebuild happens while seeding.
+"""
+from collections import deque
+
+import factory
+from django.db.models import Max
+
+from DRF_E_commerce.product.models import Brand, Category, Product
+from DRF_E_commerce.tests.factories import BrandFactory, CategoryFactory, ProductFactory
+
+
+def seed_brands(count, batch_size=5000):
+    brands = BrandFactory.build_batch(count)
+    return Brand.objects.bulk_create(brands, batch_size=batch_size)
+
+
+def seed_categories(count, fanout=10, batch_size=5000):
+    """
+    Create a forest of ``count`` categories, ``fanout`` roots and ``fanout`` children
+    per node filled breadth first, and return the leaves
+    """
+    nodes = CategoryFactory.build_batch(count)
+    # zero padded names keep the sibling order of order_insertion_by = ["names"]
+    # the same as the creation order
+    for position, node in enumerate(nodes):
+        node.names = "Category_%07d" % position
+
+    children = {index: [] for index in range(count)}
+    roots = list(range(min(fanout, count)))
+    queue = deque(roots)
+    next_child = len(roots)
+    while queue and next_child < count:
+        parent = queue.popleft()
+        for _ in range(fanout):
+            if next_child >= count:
+                break
+            children[parent].append(next_child)
+            queue.append(next_child)
+            next_child += 1
+
+    last = Category.objects.aggregate(id=Max("id"), tree_id=Max("tree_id"))
+    first_id = (last["id"] or 0) + 1
+    first_tree = (last["tree_id"] or 0) + 1
+    for index, node in enumerate(nodes):
+        node.id = first_id + index
+
+    # iterative depth first walk numbering lft/rght
+    for tree_offset, root in enumerate(roots):
+        counter = 1
+        stack = [(root, 0, False)]
+        while stack:
+            index, level, visited = stack.pop()
+            node = nodes[index]
+            if visited:
+                node.rght = counter
+                counter += 1
+                continue
+            node.lft = counter
+            node.level = level
+            node.tree_id = first_tree + tree_offset
+            counter += 1
+            stack.append((index, level, True))
+            for child in reversed(children[index]):
+                nodes[child].parent_id = node.id
+                stack.append((child, level + 1, False))
+        nodes[root].parent_id = None
+
+    Category.objects.bulk_create(nodes, batch_size=batch_size)
+    return [nodes[index] for index in range(count) if not children[index]]
+
+
+def seed_products(count, brands, categories, batch_size=5000):
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        products = ProductFactory.build_batch(
+            size,
+            names=factory.Sequence(lambda n: "Product %d" % n),
+            brand=factory.Iterator(brands),
+            category=factory.Iterator(categories),
+        )
+        Product.objects.bulk_create(products, batch_size=batch_size)
+        created += size
+    return created
+
+
+def seed_catalog(products, brands=100, categories=1000, fanout=10, batch_size=5000):
+    """
+    Seed ``products`` products spread over ``brands`` brands and the leaves of a
+    ``categories`` node category tree
+    """
+    brand_objs = seed_brands(brands, batch_size)
+    leaves = seed_categories(categories, fanout, batch_size)
+    seed_products(products, brand_objs, leaves, batch_size)
@@ -0,0 +1,96 @@
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+def setup_django(settings_module="DRF_E_commerce.settings.local"):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+
+    django.setup()
+
+
+@contextlib.contextmanager
+def benchmark_database(name=None):
+    """
+    Run the block against a freshly migrated throwaway database, like the test runner
+    does, so benchmarks never touch the development data. ``name`` sets the database
+    file, SQLite otherwise uses an in-memory database.
+    """
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    if name:
+        settings.DATABASES["default"].setdefault("TEST", {})["NAME"] = name
+    # DEBUG would keep every query in memory and fill connection.queries_log
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(sorted_samples, fraction):
+    """
+    Nearest rank percentile of an already sorted list
+    """
+    if not sorted_samples:
+        return None
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples_ms):
+    samples = sorted(samples_ms)
+    if not samples:
+        return {}
+    return {
+        "samples": len(samples),
+        "mean_ms": round(sum(samples) / len(samples), 3),
+        "min_ms": round(samples[0], 3),
+        "p50_ms": round(percentile(samples, 0.50), 3),
+        "p90_ms": round(percentile(samples, 0.90), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "p99_ms": round(percentile(samples, 0.99), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(**extra):
+    import django
+
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "platform": platform.platform(),
+        "argv": sys.argv[1:],
+        **extra,
+    }
+
+
+def write_json(path, data):
+    if path == "-":
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    with open(path, "w") as output:
+        json.dump(data, output, indent=2)
+        output.write("\n")
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProductConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "DRF_E_commerce.product"
+
+    def ready(self):
+        from . import signals  # noqa: F401
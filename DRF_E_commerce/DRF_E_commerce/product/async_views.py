@@ -0,0 +1,149 @@
+"""
+Native async list and retrieve views for deployments behind ``asgi.py``.
+
+DRF viewsets are synchronous, under ASGI every call to them holds a worker thread for
+the whole request. These views query with Django's async ORM (``aget``, async
+iteration) and return the same payloads as the viewsets: same filters, same
+pagination, same serializers. They are mounted under ``/api/async/``, the sync
+viewsets under ``/api/`` stay the WSGI path.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+
+from .batch import fetch_batch, parse_ids
+from .breadcrumbs import breadcrumbs_requested, paths_for_products, paths_for_rows, with_category
+from .filters import filter_products
+from .models import Brand, Category, Product
+from .pagination import OptInLimitOffsetPagination, ProductCursorPagination
+from .renderers import FastJSONRenderer
+from .serializers import (
+    BrandSerializer,
+    CategorySerializer,
+    ProductListSerializer,
+    ProductSerializer,
+)
+from .sparse import project, selected_fields
+
+
+def _json(data, status=200):
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status, content_type="application/json"
+    )
+
+
+def read_view(view):
+    """
+    GET only (django.views.decorators.http supports async views from Django 5.0),
+    passes a DRF request for the paginators and turns validation errors into a 400
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != "GET":
+            return HttpResponseNotAllowed(["GET"])
+        try:
+            return await view(Request(request), *args, **kwargs)
+        except ValidationError as exc:
+            return _json(exc.detail, status=400)
+
+    return wrapper
+
+
+def _fields(request, serializer_class):
+    return selected_fields(request.query_params, list(serializer_class().fields))
+
+
+async def _list(request, queryset, serializer_class, pagination_class, fields=None, extra=None):
+    """
+    ``extra(items)`` may return more serializer arguments, like in
+    ``PaginatedViewSet.paginated_response``
+    """
+    paginator = pagination_class()
+    page = await paginator.apaginate_queryset(queryset, request)
+    if page is None:
+        page = [row async for row in queryset.aiterator()]
+        kwargs = await sync_to_async(extra)(page) if extra else {}
+        return _json(serializer_class(page, many=True, fields=fields, **kwargs).data)
+    kwargs = await sync_to_async(extra)(page) if extra else {}
+    data = serializer_class(page, many=True, fields=fields, **kwargs).data
+    return _json(paginator.get_paginated_response(data).data)
+
+
+async def _retrieve(request, queryset, pk, serializer_class, not_found, breadcrumbs=False):
+    fields = _fields(request, serializer_class)
+    queryset = project(queryset, with_category(fields) if breadcrumbs else fields)
+    try:
+        instance = await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        return _json({"error": not_found}, status=400)
+    context = {}
+    if breadcrumbs:
+        context["category_paths"] = await sync_to_async(paths_for_products)([instance])
+    return _json(serializer_class(instance, fields=fields, context=context).data)
+
+
+def _product_queryset():
+    # everything the serializer reads has to be joined in, lazy loading is sync only
+    return Product.objects.select_related("brand", "category")
+
+
+@read_view
+async def product_list(request):
+    fields = _fields(request, ProductSerializer)
+    breadcrumbs = breadcrumbs_requested(request.query_params)
+    queryset = filter_products(_product_queryset(), request.query_params)
+    if "ids" in request.query_params:
+        ids = parse_ids(request.query_params["ids"])
+        return _json(await sync_to_async(fetch_batch)(queryset, ids, fields, breadcrumbs))
+    return await _list(
+        request,
+        ProductListSerializer.values(queryset, fields, breadcrumbs),
+        ProductListSerializer,
+        ProductCursorPagination,
+        fields,
+        extra=(lambda rows: {"category_paths": paths_for_rows(rows)}) if breadcrumbs else None,
+    )
+
+
+@read_view
+async def product_detail(request, pk):
+    return await _retrieve(
+        request,
+        _product_queryset(),
+        pk,
+        ProductSerializer,
+        "Product not found",
+        breadcrumbs=breadcrumbs_requested(request.query_params),
+    )
+
+
+@read_view
+async def brand_list(request):
+    fields = _fields(request, BrandSerializer)
+    queryset = project(Brand.objects.order_by("id"), fields)
+    return await _list(request, queryset, BrandSerializer, OptInLimitOffsetPagination, fields)
+
+
+@read_view
+async def brand_detail(request, pk):
+    return await _retrieve(request, Brand.objects.all(), pk, BrandSerializer, "Brand not found")
+
+
+@read_view
+async def category_list(request):
+    fields = _fields(request, CategorySerializer)
+    queryset = project(Category.objects.order_by("id"), fields)
+    return await _list(
+        request, queryset, CategorySerializer, OptInLimitOffsetPagination, fields
+    )
+
+
+@read_view
+async def category_detail(request, pk):
+    return await _retrieve(
+        request, Category.objects.all(), pk, CategorySerializer, "Category not found"
+    )
@@ -0,0 +1,158 @@
+"""
+Query plan audit of the catalog API.
+
+``canonical_queries()`` lists the queries the endpoints run, built with the same
+querysets, filters and aggregates as the views. ``explain_query()`` runs one,
+captures its SQL and returns the ``EXPLAIN`` output of every statement, and
+``full_scans()`` finds the tables a plan reads in full. The ``explain_queries``
+command puts them together so a missing index shows up before it reaches production.
+"""
+import datetime
+import re
+from collections import namedtuple
+
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .conditional import _table_state
+from .filters import filter_products
+from .models import Brand, Category, Product
+from .serializers import ProductListSerializer
+from .sync import STREAMS, stream_rows
+
+PAGE = 51  # the cursor paginator reads one row past the page
+
+CanonicalQuery = namedtuple(
+    "CanonicalQuery", ["name", "run", "allow_scan", "allow_index_scan"], defaults=[False]
+)
+
+# SQLite: "SCAN product_product", or "SCAN t USING [COVERING] INDEX i" walking a whole
+# index. A lookup or a range reads "SEARCH t USING ...".
+SQLITE_SCAN_RE = re.compile(
+    r"\bSCAN (?:TABLE )?(\w+)(?! USING INTEGER PRIMARY KEY)( USING (?:COVERING )?INDEX)?"
+)
+POSTGRES_SCAN_RE = re.compile(r"\bSeq Scan on (\w+)")
+
+
+def canonical_queries(using=DEFAULT_DB_ALIAS):
+    """
+    The queries behind the API as callables that run them on the ``using`` database.
+    ``allow_scan`` marks the ones that read a whole table by design: pages walked in
+    primary key order that stop after ``PAGE`` rows, the full category tree and the
+    export. ``allow_index_scan`` the ones walking an index that only holds their rows
+    (a partial index) or stop after ``PAGE`` rows.
+    """
+    products = Product.objects.using(using).select_related("brand", "category")
+    brands = Brand.objects.using(using)
+    categories = Category.objects.using(using)
+
+    def rows(queryset):
+        return lambda: list(queryset)
+
+    def product_page(**params):
+        queryset = filter_products(products, params)
+        return rows(ProductListSerializer.values(queryset).order_by("id")[:PAGE])
+
+    def validators(model):
+        # ETag/Last-Modified state of the list endpoints
+        return lambda: _table_state(model, using)
+
+    def sync_stream(model, field, columns):
+        # a page of the sync feed after a position
+        position = (timezone.now() - datetime.timedelta(hours=1), 1)
+        return rows(
+            stream_rows(model.objects.using(using), field, columns, position, timezone.now(), PAGE)
+        )
+
+    return [
+        CanonicalQuery("product.list", product_page(), True),
+        CanonicalQuery("product.list_by_brand", product_page(brand="1"), False),
+        CanonicalQuery("product.list_by_brand_name", product_page(brand="x"), False),
+        CanonicalQuery(
+            "product.list_by_brand_category", product_page(brand="1", category="1"), False
+        ),
+        CanonicalQuery(
+            "product.list_by_category_tree",
+            product_page(category="1", include_descendants="true"),
+            False,
+        ),
+        CanonicalQuery("product.list_digital", product_page(is_digital="true"), False, True),
+        CanonicalQuery("product.list_physical", product_page(is_digital="false"), False, True),
+        CanonicalQuery("product.list_validators", validators(Product), False),
+        CanonicalQuery("product.by_names", rows(products.filter(names="x")), False),
+        CanonicalQuery(
+            "product.order_by_names", rows(products.order_by("names")[:PAGE]), False, True
+        ),
+        CanonicalQuery("product.retrieve", rows(products.filter(pk=1)), False),
+        CanonicalQuery(
+            "product.retrieve_validators",
+            rows(
+                products.filter(pk=1).values_list(
+                    "updated_at", "brand__updated_at", "category__updated_at"
+                )
+            ),
+            False,
+        ),
+        CanonicalQuery("brand.list_validators", validators(Brand), False),
+        CanonicalQuery("brand.retrieve", rows(brands.filter(pk=1)), False),
+        CanonicalQuery("brand.by_names", rows(brands.filter(names="x")), False),
+        CanonicalQuery("category.list_validators", validators(Category), False),
+        CanonicalQuery("category.by_names", rows(categories.filter(names="x")), False),
+        CanonicalQuery("category.tree", rows(categories.order_by("tree_id", "lft")), True),
+        CanonicalQuery(
+            "category.subtree",
+            rows(categories.filter(tree_id=1, lft__gte=1, rght__lte=10).order_by("lft")),
+            False,
+        ),
+        CanonicalQuery(
+            "export",
+            rows(
+                products.order_by("id").values_list(
+                    "id", "names", "description", "is_digital", "brand__names", "category__names"
+                )
+            ),
+            True,
+        ),
+        *(
+            CanonicalQuery("sync.%s" % name, sync_stream(model, field, columns), False)
+            for name, model, field, columns in STREAMS
+        ),
+    ]
+
+
+def explain_query(query, using=connection):
+    """
+    Run ``query`` and return ``[(sql, plan)]`` for every statement it executed
+    """
+    with CaptureQueriesContext(using) as captured:
+        query.run()
+    prefix = using.ops.explain_query_prefix()
+    plans = []
+    with using.cursor() as cursor:
+        for statement in captured.captured_queries:
+            cursor.execute("%s %s" % (prefix, statement["sql"]))
+            plans.append((statement["sql"], format_plan(cursor.fetchall(), using.vendor)))
+    return plans
+
+
+def format_plan(rows, vendor):
+    if vendor == "sqlite":
+        # (id, parent, notused, detail)
+        return "\n".join(row[-1] for row in rows)
+    return "\n".join(" ".join(str(column) for column in row) for row in rows)
+
+
+def full_scans(plan, vendor, index_scans=True):
+    """
+    Names of the tables ``plan`` reads in full, through one of their indexes too
+    unless ``index_scans`` is false
+    """
+    pattern = POSTGRES_SCAN_RE if vendor == "postgresql" else SQLITE_SCAN_RE
+    return sorted(
+        {
+            match.group(1)
+            for match in pattern.finditer(plan)
+            if index_scans or match.lastindex == 1
+        }
+    )
@@ -0,0 +1,278 @@
+"""
+In memory prefix index of the product, brand and category names for autocomplete.
+
+The index is one sorted Python list of strings, one per name:
+``"<folded name>\\x00<type><id>\\x00<name>"``, the folded name being case and accent
+insensitive. The names starting with a prefix are a contiguous slice found with two
+bisections, ranked shortest name first, then brands, categories and products.
+Slices longer than ``SCAN_LIMIT`` entries (one or two letter prefixes) are ranked
+once and memoized until a name under that prefix changes.
+
+Memory: a list slot and a str object per name, plus an id map entry used for
+updates. Measured at 176 bytes per name of 18 ASCII characters, so 176 MB per
+million names, and 2 bytes more per character (the name is kept folded and as is),
+2 to 4 times that for characters outside Latin-1. ``MAX_ENTRIES`` bounds it: brands
+and categories are always indexed, products up to the limit, the most recently
+updated first. Lookups take 0.1 to 0.5 ms at a million names, an update about 2 ms
+(the list insert moves the tail).
+
+The index is built on the first request of a worker and kept up to date by the
+save and delete signals once the transaction commits. Bulk writes send no signals,
+they mark the index stale and it is rebuilt in the background, as it is after
+``MAX_AGE_SECONDS`` to pick up the writes of other processes.
+"""
+import heapq
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTOCOMPLETE = {
+    "MAX_ENTRIES": 1_000_000,
+    "MAX_AGE_SECONDS": 600,
+    "MAX_RESULTS": 50,
+    # prefixes matching more names than this are ranked once and memoized
+    "SCAN_LIMIT": 200,
+    "MEMO_SIZE": 1024,
+}
+
+KINDS = {"b": "brand", "c": "category", "p": "product"}
+CODES = {kind: code for code, kind in KINDS.items()}
+# brands, then categories, then products for names of the same length
+KIND_ORDER = {"b": 0, "c": 1, "p": 2}
+END = chr(0x10FFFF)
+
+
+def autocomplete_settings():
+    return {**DEFAULT_AUTOCOMPLETE, **getattr(settings, "AUTOCOMPLETE", {})}
+
+
+def fold(name):
+    """
+    Case and accent insensitive form of a name
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def _entry(kind, pk, name):
+    return "%s\x00%s%d\x00%s" % (fold(name).replace("\x00", ""), CODES[kind], pk, name)
+
+
+def _key(code, pk):
+    # an int rather than a (code, pk) tuple, 60 bytes less per name
+    return pk << 2 | KIND_ORDER[code]
+
+
+def _rank(entry):
+    end = entry.index("\x00")
+    return end, KIND_ORDER[entry[end + 1]], entry
+
+
+def _suggestion(entry):
+    _, key, name = entry.split("\x00", 2)
+    return {"type": KINDS[key[0]], "id": int(key[1:]), "names": name}
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._entries = None
+            # _key(kind code, id) -> entry, to find the old entry on rename and delete
+            self._by_key = {}
+            self._memo = OrderedDict()
+            self._pending = None
+            self._built_at = None
+            self._stale = False
+            self._full = False
+            # a background rebuild is claimed, see ensure_built
+            self._rebuilding = False
+
+    @property
+    def built(self):
+        return self._entries is not None
+
+    # building
+
+    def _load(self):
+        from .models import Brand, Category, Product
+
+        limit = autocomplete_settings()["MAX_ENTRIES"]
+        sources = [
+            ("brand", Brand.objects.all()),
+            ("category", Category.objects.all()),
+            ("product", Product.objects.order_by("-updated_at")),
+        ]
+        entries, by_key = [], {}
+        for kind, queryset in sources:
+            for pk, name in queryset.values_list("id", "names").iterator(chunk_size=10000):
+                if kind == "product" and len(entries) >= limit:
+                    logger.warning("autocomplete index is full, %d names", limit)
+                    break
+                entry = _entry(kind, pk, name)
+                entries.append(entry)
+                by_key[_key(CODES[kind], pk)] = entry
+        entries.sort()
+        return entries, by_key
+
+    def build(self, if_missing=False):
+        """
+        (Re)build the index from the database. Writes committed meanwhile are queued
+        and applied on top, the old index keeps serving until the swap.
+        """
+        with self._build_lock:
+            if if_missing and self.built:
+                # built by a concurrent request while this one waited
+                return
+            with self._lock:
+                self._pending = []
+                # a bulk write marking the index stale from here on needs another build
+                self._stale = False
+            try:
+                entries, by_key = self._load()
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                pending, self._pending = self._pending, None
+                self._entries, self._by_key = entries, by_key
+                self._memo.clear()
+                self._built_at = time.monotonic()
+                self._full = len(entries) >= autocomplete_settings()["MAX_ENTRIES"]
+                for operation in pending:
+                    operation()
+
+    def ensure_built(self):
+        if not self.built:
+            self.build(if_missing=True)
+            return
+        max_age = autocomplete_settings()["MAX_AGE_SECONDS"]
+        with self._lock:
+            expired = max_age is not None and time.monotonic() - self._built_at > max_age
+            # claimed under the lock, concurrent requests start a single rebuild
+            if not (self._stale or expired) or self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("autocomplete index rebuild failed")
+        finally:
+            with self._lock:
+                self._rebuilding = False
+            connection.close()
+
+    def mark_stale(self):
+        # the next request rebuilds in the background
+        self._stale = True
+
+    # updates, called once the write is committed
+
+    def upsert(self, kind, pk, name):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(lambda: self._upsert(kind, pk, name))
+            if self._entries is not None:
+                self._upsert(kind, pk, name)
+
+    def delete(self, kind, pk):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(lambda: self._delete(kind, pk))
+            if self._entries is not None:
+                self._delete(kind, pk)
+
+    def _upsert(self, kind, pk, name):
+        entry = _entry(kind, pk, name)
+        old = self._by_key.get(_key(CODES[kind], pk))
+        if old == entry:
+            return
+        if old is not None:
+            self._remove(old)
+        elif len(self._entries) >= autocomplete_settings()["MAX_ENTRIES"]:
+            self._full = True
+            return
+        insort(self._entries, entry)
+        self._by_key[_key(CODES[kind], pk)] = entry
+        self._forget(entry)
+
+    def _delete(self, kind, pk):
+        old = self._by_key.pop(_key(CODES[kind], pk), None)
+        if old is not None:
+            self._remove(old)
+
+    def _remove(self, entry):
+        index = bisect_left(self._entries, entry)
+        if index < len(self._entries) and self._entries[index] == entry:
+            del self._entries[index]
+        self._forget(entry)
+
+    def _forget(self, entry):
+        # drop the memoized rankings of every prefix of the name
+        folded = entry[: entry.index("\x00")]
+        for end in range(1, len(folded) + 1):
+            self._memo.pop(folded[:end], None)
+
+    # lookups
+
+    def suggest(self, prefix, limit=10, kinds=None):
+        """
+        Return the ``limit`` best ``{"type", "id", "names"}`` whose name starts with
+        ``prefix``, optionally only of the ``kinds`` types
+        """
+        self.ensure_built()
+        options = autocomplete_settings()
+        folded = fold(prefix).replace("\x00", "")
+        if not folded:
+            return []
+        codes = frozenset(CODES[kind] for kind in kinds) if kinds else None
+        with self._lock:
+            low = bisect_left(self._entries, folded)
+            high = bisect_left(self._entries, folded + END, low)
+            if high - low <= options["SCAN_LIMIT"]:
+                best = self._best(low, high, codes, limit)
+            else:
+                memo = self._memo.setdefault(folded, {})
+                self._memo.move_to_end(folded)
+                if codes not in memo:
+                    memo[codes] = self._best(low, high, codes, options["MAX_RESULTS"])
+                while len(self._memo) > options["MEMO_SIZE"]:
+                    self._memo.popitem(last=False)
+                best = memo[codes][:limit]
+        return [_suggestion(entry) for entry in best]
+
+    def _best(self, low, high, codes, limit):
+        candidates = self._entries[low:high]
+        if codes is not None:
+            candidates = [
+                entry for entry in candidates if entry[entry.index("\x00") + 1] in codes
+            ]
+        return heapq.nsmallest(limit, candidates, key=_rank)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "built": self.built,
+                "entries": len(self._entries or ()),
+                "full": self._full,
+                "memoized_prefixes": len(self._memo),
+            }
+
+
+autocomplete_index = PrefixIndex()
@@ -0,0 +1,53 @@
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+from .breadcrumbs import paths_for_rows
+from .serializers import ProductListSerializer
+
+
+def batch_max_ids():
+    return getattr(settings, "BATCH_MAX_IDS", 200)
+
+
+def parse_ids(value):
+    """
+    Parse ``"1,2,3"`` (query string) or ``[1, 2, 3]`` (JSON body) into a list of ids
+    without duplicates, in the order given
+    """
+    if isinstance(value, str):
+        value = [part.strip() for part in value.split(",") if part.strip()]
+    if not isinstance(value, list):
+        raise ValidationError({"ids": ["Expected a list of ids."]})
+    ids = []
+    for item in value:
+        if isinstance(item, int) and not isinstance(item, bool) and item > 0:
+            ids.append(item)
+        elif isinstance(item, str) and item.isdigit():
+            ids.append(int(item))
+        else:
+            raise ValidationError({"ids": ["%r is not a valid id." % (item,)]})
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValidationError({"ids": ["At least one id is required."]})
+    if len(ids) > batch_max_ids():
+        raise ValidationError({"ids": ["A batch can hold at most %d ids." % batch_max_ids()]})
+    return ids
+
+
+def fetch_batch(queryset, ids, fields=None, breadcrumbs=False):
+    """
+    Return the products of ``ids`` in that order with one joined query, rendered like
+    the product list, and the ids that matched nothing
+    """
+    rows = {
+        row["id"]: row
+        for row in ProductListSerializer.values(
+            queryset.filter(pk__in=ids).order_by(), fields, breadcrumbs
+        )
+    }
+    found = [rows[pk] for pk in ids if pk in rows]
+    paths = paths_for_rows(found) if breadcrumbs else None
+    return {
+        "results": ProductListSerializer(found, fields=fields, category_paths=paths).data,
+        "missing": [pk for pk in ids if pk not in rows],
+    }
@@ -0,0 +1,156 @@
+"""
+Category paths ("Electronics > Audio > Headphones") of products, for ?breadcrumbs=true.
+
+The ancestors of a category are the nodes of its tree whose lft/rght interval holds
+its own, so the paths of every category of a page come from one query on the
+(tree_id, lft) index, whatever the depth. Paths are memoized per category in the
+cache under the Category version counter: renaming or moving a category bumps it
+(see ``signals.py``), a warm page costs no query at all.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .cache import cache_settings, get_cache, get_versions
+from .deferred_tree import live_positions
+from .filters import parse_bool
+from .models import Category, Product
+from .routers import read_source
+
+# ancestor conditions per query, SQLite limits the depth of an expression tree
+MAX_TERMS = 200
+
+# the row columns ProductListSerializer.values() adds for the paths
+TREE_COLUMNS = ["category_id", "category__tree_id", "category__lft", "category__rght"]
+
+
+def breadcrumbs_requested(params):
+    value = params.get("breadcrumbs")
+    if value is None or value == "":
+        return False
+    parsed = parse_bool(value)
+    if parsed is None:
+        raise ValidationError({"breadcrumbs": ["Must be true or false."]})
+    return parsed
+
+
+def with_category(fields):
+    """
+    The sparse fieldset to query for breadcrumbs, the category is needed even when
+    not rendered
+    """
+    if fields is None or "category" in fields:
+        return fields
+    return [*fields, "category"]
+
+
+def _ancestor_paths(nodes):
+    positions = set(nodes.values())
+    terms = [Q(tree_id=tree_id, lft__lte=lft, rght__gte=rght) for tree_id, lft, rght in positions]
+    trees = {}
+    for start in range(0, len(terms), MAX_TERMS):
+        ancestors = (
+            Category.objects.filter(reduce(or_, terms[start : start + MAX_TERMS]))
+            .order_by("tree_id", "lft")
+            .values_list("id", "names", "tree_id", "lft", "rght")
+        )
+        for row in ancestors:
+            trees.setdefault(row[2], {})[row[0]] = row
+    paths = {}
+    for pk, (tree_id, lft, rght) in nodes.items():
+        rows = sorted(
+            (row for row in trees.get(tree_id, {}).values() if row[3] <= lft and row[4] >= rght),
+            key=lambda row: row[3],
+        )
+        paths[pk] = [{"id": row[0], "names": row[1]} for row in rows]
+    return paths
+
+
+def _linked_paths(nodes, positions):
+    # deferred tree writes are pending, walk up the parent links of live_positions()
+    ancestors = {}
+    for pk in nodes:
+        path, node = [], pk
+        while node is not None:
+            path.append(node)
+            node = positions[node][4]
+        ancestors[pk] = path[::-1]
+    ids = {node for path in ancestors.values() for node in path}
+    names = dict(Category.objects.filter(pk__in=ids).values_list("id", "names"))
+    return {
+        pk: [{"id": node, "names": names[node]} for node in path]
+        for pk, path in ancestors.items()
+    }
+
+
+def category_paths(nodes):
+    """
+    Return ``{category id: [{"id", "names"}, ...]}``, root first and ending with the
+    category, for ``nodes`` mapping category ids to their (tree_id, lft, rght)
+    """
+    if not nodes:
+        return {}
+    use_cache = cache_settings()["ENABLED"]
+    if use_cache:
+        cache = get_cache()
+        version = get_versions(Category)[0]
+        source = read_source()
+        keys = {pk: "catalog:category_path:%s:%s:%d" % (version, source, pk) for pk in nodes}
+        cached = cache.get_many(list(keys.values()))
+        paths = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    else:
+        paths = {}
+    missing = {pk: position for pk, position in nodes.items() if pk not in paths}
+    if missing:
+        positions = live_positions()
+        if positions is None:
+            computed = _ancestor_paths(missing)
+        else:
+            computed = _linked_paths(missing, positions)
+        paths.update(computed)
+        if use_cache:
+            cache.set_many(
+                {keys[pk]: path for pk, path in computed.items()}, cache_settings()["TIMEOUT"]
+            )
+    return paths
+
+
+def paths_for_rows(rows):
+    """
+    ``{category id: path}`` for rows of ``ProductListSerializer.values(..., breadcrumbs=True)``
+    """
+    return category_paths(
+        {
+            row["category_id"]: (
+                row["category__tree_id"],
+                row["category__lft"],
+                row["category__rght"],
+            )
+            for row in rows
+            if row["category_id"] is not None
+        }
+    )
+
+
+def paths_for_products(products):
+    """
+    ``{category id: path}`` for product instances, their categories are read with one
+    query unless they were joined in
+    """
+    nodes, unloaded = {}, set()
+    for product in products:
+        if product.category_id is None:
+            continue
+        if Product.category.is_cached(product):
+            category = product.category
+            nodes[category.pk] = (category.tree_id, category.lft, category.rght)
+        else:
+            unloaded.add(product.category_id)
+    if unloaded:
+        rows = Category.objects.filter(pk__in=unloaded).values_list(
+            "id", "tree_id", "lft", "rght"
+        )
+        nodes.update((pk, (tree_id, lft, rght)) for pk, tree_id, lft, rght in rows)
+    return category_paths(nodes)
@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .autocomplete import autocomplete_index
+from .cache import bump_version
+from .deferred_tree import PLACEHOLDER, journal_categories
+from .models import Brand, Category, Product
+from .serializers import ProductSerializer
+
+BULK_BATCH_SIZE = getattr(settings, "BULK_BATCH_SIZE", 500)
+
+# the product columns written by a bulk upsert
+UPSERT_FIELDS = ["names", "description", "is_digital", "brand", "category", "updated_at"]
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _fetch_by_names(model, names, batch_size):
+    found = {}
+    for batch in chunked(list(names), batch_size):
+        for obj in model.objects.filter(names__in=batch):
+            found[obj.names] = obj
+    return found
+
+
+def resolve_brands(names, batch_size=BULK_BATCH_SIZE):
+    """
+    Return ``{name: Brand}`` for every name, creating the missing brands with bulk_create
+    """
+    names = set(names)
+    brands = _fetch_by_names(Brand, names, batch_size)
+    missing = sorted(names - brands.keys())
+    if missing:
+        # ignore_conflicts tolerates a concurrent writer creating the same brand
+        Brand.objects.bulk_create(
+            [Brand(names=name) for name in missing], batch_size=batch_size, ignore_conflicts=True
+        )
+        brands.update(_fetch_by_names(Brand, missing, batch_size))
+    return brands
+
+
+def resolve_categories(names, batch_size=BULK_BATCH_SIZE):
+    """
+    Return ``{name: Category}`` for every name, creating the missing categories as root nodes.
+
+    Like ``get_or_create`` in the single item endpoints new categories have no parent.
+    They are inserted with placeholder tree fields and journaled, the tree worker
+    renumbers the table once for all of them after the request (see
+    ``deferred_tree.py``): tree ids picked here from ``Max("tree_id")`` would collide
+    with those of a concurrent request, renumbering in the request would lock every
+    row it moves until the commit.
+    """
+    names = set(names)
+    categories = _fetch_by_names(Category, names, batch_size)
+    missing = sorted(names - categories.keys())
+    if missing:
+        new_nodes = [Category(names=name, parent=None, **PLACEHOLDER) for name in missing]
+        Category.objects.bulk_create(new_nodes, batch_size=batch_size, ignore_conflicts=True)
+        created = _fetch_by_names(Category, missing, batch_size)
+        journal_categories(created.values())
+        categories.update(created)
+    return categories
+
+
+def bulk_upsert_products(items, batch_size=BULK_BATCH_SIZE):
+    """
+    Validate and write a list of product payloads.
+
+    Items with an ``id`` update that product, the others are created. Each item is
+    validated by ``ProductSerializer`` exactly like the single item endpoints, but the
+    brand and category names of the whole request are resolved up front so validation
+    runs no queries. Returns one result dict per item, in request order.
+    """
+    results = [None] * len(items)
+    wanted_brands, wanted_categories, wanted_ids = set(), set(), set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        if isinstance(item.get("brand"), str):
+            wanted_brands.add(item["brand"])
+        if isinstance(item.get("category"), str):
+            wanted_categories.add(item["category"])
+        if isinstance(item.get("id"), int):
+            wanted_ids.add(item["id"])
+
+    with transaction.atomic():
+        context = {
+            "brand_lookup": resolve_brands(wanted_brands, batch_size),
+            "category_lookup": resolve_categories(wanted_categories, batch_size),
+        }
+        existing = {}
+        for batch in chunked(list(wanted_ids), batch_size):
+            existing.update(Product.objects.in_bulk(batch))
+
+        to_create, to_update = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = _error(index, {"non_field_errors": ["Expected an object."]})
+                continue
+            instance = None
+            if item.get("id") is not None:
+                instance = existing.get(item["id"]) if isinstance(item["id"], int) else None
+                if instance is None:
+                    results[index] = _error(index, {"id": ["Product does not exists"]})
+                    continue
+            serializer = ProductSerializer(instance, data=item, context=context)
+            if not serializer.is_valid():
+                results[index] = _error(index, serializer.errors)
+                continue
+            if instance is None:
+                to_create.append((index, Product(**serializer.validated_data)))
+            else:
+                for field, value in serializer.validated_data.items():
+                    setattr(instance, field, value)
+                to_update.append((index, instance))
+
+        for batch in chunked(to_create, batch_size):
+            Product.objects.bulk_create([product for _, product in batch])
+        # bulk_update doesn't fill auto_now fields
+        now = timezone.now()
+        for _, product in to_update:
+            product.updated_at = now
+        for batch in chunked(to_update, batch_size):
+            Product.objects.bulk_update([product for _, product in batch], UPSERT_FIELDS)
+        # bulk queries send no model signals
+        bump_version(Brand, Category, Product)
+        transaction.on_commit(autocomplete_index.mark_stale)
+
+    for index, product in to_create:
+        results[index] = {"index": index, "status": "created", "id": product.id}
+    for index, product in to_update:
+        results[index] = {"index": index, "status": "updated", "id": product.id}
+    return results
+
+
+def _error(index, errors):
+    return {"index": index, "status": "error", "errors": errors}
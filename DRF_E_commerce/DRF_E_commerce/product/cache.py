@@ -0,0 +1,140 @@
+"""
+Versioned response cache for the catalog read endpoints.
+
+Every model has a version counter stored in the cache. Cached responses are keyed on
+the versions of the models they were built from, and saving or deleting a row bumps
+its model's version (see ``signals.py``), so a write makes every dependent key
+unreachable at once instead of deleting keys one by one.
+
+The counters live in the configured cache backend. The default local-memory backend
+is per process, so with several workers use a shared backend (Redis, Memcached,
+database) for the versions to be seen by all of them.
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .routers import read_source
+
+DEFAULT_RESPONSE_CACHE = {"ALIAS": "default", "TIMEOUT": 300, "ENABLED": True}
+
+
+def cache_settings():
+    return {**DEFAULT_RESPONSE_CACHE, **getattr(settings, "RESPONSE_CACHE", {})}
+
+
+def get_cache():
+    return caches[cache_settings()["ALIAS"]]
+
+
+def _version_key(model):
+    return "catalog:version:%s" % model._meta.label_lower
+
+
+def _initial_version():
+    # start from the clock rather than 1 so a counter that was evicted never
+    # comes back at a value that older cached responses were stored under
+    return time.time_ns()
+
+
+def get_versions(*models):
+    cache = get_cache()
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(models):
+    cache = get_cache()
+    for model in models:
+        key = _version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), timeout=None)
+
+
+def bump_version(*models):
+    """
+    Invalidate every cached response built from ``models``.
+
+    The version is bumped right away and again once the transaction commits, so a
+    response cached by a concurrent reader before the commit is never served.
+    """
+    _bump(models)
+    transaction.on_commit(functools.partial(_bump, models))
+
+
+class CacheStats:
+    """
+    In process hit and miss counters per cached endpoint
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    def record(self, scope, hit):
+        with self._lock:
+            self._counts[scope]["hits" if hit else "misses"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {scope: dict(counts) for scope, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+cache_stats = CacheStats()
+
+
+def cached_response(*models):
+    """
+    Cache the data of successful GET responses of a viewset method.
+
+    The key is made of the viewset and method, the current versions of ``models``, the
+    database the request reads from (see ``routers.read_source``) and the request URL
+    with its query string (pagination links contain the host).
+    """
+
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            options = cache_settings()
+            if not options["ENABLED"] or request.method != "GET":
+                return view_method(self, request, *args, **kwargs)
+
+            scope = "%s.%s" % (self.__class__.__name__, view_method.__name__)
+            versions = ".".join(str(version) for version in get_versions(*models))
+            url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+            key = "catalog:response:%s:%s:%s:%s" % (scope, versions, read_source(), url)
+
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                cache_stats.record(scope, hit=True)
+                return Response(data)
+
+            cache_stats.record(scope, hit=False)
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK and isinstance(response, Response):
+                cache.set(key, response.data, options["TIMEOUT"])
+            return response
+
+        return wrapper
+
+    return decorator
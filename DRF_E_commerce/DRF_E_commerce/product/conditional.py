@@ -0,0 +1,120 @@
+"""
+ETag / Last-Modified support for the catalog read endpoints.
+
+The validators come from change tracking rather than from the rendered body:
+
+- a list depends on the newest ``updated_at`` or deletion (``Tombstone``) of every
+  table it reads
+- a single object depends on its own ``updated_at`` and on those of its relations
+
+Both are memoized in the cache under the model version counters of ``cache.py``, so
+once computed they cost no query until the next write to one of the tables, or until
+``RESPONSE_CACHE["TIMEOUT"]``.
+"""
+import functools
+import hashlib
+
+from django.db.models import Max, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import cache_settings, get_cache, get_versions
+from .models import Tombstone
+from .routers import read_source
+
+
+def _table_state(model, using=None):
+    # the newest deletion counts as a modification too, in the same query. Two index edge
+    # lookups: Max() over the subquery would be a second aggregate and read the whole
+    # updated_at index, Coalesce() only gets aggregate() to accept the subquery
+    last_deleted = (
+        Tombstone.objects.using(using)
+        .filter(model=model._meta.model_name)
+        .order_by()
+        .values("model")
+        .annotate(last=Max("deleted_at"))
+        .values("last")
+    )
+    state = model.objects.using(using).aggregate(
+        last_modified=Max("updated_at"),
+        last_deleted=Coalesce(Subquery(last_deleted), Max("updated_at")),
+    )
+    timestamps = [state["last_modified"], state["last_deleted"]]
+    return max((t for t in timestamps if t is not None), default=None)
+
+
+def _object_state(model, pk, timestamp_fields):
+    row = model.objects.filter(pk=pk).values_list(*timestamp_fields).first()
+    if row is None:
+        return None
+    return list(row)
+
+
+def conditional_response(*models, timestamp_fields=None, depends_on=None):
+    """
+    Add ETag and Last-Modified headers to a viewset method and answer conditional
+    GETs with 304 Not Modified before the view (and its serializer) runs.
+
+    ``models`` are the tables the response is built from. For retrieve methods,
+    ``timestamp_fields`` lists the ``updated_at`` lookups of the object identified by
+    the ``pk`` url argument, e.g. ``("updated_at", "brand__updated_at")``.
+    ``depends_on(request)`` may return more models whose whole table the response
+    of that request depends on, the ancestors of ?breadcrumbs=true for instance.
+    """
+
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view_method(self, request, *args, **kwargs)
+
+            pk = kwargs.get("pk")
+            scope = "%s.%s" % (self.__class__.__name__, view_method.__name__)
+            versions = ".".join(str(version) for version in get_versions(*models))
+            tables = depends_on(request) if depends_on else []
+            depends = ",".join(model._meta.label_lower for model in tables)
+            key = "catalog:validators:%s:%s:%s:%s:%s" % (
+                scope,
+                versions,
+                read_source(),
+                pk or "",
+                depends,
+            )
+            cache = get_cache()
+            state = cache.get(key)
+            if state is None:
+                if timestamp_fields:
+                    state = _object_state(models[0], pk, timestamp_fields) or []
+                    if state:
+                        state += [_table_state(model) for model in tables]
+                else:
+                    state = [_table_state(model) for model in models]
+                # bounded like the response cache, a process that missed the version
+                # bump of another one (per process cache) doesn't answer 304 forever
+                cache.set(key, state, cache_settings()["TIMEOUT"])
+            if not state:
+                # unknown object, let the view produce its error response
+                return view_method(self, request, *args, **kwargs)
+
+            # a representation differs per url (query string) and per renderer
+            fingerprint = "|".join(
+                [request.build_absolute_uri(), request.accepted_media_type or "", repr(state)]
+            )
+            etag = '"%s"' % hashlib.sha1(fingerprint.encode()).hexdigest()
+            timestamps = [timestamp for timestamp in state if timestamp is not None]
+            last_modified = int(max(timestamps).timestamp()) if timestamps else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+            return response
+
+        return wrapper
+
+    return decorator
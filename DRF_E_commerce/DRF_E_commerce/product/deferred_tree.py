@@ -0,0 +1,288 @@
+"""
+Deferred category tree maintenance.
+
+With ``CATEGORY_TREE["DEFERRED"]`` a category write only saves its own row. The
+nested set fields (tree_id, lft, rght, level) aren't renumbered across the table:
+a new root or a rename shifts every later tree or sibling with
+``order_insertion_by``, which locks the table for the length of the request.
+Instead the write adds a ``CategoryJournal`` row in its transaction, and a worker
+renumbers the whole table from the parent links a moment later, so the writes of
+that window make one rebuild. The rebuild reads the table once, computes the nested
+set in Python and only updates the rows whose position changed.
+
+Until then the nested set fields are stale. The readers of the tree (subtree
+filters, the tree endpoint, facets, breadcrumbs) ask ``live_positions()``, which
+returns the positions computed from the parent links while writes are pending.
+That costs one query of the category table per version, memoized in the cache
+like the other catalog reads.
+
+Bulk inserts (``bulk.py``, ``importer.py``) journal their rows the same way in any
+mode, renumbering the whole table in the request would hold the write locks of
+every row that moved. Out of deferred mode they also set ``PENDING_KEY`` in the
+cache, so ``live_positions()`` covers their rows until the worker (or the import at
+its end) applies the journal, and costs no query otherwise.
+
+The worker is a thread of the web process (``WORKER: "thread"``), or
+``manage.py rebuild_category_tree --watch`` with ``WORKER: None``, in both modes. The
+``category_tree_*`` metrics are those of the process that rebuilds, the command
+prints the duration and counts of every run instead.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models.expressions import RawSQL
+
+from .cache import bump_version, cache_settings, get_cache, get_versions
+from .metrics import metrics
+from .models import Category, CategoryJournal, CategoryTreeLock
+from .routers import pin_primary, read_source
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY_TREE = {
+    "DEFERRED": False,
+    # "thread" or None when a `rebuild_category_tree --watch` process does it
+    "WORKER": "thread",
+    # the writes of this window after the first one are applied in one rebuild
+    "COALESCE_SECONDS": 1.0,
+    "BATCH_SIZE": 500,
+    # subtree filters of larger subtrees read the parent links with a recursive query
+    # instead of listing their ids
+    "MAX_SUBTREE_IDS": 500,
+}
+
+TREE_FIELDS = ["tree_id", "lft", "rght", "level"]
+# what a process_journal() run did
+TreeRebuild = namedtuple("TreeRebuild", ["writes", "rows", "seconds"])
+# tree fields of a journaled row until the tree is renumbered, never read
+PLACEHOLDER = {"tree_id": 0, "lft": 1, "rght": 2, "level": 0}
+# set while bulk inserted categories wait for a rebuild out of deferred mode
+PENDING_KEY = "catalog:category_journal_pending"
+
+
+def tree_settings():
+    return {**DEFAULT_CATEGORY_TREE, **getattr(settings, "CATEGORY_TREE", {})}
+
+
+def nested_sets(links):
+    """
+    Return ``{id: (tree_id, lft, rght, level, parent id)}`` for ``(id, parent id)``
+    pairs in sibling order, numbered like mptt's rebuild. Nodes in a parent cycle
+    are left out.
+    """
+    children, roots = defaultdict(list), []
+    parents = {}
+    for pk, parent in links:
+        parents[pk] = parent
+        (roots if parent is None else children[parent]).append(pk)
+    positions = {}
+    for tree_id, root in enumerate(roots, 1):
+        counter, lefts = 1, {}
+        stack = [(root, 0, False)]
+        # iterative, a deep tree would exceed the recursion limit
+        while stack:
+            pk, level, leaving = stack.pop()
+            if leaving:
+                positions[pk] = (tree_id, lefts.pop(pk), counter, level, parents[pk])
+            else:
+                lefts[pk] = counter
+                stack.append((pk, level, True))
+                stack.extend((child, level + 1, False) for child in reversed(children[pk]))
+            counter += 1
+    return positions
+
+
+def _links():
+    # sibling order is order_insertion_by, the database collation sorts the names
+    return Category.objects.order_by(*Category._mptt_meta.order_insertion_by, "id")
+
+
+def live_positions():
+    """
+    None when the nested set fields are up to date, else the positions of every
+    category computed from the parent links, see ``nested_sets``
+    """
+    cache = get_cache()
+    if not tree_settings()["DEFERRED"] and not cache.get(PENDING_KEY):
+        # only bulk inserts journal out of deferred mode, they set PENDING_KEY
+        return None
+    key = "catalog:category_positions:%s:%s" % (get_versions(Category)[0], read_source())
+    positions = cache.get(key)
+    if positions is None:
+        positions = False
+        if CategoryJournal.objects.exists():
+            positions = nested_sets(_links().values_list("id", "parent"))
+        cache.set(key, positions, cache_settings()["TIMEOUT"])
+    return positions or None
+
+
+def subtree_ids(positions, root_id):
+    """
+    Ids of the categories under ``root_id`` (itself included) in ``live_positions()``
+    """
+    if root_id not in positions:
+        return []
+    tree_id, lft, rght = positions[root_id][:3]
+    return [
+        pk
+        for pk, position in positions.items()
+        if position[0] == tree_id and lft <= position[1] and position[2] <= rght
+    ]
+
+
+def live_subtree(positions, root_id):
+    """
+    The right hand side of a ``pk__in`` filter on the subtree of ``root_id`` in
+    ``live_positions()``: its ids, or a recursive query of the parent links when there
+    are more than ``MAX_SUBTREE_IDS``
+    """
+    ids = subtree_ids(positions, root_id)
+    if len(ids) <= tree_settings()["MAX_SUBTREE_IDS"]:
+        return ids
+    quote = connection.ops.quote_name
+    table = quote(Category._meta.db_table)
+    pk, parent = quote(Category._meta.pk.column), quote(Category._meta.get_field("parent").column)
+    # UNION drops the rows already seen, a parent cycle ends the recursion
+    return RawSQL(
+        "WITH RECURSIVE subtree (id) AS ("
+        "SELECT %%s UNION SELECT c.%(pk)s FROM %(table)s c "
+        "INNER JOIN subtree ON c.%(parent)s = subtree.id"
+        ") SELECT id FROM subtree" % {"pk": pk, "table": table, "parent": parent},
+        [root_id],
+    )
+
+
+def save_category(serializer):
+    """
+    ``serializer.save()`` for a CategorySerializer, journaling the tree renumbering
+    in deferred mode
+    """
+    if not tree_settings()["DEFERRED"]:
+        return serializer.save()
+    data = serializer.validated_data
+    category = serializer.instance
+    with transaction.atomic():
+        # models.Model.save skips MPTTModel.save, which renumbers the tree
+        if category is None:
+            category = Category(**data, **PLACEHOLDER)
+            models.Model.save(category)
+            serializer.instance = category
+        else:
+            for field, value in data.items():
+                setattr(category, field, value)
+            # never the tree fields, the worker may be renumbering the row
+            models.Model.save(category, update_fields=[*data, "updated_at"])
+        CategoryJournal.objects.create(category_id=category.pk)
+        transaction.on_commit(tree_worker.notify)
+    return category
+
+
+def journal_categories(categories, rebuild=True):
+    """
+    Journal categories bulk inserted with ``PLACEHOLDER`` tree fields, the worker
+    renumbers the tree once the transaction commits. With ``rebuild=False`` the caller
+    runs ``process_journal()`` itself, a catalog import does once at its end.
+    """
+    if not tree_settings()["DEFERRED"]:
+        # taken by process_journal too, a run clearing PENDING_KEY sees these entries
+        CategoryTreeLock.objects.select_for_update().get_or_create(pk=1)
+        get_cache().set(PENDING_KEY, True, None)
+    CategoryJournal.objects.bulk_create(
+        [CategoryJournal(category_id=category.pk) for category in categories]
+    )
+    if rebuild:
+        transaction.on_commit(tree_worker.notify)
+
+
+def renumber():
+    """
+    Recompute the nested set of the whole table from the parent links, return the
+    number of rows whose position changed
+    """
+    rows = list(_links().values_list("id", "parent", *TREE_FIELDS))
+    positions = nested_sets((pk, parent) for pk, parent, *_ in rows)
+    if len(positions) < len(rows):
+        logger.warning("%d categories are in a parent cycle", len(rows) - len(positions))
+    changed = [
+        Category(pk=pk, **dict(zip(TREE_FIELDS, positions[pk][:4])))
+        for pk, _, *current in rows
+        if pk in positions and tuple(current) != positions[pk][:4]
+    ]
+    Category.objects.bulk_update(changed, TREE_FIELDS, batch_size=tree_settings()["BATCH_SIZE"])
+    return len(changed)
+
+
+def process_journal(force=False):
+    """
+    Apply the journaled writes with one renumbering, return a ``TreeRebuild``.
+    ``force`` renumbers even without any, after a bulk import for instance.
+    """
+    start = time.perf_counter()
+    # a replica may not have the rows being renumbered yet
+    with pin_primary(), transaction.atomic():
+        # one run at a time. The journal entries alone can't serialize the runs, each
+        # transaction only sees and locks its own. A concurrent run waits here until
+        # this one commits, then (READ COMMITTED) reads the rows it committed. SQLite
+        # ignores the lock, it runs one write transaction at a time anyway
+        CategoryTreeLock.objects.select_for_update().get_or_create(pk=1)
+        # only the entries read here are deleted, later ones wait for the next run
+        entries = list(CategoryJournal.objects.values_list("id", flat=True))
+        if not entries and not force:
+            return TreeRebuild(0, 0, 0.0)
+        renumbered = renumber()
+        CategoryJournal.objects.filter(id__in=entries).delete()
+        bump_version(Category)
+        if not tree_settings()["DEFERRED"]:
+            # the journal writers of this mode wait for the lock, it is empty now
+            transaction.on_commit(lambda: get_cache().delete(PENDING_KEY))
+    duration = time.perf_counter() - start
+    metrics.observe_tree_rebuild(duration, len(entries), renumbered)
+    logger.info(
+        "category tree renumbered in %.3fs: %d writes, %d rows moved",
+        duration,
+        len(entries),
+        renumbered,
+    )
+    return TreeRebuild(len(entries), renumbered, duration)
+
+
+class TreeWorker:
+    """
+    Thread renumbering the tree ``COALESCE_SECONDS`` after a journaled write
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def notify(self):
+        if tree_settings()["WORKER"] != "thread":
+            return
+        self._wake.set()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="category-tree", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(tree_settings()["COALESCE_SECONDS"])
+            # a write notifying from here on gets another run
+            self._wake.clear()
+            try:
+                process_journal()
+            except Exception:
+                logger.exception("category tree rebuild failed, retried on the next write")
+            finally:
+                connection.close()
+
+
+tree_worker = TreeWorker()
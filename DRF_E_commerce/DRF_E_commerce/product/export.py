@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+
+from .models import Product
+
+EXPORT_CHUNK_SIZE = getattr(settings, "EXPORT_CHUNK_SIZE", 2000)
+
+# column names of an exported product, brand and category are exported by name
+EXPORT_FIELDS = ["id", "names", "description", "is_digital", "brand", "category"]
+
+
+def export_rows(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one tuple per product of ``queryset`` (default: all) in EXPORT_FIELDS order.
+
+    The rows come from a single joined query that is read ``chunk_size`` rows at a time,
+    so memory use doesn't depend on the size of the catalog.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    rows = queryset.order_by("id").values_list(
+        "id", "names", "description", "is_digital", "brand__names", "category__names"
+    )
+    return rows.iterator(chunk_size=chunk_size)
+
+
+def stream_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Encode rows as newline delimited JSON, one object per line
+    """
+    lines, flushed = [], False
+    for row in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False))
+        # the first row goes out on its own, the client doesn't wait for a full chunk
+        if len(lines) >= chunk_size or not flushed:
+            yield "\n".join(lines) + "\n"
+            lines, flushed = [], True
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def stream_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Encode rows as CSV with a header line
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    # send the header straight away so the client gets its first byte before any query
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    count, flushed = 0, False
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        # and the first row as soon as the query returns, like stream_ndjson
+        if count >= chunk_size or not flushed:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count, flushed = 0, True
+    if count:
+        yield buffer.getvalue()
+
+
+STREAMERS = {"ndjson": stream_ndjson, "csv": stream_csv}
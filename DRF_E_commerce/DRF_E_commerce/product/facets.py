@@ -0,0 +1,95 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .deferred_tree import live_positions
+from .models import Category
+
+
+def product_facets(queryset):
+    """
+    Return the facet counts of a (filtered) product queryset: per brand, per
+    is_digital value and per category, a category counting the products of its whole
+    subtree.
+
+    Each facet is one grouped aggregate, plus one query for the category trees the
+    matched products are in. The subtree rollup doesn't walk the tree: the direct
+    counts of a tree are sorted by lft and summed with a prefix sum, the total of a
+    node is the sum over its [lft, rght] range.
+    """
+    queryset = queryset.order_by()
+    brands = (
+        queryset.values("brand", "brand__names")
+        .annotate(count=Count("id"))
+        .order_by("-count", "brand__names")
+    )
+    digital = queryset.values("is_digital").annotate(count=Count("id")).order_by("is_digital")
+    direct = (
+        queryset.filter(category__isnull=False)
+        .values_list("category", "category__tree_id", "category__lft")
+        .annotate(count=Count("id"))
+    )
+
+    is_digital = [{"value": row["is_digital"], "count": row["count"]} for row in digital]
+    return {
+        "total": sum(row["count"] for row in is_digital),
+        "brand": [
+            {"id": row["brand"], "names": row["brand__names"], "count": row["count"]}
+            for row in brands
+        ],
+        "category": _category_facets(list(direct)),
+        "is_digital": is_digital,
+    }
+
+
+def _category_facets(direct):
+    if not direct:
+        return []
+    positions = live_positions()
+    if positions is not None:
+        # stale tree fields while deferred tree writes are pending
+        direct = [(pk, *positions[pk][:2], count) for pk, _, _, count in direct]
+    counts = {category_id: count for category_id, _, _, count in direct}
+    # per tree: the sorted lft of the categories holding products and the prefix sums
+    ranges = defaultdict(list)
+    for _, tree_id, lft, count in sorted(direct, key=lambda row: (row[1], row[2])):
+        ranges[tree_id].append((lft, count))
+    prefix_sums = {}
+    for tree_id, rows in ranges.items():
+        sums = [0]
+        for _, count in rows:
+            sums.append(sums[-1] + count)
+        prefix_sums[tree_id] = ([lft for lft, _ in rows], sums)
+
+    if positions is None:
+        nodes = (
+            Category.objects.filter(tree_id__in=ranges)
+            .order_by("tree_id", "lft")
+            .values_list("id", "names", "parent", "tree_id", "lft", "rght", "level")
+        )
+    else:
+        nodes = sorted(
+            (
+                (pk, names, parent, *positions[pk][:4])
+                for pk, names, parent in Category.objects.values_list("id", "names", "parent")
+                if positions[pk][0] in ranges
+            ),
+            key=lambda node: (node[3], node[4]),
+        )
+    facets = []
+    for category_id, names, parent, tree_id, lft, rght, level in nodes:
+        lfts, sums = prefix_sums[tree_id]
+        total = sums[bisect_right(lfts, rght)] - sums[bisect_left(lfts, lft)]
+        if total:
+            facets.append(
+                {
+                    "id": category_id,
+                    "names": names,
+                    "parent": parent,
+                    "level": level,
+                    "product_count": counts.get(category_id, 0),
+                    "total_product_count": total,
+                }
+            )
+    return facets
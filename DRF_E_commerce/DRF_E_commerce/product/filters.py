@@ -0,0 +1,72 @@
+from django.db.models import Subquery, Value
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .models import Brand, Category
+from .tree import subtree_filter
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+FALSE_VALUES = {"0", "false", "no", "off"}
+
+
+def parse_bool(value):
+    """
+    Parse a query string boolean, returns None for an unknown value
+    """
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    return None
+
+
+def _bool_param(params, name):
+    value = params.get(name)
+    if value is None or value == "":
+        return None
+    parsed = parse_bool(value)
+    if parsed is None:
+        raise ValidationError({name: ["Must be true or false."]})
+    return parsed
+
+
+def _lookup(model, value):
+    # names first: all digits is an id unless a row has that name ("2024"), decided in
+    # the filtering query itself
+    if not value.isdigit():
+        return {"names": value}
+    named = Subquery(model.objects.filter(names=value).values("pk")[:1])
+    return {"pk": Coalesce(named, Value(int(value)), output_field=model._meta.pk)}
+
+
+def filter_products(queryset, params):
+    """
+    Narrow a product queryset with the catalog query parameters:
+
+    - ``brand``: brand name or id
+    - ``category``: category name or id, with ``include_descendants=true`` every
+      subcategory is matched too through one tree_id/lft/rght range predicate
+    - ``is_digital``: true or false
+
+    Nothing is looked up up front, so filtering never adds a query of its own.
+    """
+    brand = params.get("brand")
+    if brand:
+        queryset = queryset.filter(**{"brand__%s" % k: v for k, v in _lookup(Brand, brand).items()})
+
+    category = params.get("category")
+    if category:
+        if _bool_param(params, "include_descendants"):
+            root = Category.objects.filter(**_lookup(Category, category))
+            queryset = queryset.filter(subtree_filter(root, prefix="category__"))
+        else:
+            lookup = _lookup(Category, category)
+            queryset = queryset.filter(**{"category__%s" % k: v for k, v in lookup.items()})
+
+    is_digital = _bool_param(params, "is_digital")
+    if is_digital is not None:
+        queryset = queryset.filter(is_digital=is_digital)
+    return queryset
@@ -0,0 +1,199 @@
+"""
+Streaming catalog import, the counterpart of ``export.py``.
+
+Rows are read one at a time from CSV or NDJSON/JSONL with the export columns
+(``id`` optional) and written in batches: brands and categories are resolved in bulk,
+every row is validated by ``ProductSerializer`` like the bulk endpoint and the
+products are written with ``bulk_create``. New categories are inserted with
+placeholder tree fields and journaled, ``finish_import`` renumbers the tree once for
+the whole import. Until then readers get their positions from the parent links (see
+``deferred_tree.py``).
+"""
+import csv
+import json
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .autocomplete import autocomplete_index
+from .bulk import BULK_BATCH_SIZE, UPSERT_FIELDS, _fetch_by_names, chunked, resolve_brands
+from .cache import bump_version
+from .deferred_tree import PLACEHOLDER, journal_categories, process_journal
+from .models import Brand, Category, Product
+from .routers import pin_primary
+from .serializers import ProductSerializer
+
+FORMATS = ("csv", "jsonl")
+
+
+class InvalidRow:
+    """
+    A line that isn't a JSON object, reported like the rows failing validation
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+
+def read_rows(stream, file_format):
+    """
+    Yield ``(line number, row dict)`` from a CSV (with a header line) or JSONL stream,
+    ``InvalidRow`` instead of the dict for a malformed JSONL line
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = InvalidRow("Invalid JSON: %s" % exc)
+        if not isinstance(row, (dict, InvalidRow)):
+            row = InvalidRow("Expected an object.")
+        yield line_number, row
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _clean(row):
+    # CSV gives strings for everything, empty cells are missing values
+    row = {key: value for key, value in row.items() if key is not None and value != ""}
+    if isinstance(row.get("id"), str) and row["id"].isdigit():
+        row["id"] = int(row["id"])
+    row.setdefault("description", "")
+    return row
+
+
+def category_path(value, separator):
+    if not separator:
+        return [value]
+    return [name.strip() for name in value.split(separator) if name.strip()]
+
+
+def resolve_category_paths(values, separator=None, batch_size=BULK_BATCH_SIZE):
+    """
+    Return ``{value: Category}`` for category column values, with ``separator`` a value
+    is a path from a root to the category, e.g. ``Electronics > Phones``.
+
+    Missing categories are created level by level with bulk_create and placeholder tree
+    fields, then journaled for ``finish_import``. Returns the lookup and the number of
+    categories created.
+    """
+    paths = {value: category_path(value, separator) for value in values}
+    names = {name for path in paths.values() for name in path}
+    categories = _fetch_by_names(Category, names, batch_size)
+    created = []
+    # parents first, each level is one bulk insert
+    for depth in range(max((len(path) for path in paths.values()), default=0)):
+        missing = {}
+        for path in paths.values():
+            if len(path) > depth and path[depth] not in categories:
+                parent = categories[path[depth - 1]] if depth else None
+                missing.setdefault(path[depth], parent)
+        if not missing:
+            continue
+        Category.objects.bulk_create(
+            [
+                Category(names=name, parent=parent, **PLACEHOLDER)
+                for name, parent in sorted(missing.items())
+            ],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        inserted = _fetch_by_names(Category, missing, batch_size)
+        categories.update(inserted)
+        created += inserted.values()
+    if created:
+        journal_categories(created, rebuild=False)
+    return {value: categories[path[-1]] for value, path in paths.items() if path}, len(created)
+
+
+def import_batch(rows, category_separator=None, batch_size=BULK_BATCH_SIZE):
+    """
+    Validate and write one batch of ``(line number, row)`` in a transaction.
+
+    Rows with an ``id`` create or overwrite that product so a batch can be imported
+    twice, the others are created. Returns ``(stats, errors)`` with ``errors`` a list of
+    ``(line number, serializer errors)``.
+    """
+    stats = {"created": 0, "updated": 0, "categories": 0, "errors": 0}
+    errors = [
+        (line, {"non_field_errors": [row.message]})
+        for line, row in rows
+        if isinstance(row, InvalidRow)
+    ]
+    rows = [(line, _clean(row)) for line, row in rows if not isinstance(row, InvalidRow)]
+    brand_names = {row["brand"] for _, row in rows if isinstance(row.get("brand"), str)}
+    category_values = {
+        row["category"] for _, row in rows if isinstance(row.get("category"), str)
+    }
+
+    # the rows just inserted are read back, a replica may not have them yet
+    with pin_primary(), transaction.atomic():
+        category_lookup, stats["categories"] = resolve_category_paths(
+            category_values, category_separator, batch_size
+        )
+        context = {
+            "brand_lookup": resolve_brands(brand_names, batch_size),
+            "category_lookup": category_lookup,
+        }
+        with_id, without_id = {}, []
+        for line, row in rows:
+            serializer = ProductSerializer(data=row, context=context)
+            if not serializer.is_valid():
+                errors.append((line, serializer.errors))
+                continue
+            product = Product(**serializer.validated_data)
+            if isinstance(row.get("id"), int):
+                # the last row wins when an id repeats
+                product.id = row["id"]
+                with_id[product.id] = product
+            else:
+                without_id.append(product)
+
+        existing = set()
+        for ids in chunked(list(with_id), batch_size):
+            existing.update(Product.objects.filter(pk__in=ids).values_list("pk", flat=True))
+        Product.objects.bulk_create(
+            list(with_id.values()),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=UPSERT_FIELDS,
+        )
+        Product.objects.bulk_create(without_id, batch_size=batch_size)
+        # bulk queries send no model signals
+        bump_version(Brand, Category, Product)
+        transaction.on_commit(autocomplete_index.mark_stale)
+
+    stats["updated"] = len(existing)
+    stats["created"] = len(with_id) - len(existing) + len(without_id)
+    stats["errors"] = len(errors)
+    return stats, sorted(errors, key=lambda error: error[0])
+
+
+def finish_import(rebuild_tree):
+    """
+    Renumber the category tree once after categories were created and move the
+    primary key sequence past imported ids (a no-op on SQLite)
+    """
+    with pin_primary(), transaction.atomic():
+        if rebuild_tree:
+            process_journal()
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+                cursor.execute(sql)
+        bump_version(Category, Product)
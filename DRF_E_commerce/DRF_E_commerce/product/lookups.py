@@ -0,0 +1,108 @@
+"""
+In process cache of brand and category names to primary keys.
+
+Product writes name their brand and category, ``resolve_name`` and
+``NameRelatedField`` look them up here before going to the database. The cache is a
+bounded LRU whose entries expire after ``TIMEOUT`` seconds. Saving or deleting a brand
+or category clears the names of that model in this process (see ``signals.py``), the
+timeout bounds how long other processes keep a renamed or deleted name. Bulk writes
+only create rows, which can't make an entry stale. A product saved with the id of a
+row deleted meanwhile fails its foreign key check, ``ProductSerializer.save`` then
+drops the names and resolves them again.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .cache import cache_stats
+
+DEFAULT_NAME_LOOKUP_CACHE = {"MAX_SIZE": 2048, "TIMEOUT": 300, "ENABLED": True}
+
+
+def lookup_settings():
+    return {**DEFAULT_NAME_LOOKUP_CACHE, **getattr(settings, "NAME_LOOKUP_CACHE", {})}
+
+
+class NameLookupCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, model, name):
+        """
+        Return the cached primary key of ``name`` or None
+        """
+        options = lookup_settings()
+        if not options["ENABLED"]:
+            return None
+        key = (model._meta.label_lower, name)
+        scope = "names.%s" % model._meta.model_name
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                cache_stats.record(scope, hit=True)
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+        cache_stats.record(scope, hit=False)
+        return None
+
+    def set(self, model, name, pk):
+        options = lookup_settings()
+        if not options["ENABLED"]:
+            return
+        key = (model._meta.label_lower, name)
+        with self._lock:
+            self._entries[key] = (pk, time.monotonic() + options["TIMEOUT"])
+            self._entries.move_to_end(key)
+            while len(self._entries) > options["MAX_SIZE"]:
+                self._entries.popitem(last=False)
+
+    def discard(self, model, name):
+        with self._lock:
+            self._entries.pop((model._meta.label_lower, name), None)
+
+    def invalidate(self, model):
+        label = model._meta.label_lower
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == label]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+name_cache = NameLookupCache()
+
+
+def cached_instance(model, name):
+    """
+    Return a ``model(pk=..., names=name)`` stand in when the name is cached, enough to
+    be assigned to a foreign key and rendered by name without fetching the row
+    """
+    pk = name_cache.get(model, name)
+    if pk is None:
+        return None
+    instance = model(pk=pk, names=name)
+    instance._state.adding = False
+    # never checked against the table, see ProductSerializer.save
+    instance._from_name_cache = True
+    return instance
+
+
+def resolve_name(model, name):
+    """
+    Return the primary key of the ``model`` row called ``name``, created when missing
+    """
+    pk = name_cache.get(model, name)
+    if pk is None:
+        pk = model.objects.get_or_create(names=name)[0].pk
+        name_cache.set(model, name, pk)
+    return pk
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from DRF_E_commerce.product.audit import canonical_queries, explain_query, full_scans
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the canonical queries of the API through EXPLAIN and fail when one of them "
+        "reads a whole table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--only", nargs="*", help="query name prefixes, e.g. product.list")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        flagged = []
+        for query in canonical_queries(options["database"]):
+            if options["only"] and not any(query.name.startswith(p) for p in options["only"]):
+                continue
+            for sql, plan in explain_query(query, using=connection):
+                scans = full_scans(
+                    plan, connection.vendor, index_scans=not query.allow_index_scan
+                )
+                if scans and not query.allow_scan:
+                    flagged.append(query.name)
+                    self.stdout.write(
+                        self.style.ERROR("%s: full scan of %s" % (query.name, ", ".join(scans)))
+                    )
+                else:
+                    self.stdout.write("%s: ok" % query.name)
+                if options["verbosity"] > 1 or (scans and not query.allow_scan):
+                    self.stdout.write("  %s" % sql)
+                    self.stdout.write("  " + plan.replace("\n", "\n  "))
+
+        if flagged:
+            raise CommandError(
+                "%d queries read a whole table: %s" % (len(flagged), ", ".join(flagged))
+            )
+        self.stdout.write(self.style.SUCCESS("no unexpected full table scans"))
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from DRF_E_commerce.product.export import EXPORT_CHUNK_SIZE, STREAMERS, export_rows
+from DRF_E_commerce.product.filters import filter_products
+from DRF_E_commerce.product.models import Product
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog as NDJSON or CSV to stdout or a file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(STREAMERS), default="ndjson")
+        parser.add_argument("--output", help="file to write to, defaults to stdout")
+        parser.add_argument("--brand", help="only products of this brand id or name")
+        parser.add_argument("--category", help="only products of this category id or name")
+        parser.add_argument(
+            "--include-descendants",
+            action="store_true",
+            help="with --category, also products of its subcategories",
+        )
+        parser.add_argument("--is-digital", help="true or false")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        params = {
+            "brand": options["brand"],
+            "category": options["category"],
+            "include_descendants": options["include_descendants"],
+            "is_digital": options["is_digital"],
+        }
+        try:
+            queryset = filter_products(Product.objects.all(), params)
+        except ValidationError as exc:
+            raise CommandError(exc.detail)
+
+        rows = export_rows(queryset, chunk_size=options["chunk_size"])
+        chunks = STREAMERS[options["format"]](rows, chunk_size=options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as output:
+                output.writelines(chunks)
+        else:
+            # write straight to stdout, self.stdout would add a newline after every chunk
+            sys.stdout.writelines(chunks)
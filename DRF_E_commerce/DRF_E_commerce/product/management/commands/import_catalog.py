@@ -0,0 +1,106 @@
+import itertools
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from DRF_E_commerce.product.bulk import BULK_BATCH_SIZE
+from DRF_E_commerce.product.importer import (
+    FORMATS,
+    batches,
+    finish_import,
+    import_batch,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products from CSV or JSONL (the export_catalog columns) in batches, "
+        "in bounded memory. After a failure run it again with --resume to carry on "
+        "after the last imported batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="file to read, - for stdin")
+        parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+        parser.add_argument(
+            "--category-separator",
+            help="category values are paths from the root, e.g. '>' for 'Electronics > Phones'",
+        )
+        parser.add_argument(
+            "--checkpoint", help="progress file, defaults to <path>.checkpoint next to the input"
+        )
+        parser.add_argument(
+            "--resume", action="store_true", help="skip the rows of the last run's checkpoint"
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if file_format in ("ndjson", "json"):
+            file_format = "jsonl"
+        if file_format not in FORMATS:
+            raise CommandError("Unknown format, use --format %s" % " or ".join(FORMATS))
+        checkpoint_path = options["checkpoint"] or (
+            None if path == "-" else "%s.checkpoint" % path
+        )
+        if options["resume"] and not checkpoint_path:
+            raise CommandError("--resume reads stdin from the start, pass --checkpoint")
+
+        progress = {"rows": 0, "created": 0, "updated": 0, "errors": 0, "categories": 0}
+        if options["resume"]:
+            progress = self.load_checkpoint(checkpoint_path) or progress
+            self.stdout.write("resuming after row %d" % progress["rows"])
+
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+        started = time.perf_counter()
+        imported = 0
+        try:
+            rows = itertools.islice(read_rows(stream, file_format), progress["rows"], None)
+            for batch in batches(rows, options["batch_size"]):
+                stats, errors = import_batch(
+                    batch, options["category_separator"], options["batch_size"]
+                )
+                for line, error in errors:
+                    self.stderr.write("line %d: %s" % (line, json.dumps(error)))
+                for key, value in stats.items():
+                    progress[key] += value
+                progress["rows"] += len(batch)
+                imported += len(batch)
+                # the batch is committed, a failure after this point resumes after it
+                self.save_checkpoint(checkpoint_path, progress)
+                rate = imported / (time.perf_counter() - started)
+                self.stdout.write("%d rows, %.0f rows/s" % (progress["rows"], rate))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        finish_import(rebuild_tree=progress["categories"] > 0)
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                "%(rows)d rows: %(created)d created, %(updated)d updated, %(errors)d errors, "
+                "%(categories)d new categories" % progress
+                + " in %.1fs (%.0f rows/s)" % (elapsed, imported / elapsed if elapsed else 0)
+            )
+        )
+
+    def load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+
+    def save_checkpoint(self, path, progress):
+        if not path:
+            return
+        # write then rename so a crash never leaves a half written checkpoint
+        with open(path + ".tmp", "w") as checkpoint:
+            json.dump(progress, checkpoint)
+        os.replace(path + ".tmp", path)
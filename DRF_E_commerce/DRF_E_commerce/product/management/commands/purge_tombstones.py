@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from DRF_E_commerce.product.sync import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the deletion records of the sync feed older than the retention, clients "
+        "with older tokens have to sync again from scratch"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="CATALOG_SYNC retention by default")
+
+    def handle(self, *args, **options):
+        deleted = purge_tombstones(options["days"])
+        self.stdout.write("%d tombstones deleted" % deleted)
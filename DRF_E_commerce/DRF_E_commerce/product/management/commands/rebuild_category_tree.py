@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from DRF_E_commerce.product.deferred_tree import process_journal
+
+
+class Command(BaseCommand):
+    help = (
+        "Renumber the category tree for the writes journaled in CATEGORY_TREE deferred "
+        "mode, once or every --interval seconds with --watch"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--watch", action="store_true", help="keep running")
+        parser.add_argument("--interval", type=float, default=1.0)
+        parser.add_argument(
+            "--force", action="store_true", help="renumber even without journaled writes"
+        )
+
+    def handle(self, *args, **options):
+        # the metrics of this process aren't the web process's /api/metrics/, print them
+        self.report(process_journal(force=options["force"]))
+        while options["watch"]:
+            time.sleep(options["interval"])
+            rebuild = process_journal()
+            if rebuild.writes:
+                self.report(rebuild)
+
+    def report(self, rebuild):
+        self.stdout.write(
+            "%d journaled writes applied, %d categories renumbered in %.3fs"
+            % (rebuild.writes, rebuild.rows, rebuild.seconds)
+        )
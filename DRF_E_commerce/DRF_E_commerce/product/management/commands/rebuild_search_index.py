@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from DRF_E_commerce.product.cache import bump_version
+from DRF_E_commerce.product.models import Product
+from DRF_E_commerce.product.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full text product search index"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        indexed = backend.rebuild()
+        # cached search responses were built from the old index
+        bump_version(Product)
+        self.stdout.write(
+            self.style.SUCCESS("%s: indexed %d products" % (type(backend).__name__, indexed))
+        )
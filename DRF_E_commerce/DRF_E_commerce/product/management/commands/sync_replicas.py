@@ -0,0 +1,39 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from DRF_E_commerce.product.routers import replica_health, replica_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary database into the SQLite replicas, a stand in for "
+        "replication when trying the replica routing locally"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("aliases", nargs="*", help="replicas to copy to, all by default")
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or replica_settings()["ALIASES"]
+        if not aliases:
+            raise CommandError("no replica configured in DATABASE_REPLICAS")
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            if alias not in connections:
+                raise CommandError("unknown database %s" % alias)
+            if primary.vendor != "sqlite" or connections[alias].vendor != "sqlite":
+                raise CommandError("only SQLite databases can be copied, %s isn't" % alias)
+
+        primary.ensure_connection()
+        for alias in aliases:
+            # the backup API copies a consistent snapshot while the primary is in use
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict["NAME"])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            replica_health.mark(alias, True)
+            self.stdout.write("%s: copied" % alias)
@@ -0,0 +1,254 @@
+"""
+Per request performance instrumentation.
+
+While a request runs, a ``RequestTimings`` lives in a context variable. Database
+queries (through an execute wrapper on every connection), serializers and rendering
+add their time to it. ``PerformanceMiddleware`` reports it in a ``Server-Timing``
+header, logs slow requests with their slowest SQL and feeds the per route
+histograms of ``metrics``, exposed in the Prometheus text format by the
+``/api/metrics/`` view.
+
+Everything is off unless ``PERFORMANCE_METRICS["ENABLED"]`` is set. When it is on,
+the cost per request is a handful of ``perf_counter()`` calls and one lock.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+from .cache import cache_stats
+
+DEFAULT_PERFORMANCE_METRICS = {
+    "ENABLED": False,
+    "SERVER_TIMING": True,
+    # requests slower than this are logged with their SQL, None disables the log
+    "SLOW_REQUEST_MS": 500,
+    # SQL statements kept per request for the slow request log
+    "MAX_LOGGED_QUERIES": 5,
+    "DURATION_BUCKETS": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    "QUERY_COUNT_BUCKETS": [0, 1, 2, 5, 10, 20, 50, 100],
+}
+
+
+def metrics_settings():
+    return {**DEFAULT_PERFORMANCE_METRICS, **getattr(settings, "PERFORMANCE_METRICS", {})}
+
+
+class RequestTimings:
+    """
+    Time spent by one request per phase, in seconds
+    """
+
+    def __init__(self, max_queries=5):
+        self.db_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.max_queries = max_queries
+        # the slowest statements as (seconds, sql), for the slow request log
+        self.slowest = []
+        self._depth = 0
+
+    def add_query(self, sql, duration):
+        self.db_count += 1
+        self.db_time += duration
+        if len(self.slowest) < self.max_queries:
+            self.slowest.append((duration, sql))
+            self.slowest.sort(reverse=True)
+        elif duration > self.slowest[-1][0]:
+            self.slowest[-1] = (duration, sql)
+            self.slowest.sort(reverse=True)
+
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def track(timings):
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def measure_serialization():
+    """
+    Add the time of the block to the serializer time of the current request. Nested
+    serializers (a list and its items) are only counted once.
+    """
+    timings = _current.get()
+    if timings is None or timings._depth:
+        yield
+        return
+    timings._depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serialize_time += time.perf_counter() - start
+        timings._depth -= 1
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper timing every query of the current request, a plain pass through
+    outside of a tracked request
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(connection, **kwargs):
+    # also the connection_created receiver, connections are per thread
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    In process request metrics per route (the URL name) and method
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = defaultdict(int)
+        self.durations = {}
+        self.query_counts = {}
+        self.phase_seconds = defaultdict(float)
+        # deferred category tree rebuilds, see deferred_tree.py
+        self.tree_rebuilds = None
+        self.tree_writes = 0
+        self.tree_rows = 0
+
+    def observe(self, route, method, status, duration, timings):
+        labels = (route, method)
+        with self._lock:
+            self.requests[(route, method, str(status))] += 1
+            if labels not in self.durations:
+                options = metrics_settings()
+                self.durations[labels] = Histogram(options["DURATION_BUCKETS"])
+                self.query_counts[labels] = Histogram(options["QUERY_COUNT_BUCKETS"])
+            self.durations[labels].observe(duration)
+            self.query_counts[labels].observe(timings.db_count)
+            self.phase_seconds[labels + ("db",)] += timings.db_time
+            self.phase_seconds[labels + ("serialize",)] += timings.serialize_time
+            self.phase_seconds[labels + ("render",)] += timings.render_time
+
+    def observe_tree_rebuild(self, duration, writes, rows):
+        with self._lock:
+            if self.tree_rebuilds is None:
+                self.tree_rebuilds = Histogram(metrics_settings()["DURATION_BUCKETS"])
+            self.tree_rebuilds.observe(duration)
+            self.tree_writes += writes
+            self.tree_rows += rows
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            lines = [
+                "# HELP http_requests_total Requests per route, method and status.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (route, method, status), count in sorted(self.requests.items()):
+                labels = _labels(route=route, method=method, status=status)
+                lines.append("http_requests_total{%s} %d" % (labels, count))
+            _histogram_lines(
+                lines,
+                "http_request_duration_seconds",
+                "Request duration in seconds.",
+                self.durations,
+            )
+            _histogram_lines(
+                lines,
+                "http_request_db_queries",
+                "Database queries per request.",
+                self.query_counts,
+            )
+            lines += [
+                "# HELP http_request_phase_seconds_total Time spent per request phase.",
+                "# TYPE http_request_phase_seconds_total counter",
+            ]
+            for (route, method, phase), seconds in sorted(self.phase_seconds.items()):
+                labels = _labels(route=route, method=method, phase=phase)
+                lines.append("http_request_phase_seconds_total{%s} %r" % (labels, seconds))
+            _histogram_lines(
+                lines,
+                "category_tree_rebuild_seconds",
+                "Deferred category tree rebuild duration in seconds.",
+                {(): self.tree_rebuilds} if self.tree_rebuilds else {},
+            )
+            lines += [
+                "# HELP category_tree_journaled_writes_total Category writes applied by rebuilds.",
+                "# TYPE category_tree_journaled_writes_total counter",
+                "category_tree_journaled_writes_total %d" % self.tree_writes,
+                "# HELP category_tree_renumbered_rows_total Categories moved by rebuilds.",
+                "# TYPE category_tree_renumbered_rows_total counter",
+                "category_tree_renumbered_rows_total %d" % self.tree_rows,
+            ]
+
+        lines += [
+            "# HELP response_cache_requests_total Response cache lookups per endpoint.",
+            "# TYPE response_cache_requests_total counter",
+        ]
+        for scope, counts in sorted(cache_stats.snapshot().items()):
+            for key, result in (("hits", "hit"), ("misses", "miss")):
+                labels = _labels(scope=scope, result=result)
+                lines.append("response_cache_requests_total{%s} %d" % (labels, counts[key]))
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels):
+    return ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+
+
+def _histogram_lines(lines, name, help_text, histograms):
+    # histograms per (route, method), or a single one under ()
+    lines += ["# HELP %s %s" % (name, help_text), "# TYPE %s histogram" % name]
+    for key, histogram in sorted(histograms.items()):
+        route_labels = dict(zip(("route", "method"), key))
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+            cumulative += count
+            labels = _labels(**route_labels, le=bound)
+            lines.append("%s_bucket{%s} %d" % (name, labels, cumulative))
+        labels = _labels(**route_labels)
+        lines.append("%s_sum%s %r" % (name, "{%s}" % labels if labels else "", histogram.sum))
+        lines.append("%s_count%s %d" % (name, "{%s}" % labels if labels else "", cumulative))
+
+
+metrics = Metrics()
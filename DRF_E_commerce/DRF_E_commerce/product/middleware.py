@@ -0,0 +1,181 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve
+
+from .metrics import (
+    RequestTimings,
+    current_timings,
+    install_query_recorder,
+    metrics,
+    metrics_settings,
+    track,
+)
+from .routers import replica_reads, replica_settings
+
+logger = logging.getLogger("DRF_E_commerce.performance")
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class PerformanceMiddleware:
+    """
+    Measure every request: SQL count and time, serializer and render time.
+
+    Adds a ``Server-Timing`` header, records per route histograms (see ``metrics.py``)
+    and logs requests slower than ``SLOW_REQUEST_MS`` with their slowest queries.
+    Only installed when ``PERFORMANCE_METRICS["ENABLED"]`` is true. Works for the
+    sync viewsets and the async views.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.options = metrics_settings()
+        if not self.options["ENABLED"]:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        # connections are per thread, new ones get the recorder when they are opened
+        connection_created.connect(install_query_recorder, dispatch_uid="performance-metrics")
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        for connection in connections.all():
+            install_query_recorder(connection)
+        timings = RequestTimings(self.options["MAX_LOGGED_QUERIES"])
+        start = time.perf_counter()
+        with track(timings):
+            response = self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings(self.options["MAX_LOGGED_QUERIES"])
+        start = time.perf_counter()
+        # the context, with the timings, is copied into the threads of sync_to_async
+        with track(timings):
+            response = await self.get_response(request)
+        return self.finish(request, response, timings, time.perf_counter() - start)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view, time it up to the post render callback
+        timings = current_timings()
+        if timings is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                timings.render_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, timings, duration):
+        match = request.resolver_match
+        route = match.view_name if match else "unmatched"
+        metrics.observe(route, request.method, response.status_code, duration, timings)
+
+        if self.options["SERVER_TIMING"]:
+            response["Server-Timing"] = ", ".join(
+                [
+                    'db;dur=%.2f;desc="%d queries"' % (timings.db_time * 1000, timings.db_count),
+                    "serialize;dur=%.2f" % (timings.serialize_time * 1000),
+                    "render;dur=%.2f" % (timings.render_time * 1000),
+                    "total;dur=%.2f" % (duration * 1000),
+                ]
+            )
+
+        slow_ms = self.options["SLOW_REQUEST_MS"]
+        if slow_ms is not None and duration * 1000 >= slow_ms:
+            logger.warning(
+                "slow request %s %s: %.0fms, %d queries in %.0fms, serialize %.0fms, "
+                "render %.0fms\n%s",
+                request.method,
+                request.get_full_path(),
+                duration * 1000,
+                timings.db_count,
+                timings.db_time * 1000,
+                timings.serialize_time * 1000,
+                timings.render_time * 1000,
+                "\n".join(
+                    "  %.1fms %s" % (seconds * 1000, sql) for seconds, sql in timings.slowest
+                ),
+            )
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read your own writes with ``ReplicaRouter``.
+
+    Turns replica reads on for the requests it doesn't pin. Write requests run pinned
+    to the primary, a successful one sets a cookie holding the time until which the
+    client's reads stay on the primary, long enough for the replicas to catch up
+    (``READ_YOUR_WRITES_SECONDS``). Only installed when
+    ``DATABASE_REPLICAS["ALIASES"]`` isn't empty. POST lookups marked with
+    ``routers.read_only`` are reads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.options = replica_settings()
+        if not self.options["ALIASES"]:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(not self.pinned(request)):
+            response = self.get_response(request)
+        return self.remember_write(request, response)
+
+    async def __acall__(self, request):
+        # a context variable, sync_to_async copies it into its thread
+        with replica_reads(not self.pinned(request)):
+            response = await self.get_response(request)
+        return self.remember_write(request, response)
+
+    def writes(self, request):
+        if request.method in SAFE_METHODS:
+            return False
+        try:
+            view = resolve(request.path_info).func
+        except Resolver404:
+            return True
+        # viewsets route a method to an action of the class
+        actions = getattr(view, "actions", None)
+        if actions is not None:
+            view = getattr(view.cls, actions.get(request.method.lower(), ""), None)
+        return not getattr(view, "read_only", False)
+
+    def pinned(self, request):
+        if self.writes(request):
+            return True
+        try:
+            until = float(request.COOKIES.get(self.options["COOKIE_NAME"], 0))
+        except ValueError:
+            return False
+        return until > time.time()
+
+    def remember_write(self, request, response):
+        if response.status_code < 400 and self.writes(request):
+            seconds = self.options["READ_YOUR_WRITES_SECONDS"]
+            response.set_cookie(
+                self.options["COOKIE_NAME"],
+                "%.3f" % (time.time() + seconds),
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
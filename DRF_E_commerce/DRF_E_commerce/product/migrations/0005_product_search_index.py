@@ -0,0 +1,91 @@
+from django.db import migrations
+
+# Full text index of the products for the SQLite search backend. The brand and
+# category names are copied in so a match on them needs no join, triggers keep
+# the copy in sync with every write, bulk writes and raw SQL included.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE product_product_fts USING fts5(
+        names, description, brand, category, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO product_product_fts(rowid, names, description, brand, category)
+    SELECT p.id, p.names, p.description, b.names, c.names
+    FROM product_product p
+    LEFT JOIN product_brand b ON b.id = p.brand_id
+    LEFT JOIN product_category c ON c.id = p.category_id
+    """,
+    """
+    CREATE TRIGGER product_product_fts_insert AFTER INSERT ON product_product BEGIN
+        INSERT INTO product_product_fts(rowid, names, description, brand, category)
+        VALUES (
+            new.id,
+            new.names,
+            new.description,
+            (SELECT names FROM product_brand WHERE id = new.brand_id),
+            (SELECT names FROM product_category WHERE id = new.category_id)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER product_product_fts_update AFTER UPDATE ON product_product BEGIN
+        DELETE FROM product_product_fts WHERE rowid = old.id;
+        INSERT INTO product_product_fts(rowid, names, description, brand, category)
+        VALUES (
+            new.id,
+            new.names,
+            new.description,
+            (SELECT names FROM product_brand WHERE id = new.brand_id),
+            (SELECT names FROM product_category WHERE id = new.category_id)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER product_product_fts_delete AFTER DELETE ON product_product BEGIN
+        DELETE FROM product_product_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER product_brand_fts_update AFTER UPDATE OF names ON product_brand BEGIN
+        UPDATE product_product_fts SET brand = new.names
+        WHERE rowid IN (SELECT id FROM product_product WHERE brand_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER product_category_fts_update AFTER UPDATE OF names ON product_category BEGIN
+        UPDATE product_product_fts SET category = new.names
+        WHERE rowid IN (SELECT id FROM product_product WHERE category_id = new.id);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS product_category_fts_update",
+    "DROP TRIGGER IF EXISTS product_brand_fts_update",
+    "DROP TRIGGER IF EXISTS product_product_fts_delete",
+    "DROP TRIGGER IF EXISTS product_product_fts_update",
+    "DROP TRIGGER IF EXISTS product_product_fts_insert",
+    "DROP TABLE IF EXISTS product_product_fts",
+]
+
+
+def _run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # other databases use their own search backend
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0004_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(_run_on_sqlite(SQLITE_FORWARD), _run_on_sqlite(SQLITE_BACKWARD)),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.3 on 2026-10-18 14:31
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0007_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryJournal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
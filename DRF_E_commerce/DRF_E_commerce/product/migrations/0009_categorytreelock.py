@@ -0,0 +1,24 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+def create_lock(apps, schema_editor):
+    apps.get_model("product", "CategoryTreeLock").objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_categoryjournal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryTreeLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.RunPython(create_lock, migrations.RunPython.noop),
+    ]
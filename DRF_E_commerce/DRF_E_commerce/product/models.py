@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from mptt.models import MPTTModel, TreeForeignKey
 
 
@@ -7,16 +8,40 @@ class Category(MPTTModel):
     names = models.CharField(max_length=100, unique=True)
     # CONNECT in tree struture the catefories together
     parent = TreeForeignKey("self", on_delete=models.PROTECT, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class MPTTMeta:
         order_insertion_by = ["names"]
 
+    class Meta:
+        # subtree lookups are a tree_id equality plus a lft range
+        indexes = [models.Index(fields=["tree_id", "lft"], name="category_tree_lft_idx")]
+
     def __str__(self):
         return self.names
 
 
+class CategoryJournal(models.Model):
+    """
+    A category write whose tree renumbering is deferred, see deferred_tree.py
+    """
+
+    category_id = models.BigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return "category %d" % self.category_id
+
+
+class CategoryTreeLock(models.Model):
+    """
+    The one row tree rebuilds lock to run one at a time, see deferred_tree.py
+    """
+
+
 class Brand(models.Model):
     names = models.CharField(max_length=100, null=False, blank=False, unique=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.names
@@ -28,6 +53,45 @@ class Product(models.Model):
     is_digital = models.BooleanField(default=False)
     brand = models.ForeignKey(Brand, on_delete=models.CASCADE)
     category = TreeForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    # modification time, drives the ETag/Last-Modified headers of the API
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # check new access patterns with `manage.py explain_queries`
+        indexes = [
+            models.Index(fields=["names"], name="product_names_idx"),
+            models.Index(fields=["brand", "category"], name="product_brand_category_idx"),
+            # is_digital=True is a bare WHERE "is_digital" that no (is_digital, id) index
+            # serves on SQLite, partial indexes matching the filter keep the pages in id order
+            models.Index(
+                fields=["id"], condition=models.Q(is_digital=True), name="product_digital_idx"
+            ),
+            models.Index(
+                fields=["id"], condition=models.Q(is_digital=False), name="product_physical_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.names
+
+
+class Tombstone(models.Model):
+    """
+    A deleted catalog row, so the sync feed can report deletions
+    """
+
+    MODELS = [("product", "product"), ("brand", "brand"), ("category", "category")]
+
+    model = models.CharField(max_length=20, choices=MODELS)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # the sync feed pages through (deleted_at, id)
+            models.Index(fields=["deleted_at", "id"], name="tombstone_deleted_idx"),
+            models.Index(fields=["model", "deleted_at"], name="tombstone_model_idx"),
+        ]
+
+    def __str__(self):
+        return "%s %d" % (self.model, self.object_id)
@@ -0,0 +1,48 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class AsyncPaginationMixin:
+    """
+    ``apaginate_queryset`` for the async views, DRF's ``paginate_queryset`` run like the
+    async ORM runs its queries (``sync_to_async`` in Django 4.2)
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+
+
+class ProductCursorPagination(AsyncPaginationMixin, CursorPagination):
+    """
+    Keyset pagination for the product catalog.
+
+    Pages are addressed by an opaque cursor that encodes the last seen primary key,
+    so fetching page 1000 costs the same single indexed range query as page 1.
+    """
+
+    # the primary key is unique and indexed which gives a stable order with no duplicates
+    ordering = "id"
+    page_size = getattr(settings, "PRODUCT_PAGE_SIZE", 50)
+    page_size_query_param = "page_size"
+    max_page_size = getattr(settings, "MAX_PAGE_SIZE", 500)
+
+
+class OptInLimitOffsetPagination(AsyncPaginationMixin, LimitOffsetPagination):
+    """
+    Offset pagination that is only applied when the client sends ``?limit=``.
+
+    Brands and categories are small tables so by default the full list is returned.
+    """
+
+    default_limit = None
+    max_limit = getattr(settings, "MAX_PAGE_SIZE", 500)
+
+
+class SearchPagination(LimitOffsetPagination):
+    """
+    Offset pagination for ranked search results, rank order has no key to seek on
+    """
+
+    default_limit = getattr(settings, "PRODUCT_PAGE_SIZE", 50)
+    max_limit = getattr(settings, "MAX_PAGE_SIZE", 500)
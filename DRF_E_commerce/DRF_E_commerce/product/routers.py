@@ -0,0 +1,203 @@
+"""
+Read replica routing.
+
+``ReplicaRouter`` sends writes to ``default`` and, inside ``replica_reads()``, reads
+to the aliases listed in ``DATABASE_REPLICAS["ALIASES"]``, round robin. Replica reads
+are opt in: ``ReplicaPinningMiddleware`` turns them on for the requests it doesn't
+pin, management commands, worker threads and ``on_commit`` hooks read the primary.
+Reads go to the primary inside replica_reads() too:
+
+- while ``pin_primary()`` is active. ``ReplicaPinningMiddleware`` pins write requests
+  and, through a short lived cookie, the requests of a client that just wrote, so it
+  reads its own writes for ``READ_YOUR_WRITES_SECONDS``;
+- inside a transaction of ``default``, which may read rows it wrote itself;
+- when no replica is healthy. ``replica_health`` checks every replica at most once
+  per ``HEALTH_CHECK_INTERVAL`` seconds and drops the ones it can't reach or that lag
+  more than ``MAX_LAG_SECONDS`` behind the primary.
+
+With no replica configured everything goes to ``default``.
+"""
+import contextlib
+import contextvars
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Max, Min
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_REPLICAS = {
+    "ALIASES": [],
+    "READ_YOUR_WRITES_SECONDS": 5,
+    "MAX_LAG_SECONDS": 30,
+    "HEALTH_CHECK_INTERVAL": 10,
+    "COOKIE_NAME": "read_primary_until",
+}
+
+
+def replica_settings():
+    return {**DEFAULT_DATABASE_REPLICAS, **getattr(settings, "DATABASE_REPLICAS", {})}
+
+
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+
+
+@contextlib.contextmanager
+def replica_reads(enabled=True):
+    """
+    Let the reads of the block go to the replicas
+    """
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextlib.contextmanager
+def pin_primary(pinned=True):
+    """
+    Send the reads of the block to the primary
+    """
+    token = _replica_reads.set(_replica_reads.get() and not pinned)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def is_pinned():
+    return not _replica_reads.get()
+
+
+def read_only(view):
+    """
+    Mark a POST view or viewset action that doesn't write (a lookup with a body too
+    long for a query string): ``ReplicaPinningMiddleware`` neither pins it to the
+    primary nor keeps the client's next reads there
+    """
+    view.read_only = True
+    return view
+
+
+def read_source():
+    """
+    ``"primary"`` when the reads of the current request go to the primary, else
+    ``"replica"``. Cached responses and validators are kept apart per source, a
+    lagging replica must never fill the cache entries a pinned client reads.
+    """
+    if is_pinned() or not ReplicaRouter().replicas():
+        return "primary"
+    return "replica"
+
+
+def replication_lag(alias, primary=DEFAULT_DB_ALIAS):
+    """
+    Seconds since the oldest catalog write the replica ``alias`` hasn't applied yet, 0
+    when it is up to date.
+
+    Works on any backend from the ``updated_at`` columns: the newest row the replica
+    has is compared with the rows of the primary, deletes are not seen.
+    """
+    from .models import Brand, Category, Product
+
+    oldest_missing = None
+    for model in (Product, Brand, Category):
+        newest = model.objects.using(alias).aggregate(newest=Max("updated_at"))["newest"]
+        missing = model.objects.using(primary)
+        if newest is not None:
+            missing = missing.filter(updated_at__gt=newest)
+        first = missing.aggregate(first=Min("updated_at"))["first"]
+        if first is not None and (oldest_missing is None or first < oldest_missing):
+            oldest_missing = first
+    if oldest_missing is None:
+        return 0.0
+    return max(0.0, (timezone.now() - oldest_missing).total_seconds())
+
+
+class ReplicaHealth:
+    """
+    Cached health of the replicas, in process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def healthy(self, alias):
+        options = replica_settings()
+        now = time.monotonic()
+        with self._lock:
+            checked = self._checked.get(alias)
+            if checked is not None and now - checked[0] < options["HEALTH_CHECK_INTERVAL"]:
+                return checked[1]
+            # other threads keep the previous answer while this one checks
+            self._checked[alias] = (now, checked[1] if checked else True)
+        healthy = self.check(alias, options["MAX_LAG_SECONDS"])
+        with self._lock:
+            self._checked[alias] = (now, healthy)
+        return healthy
+
+    def check(self, alias, max_lag):
+        try:
+            lag = replication_lag(alias)
+        except DatabaseError as exc:
+            logger.warning("replica %s is unavailable: %s", alias, exc)
+            return False
+        if lag > max_lag:
+            logger.warning("replica %s lags %.0fs behind, reading from the primary", alias, lag)
+            return False
+        return True
+
+    def mark(self, alias, healthy):
+        with self._lock:
+            self._checked[alias] = (time.monotonic(), healthy)
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+replica_health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def replicas(self):
+        return [alias for alias in replica_settings()["ALIASES"] if alias in connections]
+
+    def db_for_read(self, model, **hints):
+        if is_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = self.replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        start = next(self._counter)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            if replica_health.healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *self.replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        if db in replica_settings()["ALIASES"]:
+            return False
+        return None
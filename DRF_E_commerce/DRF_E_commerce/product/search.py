@@ -0,0 +1,161 @@
+"""
+Full text product search.
+
+A backend turns a user query into a ranked list of product ids. The SQLite backend
+reads the FTS5 index created in migration 0005, other databases fall back to a
+plain ``icontains`` backend until a native one (e.g. Postgres tsvector) is written;
+set ``SEARCH_BACKEND`` to the dotted path of a ``SearchBackend`` subclass to use it.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchBackend:
+    """
+    Interface of the search backends
+    """
+
+    def search(self, query, offset, limit):
+        """
+        Return the ids of the best matching products, best first
+        """
+        raise NotImplementedError
+
+    def count(self, query):
+        raise NotImplementedError
+
+    def rebuild(self):
+        """
+        Rebuild the index from the product tables, returns the number of indexed products
+        """
+        raise NotImplementedError
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    table = "product_product_fts"
+    # bm25 column weights: names, description, brand, category
+    weights = (10.0, 1.0, 5.0, 5.0)
+
+    @staticmethod
+    def match_expression(query):
+        """
+        Turn free text into an FTS5 query: every word must match, the last one as a
+        prefix so results show up while the user is typing. Quoting every word
+        keeps FTS5 operators in user input from being interpreted.
+        """
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return None
+        terms = ['"%s"' % token for token in tokens]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+    def search(self, query, offset, limit):
+        match = self.match_expression(query)
+        if match is None:
+            return []
+        sql = (
+            "SELECT rowid FROM {table} WHERE {table} MATCH %s "
+            "ORDER BY bm25({table}, {weights}) LIMIT %s OFFSET %s"
+        ).format(table=self.table, weights=", ".join(str(weight) for weight in self.weights))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self, query):
+        match = self.match_expression(query)
+        if match is None:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM {table} WHERE {table} MATCH %s".format(table=self.table),
+                [match],
+            )
+            return cursor.fetchone()[0]
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s" % self.table)
+            cursor.execute(
+                "INSERT INTO %s(rowid, names, description, brand, category) "
+                "SELECT p.id, p.names, p.description, b.names, c.names "
+                "FROM product_product p "
+                "LEFT JOIN product_brand b ON b.id = p.brand_id "
+                "LEFT JOIN product_category c ON c.id = p.category_id" % self.table
+            )
+            return cursor.rowcount
+
+
+class BasicSearchBackend(SearchBackend):
+    """
+    Unindexed fallback: every word must appear in one of the searched columns
+    """
+
+    def _queryset(self, query):
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return Product.objects.none()
+        queryset = Product.objects.all()
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(names__icontains=token)
+                | Q(description__icontains=token)
+                | Q(brand__names__icontains=token)
+                | Q(category__names__icontains=token)
+            )
+        return queryset
+
+    def search(self, query, offset, limit):
+        queryset = self._queryset(query).order_by("id").values_list("id", flat=True)
+        return list(queryset[offset : offset + limit])
+
+    def count(self, query):
+        return self._queryset(query).count()
+
+    def rebuild(self):
+        return 0
+
+
+def get_search_backend():
+    path = getattr(settings, "SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == "sqlite":
+        return SQLiteFTS5Backend()
+    return BasicSearchBackend()
+
+
+class SearchResults:
+    """
+    Lazy sequence of the products matching a query, in rank order.
+
+    Supports ``count()`` and slicing, which is all the DRF paginators need, so only
+    the requested page is ever fetched.
+    """
+
+    def __init__(self, query, queryset=None, backend=None):
+        self.query = query
+        self.queryset = queryset if queryset is not None else Product.objects.all()
+        self.backend = backend or get_search_backend()
+
+    def count(self):
+        return self.backend.count(self.query)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError("SearchResults only supports slicing")
+        offset = item.start or 0
+        ids = self.backend.search(self.query, offset, item.stop - offset)
+        products = self.queryset.in_bulk(ids)
+        return [products[pk] for pk in ids if pk in products]
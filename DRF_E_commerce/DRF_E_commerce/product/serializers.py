@@ -1,26 +1,170 @@
+from django.db import IntegrityError
+from django.utils.encoding import smart_str
 from rest_framework import serializers
 
+from .breadcrumbs import TREE_COLUMNS
+from .lookups import cached_instance, name_cache
+from .metrics import measure_serialization
 from .models import Brand, Category, Product
+from .sparse import SparseFieldsMixin
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class NameRelatedField(serializers.SlugRelatedField):
+    """
+    SlugRelatedField that first looks the name up in a ``{name: instance}`` map passed
+    in the serializer context as ``"<field name>_lookup"``, so callers that resolved
+    the names in bulk don't pay one query per row. Without one, names are resolved
+    through the in process name cache (see ``lookups.py``).
+    """
+
+    def to_internal_value(self, data):
+        lookup = self.context.get("%s_lookup" % self.field_name)
+        if lookup is not None:
+            try:
+                return lookup[str(data)]
+            except KeyError:
+                self.fail("does_not_exist", slug_name=self.slug_field, value=smart_str(data))
+
+        model = self.get_queryset().model
+        if not isinstance(data, str):
+            return super().to_internal_value(data)
+        instance = cached_instance(model, data)
+        if instance is None:
+            instance = super().to_internal_value(data)
+            name_cache.set(model, data, instance.pk)
+        return instance
+
+
+class TimedSerializerMixin:
+    """
+    Count the serializer time of the request for the performance middleware
+    """
+
+    def to_representation(self, instance):
+        with measure_serialization():
+            return super().to_representation(instance)
+
+
+class CategorySerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ["names"]
 
 
-class BrandSerializer(serializers.ModelSerializer):
+class BrandSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Brand
         fields = "__all__"
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     # Instead of using BrandSerializer and CategorySerializer here,
     # you should specify the respective field names as 'slug' or 'id'
-    brand = serializers.SlugRelatedField(slug_field="names", queryset=Brand.objects.all())
-    category = serializers.SlugRelatedField(slug_field="names", queryset=Category.objects.all())
+    brand = NameRelatedField(slug_field="names", queryset=Brand.objects.all())
+    category = NameRelatedField(slug_field="names", queryset=Category.objects.all())
+    # only with a {category id: path} map of breadcrumbs.py as context["category_paths"]
+    category_path = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = "__all__"
+
+    def __init__(self, *args, fields=None, **kwargs):
+        if fields is not None:
+            fields = [*fields, "category_path"]
+        super().__init__(*args, fields=fields, **kwargs)
+        if "category_paths" not in self.context:
+            self.fields.pop("category_path")
+
+    def get_category_path(self, product):
+        return self.context["category_paths"].get(product.category_id)
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        except IntegrityError:
+            # a brand or category of the name cache deleted by another process since,
+            # the foreign key check fails on the save in autocommit. Look the names up
+            # in the table and retry once
+            stale = {
+                field: value
+                for field, value in self.validated_data.items()
+                if getattr(value, "_from_name_cache", False)
+            }
+            if not stale:
+                raise
+        for field, value in stale.items():
+            name_cache.discard(type(value), value.names)
+            try:
+                self.validated_data[field] = self.fields[field].to_internal_value(value.names)
+            except serializers.ValidationError as exc:
+                raise serializers.ValidationError({field: exc.detail})
+        return super().save(**kwargs)
+
+
+class ProductListSerializer:
+    """
+    Read-only fast path producing the output of ``ProductSerializer(many=True)`` for
+    rows of ``ProductListSerializer.values(queryset)``.
+
+    Brand and category names are joined in SQL and every row becomes a plain dict
+    with ProductSerializer's keys, order and formatting, without instantiating
+    models or going through the fields of a ModelSerializer per row.
+    """
+
+    # queried column -> output key, in ProductSerializer's field order
+    columns = {
+        "id": "id",
+        "brand__names": "brand",
+        "category__names": "category",
+        "names": "names",
+        "description": "description",
+        "is_digital": "is_digital",
+        "updated_at": "updated_at",
+    }
+    updated_at = serializers.DateTimeField()
+
+    def __init__(self, rows, many=True, fields=None, category_paths=None):
+        self.rows = rows
+        self.keys = [key for key in self.columns.values() if fields is None or key in fields]
+        # {category id: path} of breadcrumbs.paths_for_rows(), adds "category_path"
+        self.category_paths = category_paths
+
+    @classmethod
+    def values(cls, queryset, fields=None, breadcrumbs=False):
+        """
+        Select the columns of ``fields`` (default: all), brand and category are only
+        joined when selected. The id is always read, the cursor paginator orders on it.
+        With ``breadcrumbs`` the tree position of the category is read too.
+        """
+        columns = [
+            column
+            for column, key in cls.columns.items()
+            if fields is None or key in fields or key == "id"
+        ]
+        if breadcrumbs:
+            columns += TREE_COLUMNS
+        return queryset.values(*columns)
+
+    @property
+    def data(self):
+        columns = [(column, key) for column, key in self.columns.items() if key in self.keys]
+        # category_path follows the category like in ProductSerializer, selected or not
+        order = list(self.columns.values())
+        split = sum(1 for _, key in columns if order.index(key) <= order.index("category"))
+        before, after = columns[:split], columns[split:]
+        paths = self.category_paths
+        timestamp = self.updated_at.to_representation
+        data = []
+        with measure_serialization():
+            for row in self.rows:
+                if paths is None:
+                    item = {key: row[column] for column, key in columns}
+                else:
+                    item = {key: row[column] for column, key in before}
+                    item["category_path"] = paths.get(row["category_id"])
+                    item.update((key, row[column]) for column, key in after)
+                if "updated_at" in item:
+                    item["updated_at"] = timestamp(item["updated_at"])
+                data.append(item)
+        return data
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from mptt.signals import node_moved
+
+from .autocomplete import autocomplete_index
+from .cache import bump_version
+from .lookups import name_cache
+from .models import Brand, Category, Product, Tombstone
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_version(sender)
+
+
+@receiver(node_moved, sender=Category)
+def invalidate_moved_category(sender, **kwargs):
+    # move_to() updates the tree with bare UPDATEs, no post_save, the cached
+    # breadcrumbs of the subtree change
+    bump_version(sender)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_names(sender, **kwargs):
+    # a rename keeps the id, drop every name of the model rather than look for the old one
+    name_cache.invalidate(sender)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def record_tombstone(sender, instance, **kwargs):
+    # also sent for the products deleted in cascade with their brand
+    Tombstone.objects.create(model=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Category)
+def touch_category_products(sender, instance, **kwargs):
+    # SET_NULL clears product.category with a bare UPDATE, move updated_at for the
+    # sync feed to see those products change
+    Product.objects.filter(category=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def index_name(sender, instance, **kwargs):
+    kind, pk, names = sender._meta.model_name, instance.pk, instance.names
+    transaction.on_commit(lambda: autocomplete_index.upsert(kind, pk, names))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def unindex_name(sender, instance, **kwargs):
+    kind, pk = sender._meta.model_name, instance.pk
+    transaction.on_commit(lambda: autocomplete_index.delete(kind, pk))
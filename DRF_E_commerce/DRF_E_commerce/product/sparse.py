@@ -0,0 +1,66 @@
+"""
+Sparse fieldsets: ``?fields=id,names,brand`` returns only those fields,
+``?omit=description`` every field but those.
+
+The selection prunes the serializer and is pushed down to the query, only the
+selected columns are read and relations that are not selected are not joined.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+def _names(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    return [field.strip() for field in value.split(",") if field.strip()]
+
+
+def selected_fields(params, available):
+    """
+    Names picked by ``?fields=`` / ``?omit=`` out of ``available``, in ``available``
+    order, or None when the request selects nothing. Unknown names are rejected.
+    """
+    fields, omit = _names(params, "fields"), _names(params, "omit")
+    if fields is None and omit is None:
+        return None
+    if fields is not None and omit is not None:
+        raise ValidationError({"fields": ["fields and omit can not be combined."]})
+    name = "fields" if fields is not None else "omit"
+    unknown = [field for field in fields or omit if field not in available]
+    if unknown:
+        raise ValidationError({name: ["Unknown field(s): %s." % ", ".join(unknown)]})
+    if fields is not None:
+        return [field for field in available if field in fields]
+    return [field for field in available if field not in omit]
+
+
+def project(queryset, fields):
+    """
+    Restrict ``queryset`` to the model fields among ``fields`` with ``only()``,
+    relations that are not selected are dropped from ``select_related()``
+    """
+    if fields is None:
+        return queryset
+    model_fields = {field.name: field for field in queryset.model._meta.concrete_fields}
+    columns = [field for field in fields if field in model_fields]
+    relations = [field for field in columns if model_fields[field].is_relation]
+    if isinstance(queryset.query.select_related, dict):
+        joined = [field for field in queryset.query.select_related if field in relations]
+        queryset = queryset.select_related(None)
+        # no arguments would mean every relation
+        if joined:
+            queryset = queryset.select_related(*joined)
+    # the primary key is always loaded, keep only() valid when no column is selected
+    return queryset.only(*(columns or ["pk"]))
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin taking the selected field names as ``fields=``, None keeps them all
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
@@ -0,0 +1,175 @@
+"""
+Incremental catalog sync.
+
+``changes(token)`` returns the products, brands and categories written and the rows
+deleted since a sync token, oldest first, and the token to ask for the next page.
+Writes are found through the ``updated_at`` columns, deletions through the
+``Tombstone`` rows written by ``signals.py``. The token holds a (timestamp, id)
+position per stream, every stream is read with a keyset query on its timestamp
+index, so a page costs the same whatever the catalog size.
+
+Rows newer than ``SAFETY_WINDOW_SECONDS`` aren't served yet: ``updated_at`` is set
+when a row is written, a transaction committing later than a newer one would
+otherwise land behind a position a client has already passed.
+
+Relations are given by id, a brand rename is one brand change and not one change
+per product of the brand.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.fields import DateTimeField
+
+from .models import Brand, Category, Product, Tombstone
+
+DEFAULT_CATALOG_SYNC = {
+    "PAGE_SIZE": 500,
+    "MAX_PAGE_SIZE": 2000,
+    "SAFETY_WINDOW_SECONDS": 5,
+    # tombstones older than this are purged, older tokens need a full resync
+    "TOMBSTONE_RETENTION_DAYS": 30,
+}
+
+# stream name, model, timestamp field, columns of the upsert data
+STREAMS = [
+    ("category", Category, "updated_at", ["id", "names", "parent", "updated_at"]),
+    ("brand", Brand, "updated_at", ["id", "names", "updated_at"]),
+    (
+        "product",
+        Product,
+        "updated_at",
+        ["id", "names", "description", "is_digital", "brand", "category", "updated_at"],
+    ),
+    ("deleted", Tombstone, "deleted_at", ["id", "model", "object_id", "deleted_at"]),
+]
+
+
+def sync_settings():
+    return {**DEFAULT_CATALOG_SYNC, **getattr(settings, "CATALOG_SYNC", {})}
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ExpiredToken(Exception):
+    pass
+
+
+def encode_token(positions, synced_at):
+    data = {
+        "at": synced_at.isoformat(),
+        "positions": {
+            name: [timestamp.isoformat(), pk]
+            for name, (timestamp, pk) in positions.items()
+            if timestamp is not None
+        },
+    }
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    """
+    Return ``({stream: (timestamp, id)}, synced_at)``, raise InvalidToken for anything
+    that isn't a token of ``encode_token``
+    """
+    positions = {name: (None, None) for name, _, _, _ in STREAMS}
+    if not token:
+        return positions, None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        synced_at = parse_datetime(data["at"])
+        for name, (timestamp, pk) in data["positions"].items():
+            timestamp = parse_datetime(timestamp)
+            if name not in positions or not isinstance(pk, int) or timestamp is None:
+                raise InvalidToken()
+            positions[name] = (timestamp, pk)
+    except (ValueError, TypeError, KeyError, binascii.Error, AttributeError):
+        raise InvalidToken()
+    if synced_at is None:
+        raise InvalidToken()
+    return positions, synced_at
+
+
+def _after(field, position):
+    timestamp, pk = position
+    if timestamp is None:
+        return Q()
+    return Q(**{"%s__gt" % field: timestamp}) | Q(**{field: timestamp, "pk__gt": pk})
+
+
+def stream_rows(queryset, field, columns, position, until, limit):
+    """
+    The next ``limit`` rows of a stream after ``position``, up to ``until``
+    """
+    return (
+        queryset.filter(_after(field, position), **{"%s__lte" % field: until})
+        .order_by(field, "pk")
+        .values(*columns)[:limit]
+    )
+
+
+def changes(token=None, limit=None):
+    """
+    Return ``{"changes": [...], "next_token": ..., "has_more": ...}``, at most ``limit``
+    changes. Raises InvalidToken, or ExpiredToken when the deletions since the token
+    may have been purged.
+    """
+    options = sync_settings()
+    limit = min(limit or options["PAGE_SIZE"], options["MAX_PAGE_SIZE"])
+    positions, synced_at = decode_token(token)
+    now = timezone.now()
+    retained = now - datetime.timedelta(days=options["TOMBSTONE_RETENTION_DAYS"])
+    if synced_at is not None and synced_at < retained:
+        raise ExpiredToken()
+    until = now - datetime.timedelta(seconds=options["SAFETY_WINDOW_SECONDS"])
+
+    entries = []
+    for order, (name, model, field, columns) in enumerate(STREAMS):
+        rows = stream_rows(model.objects.all(), field, columns, positions[name], until, limit + 1)
+        entries += [(row[field], order, row["id"], name, row) for row in rows]
+    # one timeline over the streams, the same order whatever the page boundaries
+    entries.sort(key=lambda entry: entry[:3])
+    page = entries[:limit]
+
+    timestamp = DateTimeField().to_representation
+    result = []
+    for changed_at, _, pk, name, row in page:
+        positions[name] = (changed_at, pk)
+        if name == "deleted":
+            result.append(
+                {
+                    "type": row["model"],
+                    "op": "delete",
+                    "id": row["object_id"],
+                    "at": timestamp(changed_at),
+                }
+            )
+        else:
+            data = {**row, "updated_at": timestamp(changed_at)}
+            result.append({"type": name, "op": "upsert", "id": pk, "data": data})
+    has_more = len(entries) > limit
+    # the time up to which the client has seen every change, the deletions after it
+    # must still be there when it comes back
+    synced_at = until if not has_more else synced_at or until
+    return {
+        "changes": result,
+        "next_token": encode_token(positions, synced_at),
+        "has_more": has_more,
+    }
+
+
+def purge_tombstones(days=None):
+    """
+    Delete the tombstones older than the retention, return how many
+    """
+    days = sync_settings()["TOMBSTONE_RETENTION_DAYS"] if days is None else days
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,80 @@
+from django.db.models import Count, Q, Subquery
+from mptt.utils import get_cached_trees
+
+from .deferred_tree import live_positions, live_subtree
+from .models import Category, Product
+
+
+def subtree_filter(root_queryset, prefix=""):
+    """
+    Return a Q matching every category under the node selected by ``root_queryset``,
+    the node itself included.
+
+    The node's tree_id/lft/rght are pulled in as scalar subqueries so the whole thing
+    is a single range predicate inside one SQL statement. ``prefix`` is the path to
+    the category from the filtered model, e.g. ``"category__"`` for products.
+
+    While deferred tree writes are pending the fields are stale, the node is looked up
+    and its subtree taken from the parent links instead (see ``deferred_tree.py``).
+    """
+    positions = live_positions()
+    if positions is not None:
+        root_id = root_queryset.order_by().values_list("pk", flat=True).first()
+        return Q(**{prefix + "pk__in": live_subtree(positions, root_id)})
+    root = root_queryset.order_by()[:1]
+    return Q(
+        **{
+            prefix + "tree_id": Subquery(root.values("tree_id")),
+            prefix + "lft__gte": Subquery(root.values("lft")),
+            prefix + "rght__lte": Subquery(root.values("rght")),
+        }
+    )
+
+
+def category_tree(root_id=None, product_counts=False):
+    """
+    Return the category forest (or the subtree under ``root_id``) as nested dicts.
+
+    The nodes are loaded with one query ordered by tree_id/lft and linked up in memory
+    by ``get_cached_trees``. With ``product_counts`` every node also gets the number of
+    products directly in it and in its whole subtree, from one grouped aggregate.
+    """
+    nodes = Category.objects.only("id", "names", "parent", "tree_id", "lft", "rght", "level")
+    products = Product.objects.all()
+    if root_id is not None:
+        root = Category.objects.filter(pk=root_id)
+        nodes = nodes.filter(subtree_filter(root))
+        products = products.filter(subtree_filter(root, prefix="category__"))
+
+    counts = {}
+    if product_counts:
+        counts = dict(
+            products.order_by()
+            .values("category")
+            .annotate(count=Count("id"))
+            .values_list("category", "count")
+        )
+
+    positions = live_positions()
+    if positions is None:
+        nodes = nodes.order_by("tree_id", "lft")
+    else:
+        # the positions the pending rebuild will write
+        nodes = list(nodes)
+        for node in nodes:
+            node.tree_id, node.lft, node.rght, node.level = positions[node.pk][:4]
+        nodes.sort(key=lambda node: (node.tree_id, node.lft))
+    roots = get_cached_trees(nodes)
+    return [_node_to_dict(node, counts, product_counts) for node in roots]
+
+
+def _node_to_dict(node, counts, product_counts):
+    children = [_node_to_dict(child, counts, product_counts) for child in node.get_children()]
+    data = {"id": node.id, "names": node.names}
+    if product_counts:
+        data["product_count"] = counts.get(node.id, 0)
+        data["total_product_count"] = data["product_count"] + sum(
+            child["total_product_count"] for child in children
+        )
+    data["children"] = children
+    return data
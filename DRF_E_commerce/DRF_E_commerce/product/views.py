@@ -1,39 +1,164 @@
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
+from .autocomplete import CODES, autocomplete_index, autocomplete_settings
+from .batch import batch_max_ids, fetch_batch, parse_ids
+from .breadcrumbs import (
+    breadcrumbs_requested,
+    paths_for_products,
+    paths_for_rows,
+    with_category,
+)
+from .bulk import bulk_upsert_products
+from .cache import cache_stats, cached_response
+from .conditional import conditional_response
+from .deferred_tree import save_category
+from .export import STREAMERS, export_rows
+from .facets import product_facets
+from .filters import filter_products, parse_bool
+from .lookups import resolve_name
+from .metrics import metrics
 from .models import Brand, Category, Product
-from .serializers import BrandSerializer, CategorySerializer, ProductSerializer
+from .pagination import OptInLimitOffsetPagination, ProductCursorPagination, SearchPagination
+from .renderers import CSVRenderer, NDJSONRenderer
+from .routers import read_only
+from .search import SearchResults
+from .serializers import (
+    BrandSerializer,
+    CategorySerializer,
+    ProductListSerializer,
+    ProductSerializer,
+)
+from .sparse import project, selected_fields
+from .sync import ExpiredToken, InvalidToken, changes
+from .tree import category_tree
+
+PRODUCT_FILTER_PARAMETERS = [
+    OpenApiParameter("brand", str, description="brand name or id"),
+    OpenApiParameter("category", str, description="category name or id"),
+    OpenApiParameter("include_descendants", bool, description="match subcategories"),
+    OpenApiParameter("is_digital", bool),
+]
+BATCH_PARAMETERS = [
+    OpenApiParameter(
+        "ids",
+        str,
+        description="comma separated product ids, returned in this order with the missing "
+        "ones listed apart instead of a page",
+    ),
+]
+BREADCRUMBS_PARAMETERS = [
+    OpenApiParameter(
+        "breadcrumbs",
+        bool,
+        description="add category_path, the categories from the root down to the product's",
+    ),
+]
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter("fields", str, description="comma separated fields to return"),
+    OpenApiParameter("omit", str, description="comma separated fields to leave out"),
+]
+
+
+class PaginatedViewSet(viewsets.ViewSet):
+    """
+    Base viewset that paginates list responses with ``pagination_class``
+    """
+
+    pagination_class = None
+
+    def get_queryset(self):
+        # .all() returns a fresh queryset so results are never cached between requests
+        return self.queryset.all()
+
+    def sparse_fields(self, request, serializer_class):
+        """
+        Field names selected with ?fields= / ?omit=, None for all of them
+        """
+        return selected_fields(request.query_params, list(serializer_class().fields))
+
+    def paginated_response(self, request, queryset, serializer_class, fields=None, extra=None):
+        """
+        ``extra(items)`` may return more serializer arguments computed from the items
+        of the page, once per page
+        """
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if page is None:
+            # the paginator is opt-in and the client did not ask for a page
+            kwargs = extra(queryset) if extra else {}
+            return Response(serializer_class(queryset, many=True, fields=fields, **kwargs).data)
+        kwargs = extra(page) if extra else {}
+        serializer = serializer_class(page, many=True, fields=fields, **kwargs)
+        return paginator.get_paginated_response(serializer.data)
 
 
-class CategoryViewSet(viewsets.ViewSet):
+def breadcrumb_tables(request):
+    # the path of a product changes with its category's ancestors, not only with it
+    return [Category] if breadcrumbs_requested(request.query_params) else []
+
+
+class CategoryViewSet(PaginatedViewSet):
     """
     Viewset for viewing all categories
     """
 
-    queryset = Category.objects.all()
+    queryset = Category.objects.order_by("id")
+    pagination_class = OptInLimitOffsetPagination
 
-    @extend_schema(responses=CategorySerializer)
+    @extend_schema(parameters=SPARSE_FIELDS_PARAMETERS, responses=CategorySerializer)
+    @conditional_response(Category)
+    @cached_response(Category)
     def list(self, request):
-        serializer = CategorySerializer(self.queryset, many=True)
-        return Response(serializer.data)
+        fields = self.sparse_fields(request, CategorySerializer)
+        queryset = project(self.get_queryset(), fields)
+        return self.paginated_response(request, queryset, CategorySerializer, fields=fields)
+
+    @action(detail=False)
+    @conditional_response(Category, Product)
+    @cached_response(Category, Product)
+    def tree(self, request):
+        """
+        Nested category tree, or the subtree under ?root=<id>.
+        ?product_counts=true adds direct and subtree product counts to every node
+        """
+        root_id = request.query_params.get("root")
+        if root_id is not None and not root_id.isdigit():
+            return Response({"error": "Category not found"}, status=status.HTTP_400_BAD_REQUEST)
+        product_counts = parse_bool(request.query_params.get("product_counts", False))
+        tree = category_tree(root_id=root_id, product_counts=bool(product_counts))
+        if root_id is not None and not tree:
+            return Response({"error": "Category not found"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(tree)
 
     @extend_schema(request=CategorySerializer, responses=CategorySerializer)
     def create(self, request):
         serializer = CategorySerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            save_category(serializer)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @extend_schema(request=CategorySerializer, responses=CategorySerializer)
+    @extend_schema(
+        parameters=SPARSE_FIELDS_PARAMETERS,
+        request=CategorySerializer,
+        responses=CategorySerializer,
+    )
+    @conditional_response(Category, timestamp_fields=("updated_at",))
+    @cached_response(Category)
     def retrieve(self, request, pk=None):
+        fields = self.sparse_fields(request, CategorySerializer)
         try:
-            retrieved_category = Category.objects.get(pk=pk)
+            retrieved_category = project(Category.objects.all(), fields).get(pk=pk)
         except Category.DoesNotExist:
             return Response({"error": "Category not found"}, status=status.HTTP_400_BAD_REQUEST)
-        serializer = CategorySerializer(retrieved_category)
+        serializer = CategorySerializer(retrieved_category, fields=fields)
         return Response(serializer.data)
 
     @extend_schema(request=CategorySerializer, responses=CategorySerializer)
@@ -45,7 +170,7 @@ class CategoryViewSet(viewsets.ViewSet):
 
         serializer = CategorySerializer(category, data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            save_category(serializer)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -58,22 +183,26 @@ class CategoryViewSet(viewsets.ViewSet):
 
         serializer = CategorySerializer(category, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            save_category(serializer)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class BrandViewSet(viewsets.ViewSet):
+class BrandViewSet(PaginatedViewSet):
     """
     Viewset for viewing all brands
     """
 
-    queryset = Brand.objects.all()
+    queryset = Brand.objects.order_by("id")
+    pagination_class = OptInLimitOffsetPagination
 
-    @extend_schema(responses=BrandSerializer)
+    @extend_schema(parameters=SPARSE_FIELDS_PARAMETERS, responses=BrandSerializer)
+    @conditional_response(Brand)
+    @cached_response(Brand)
     def list(self, request):
-        serializer = BrandSerializer(self.queryset, many=True)
-        return Response(serializer.data)
+        fields = self.sparse_fields(request, BrandSerializer)
+        queryset = project(self.get_queryset(), fields)
+        return self.paginated_response(request, queryset, BrandSerializer, fields=fields)
 
     @extend_schema(request=BrandSerializer, responses=BrandSerializer)
     def create(self, request):
@@ -83,13 +212,18 @@ class BrandViewSet(viewsets.ViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @extend_schema(request=BrandSerializer, responses=BrandSerializer)
+    @extend_schema(
+        parameters=SPARSE_FIELDS_PARAMETERS, request=BrandSerializer, responses=BrandSerializer
+    )
+    @conditional_response(Brand, timestamp_fields=("updated_at",))
+    @cached_response(Brand)
     def retrieve(self, request, pk=None):
+        fields = self.sparse_fields(request, BrandSerializer)
         try:
-            retrieved_brand = Brand.objects.get(pk=pk)
+            retrieved_brand = project(Brand.objects.all(), fields).get(pk=pk)
         except Brand.DoesNotExist:
             return Response({"error": "Brand not found"}, status=status.HTTP_400_BAD_REQUEST)
-        serializer = BrandSerializer(retrieved_brand)
+        serializer = BrandSerializer(retrieved_brand, fields=fields)
         return Response(serializer.data)
 
     @extend_schema(request=BrandSerializer, responses=BrandSerializer)
@@ -134,17 +268,41 @@ class BrandViewSet(viewsets.ViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class ProductViewSet(viewsets.ViewSet):
+class ProductViewSet(PaginatedViewSet):
     """
     Viewset for viewing all products
     """
 
-    queryset = Product.objects.all()
-
-    @extend_schema(responses=ProductSerializer)
+    # brand and category are rendered by name, join them in so serializing N products is one query
+    queryset = Product.objects.select_related("brand", "category")
+    pagination_class = ProductCursorPagination
+
+    @extend_schema(
+        parameters=[
+            *PRODUCT_FILTER_PARAMETERS,
+            *BATCH_PARAMETERS,
+            *BREADCRUMBS_PARAMETERS,
+            *SPARSE_FIELDS_PARAMETERS,
+        ],
+        responses=ProductSerializer,
+    )
+    @conditional_response(Product, Brand, Category)
+    @cached_response(Product, Brand, Category)
     def list(self, request):
-        serializer = ProductSerializer(self.queryset, many=True)
-        return Response(serializer.data)
+        fields = self.sparse_fields(request, ProductSerializer)
+        breadcrumbs = breadcrumbs_requested(request.query_params)
+        queryset = filter_products(self.get_queryset(), request.query_params)
+        if "ids" in request.query_params:
+            ids = parse_ids(request.query_params["ids"])
+            return Response(fetch_batch(queryset, ids, fields, breadcrumbs))
+        # plain rows instead of model instances, see ProductListSerializer
+        return self.paginated_response(
+            request,
+            ProductListSerializer.values(queryset, fields, breadcrumbs),
+            ProductListSerializer,
+            fields=fields,
+            extra=(lambda rows: {"category_paths": paths_for_rows(rows)}) if breadcrumbs else None,
+        )
 
     @extend_schema(request=ProductSerializer, responses=ProductSerializer)
     def create(self, request, *args, **kwargs):
@@ -152,15 +310,16 @@ class ProductViewSet(viewsets.ViewSet):
         brand_name = new_data["brand"]
         category_name = new_data["category"]
 
-        newbrand, _ = Brand.objects.get_or_create(names=brand_name)
-        newcategory, _ = Category.objects.get_or_create(names=category_name)
+        # creates the missing ones and caches their ids, the serializer finds them there
+        resolve_name(Brand, brand_name)
+        resolve_name(Category, category_name)
 
         product_data = {
             "names": new_data["names"],
             "description": new_data["description"],
             "is_digital": new_data["is_digital"],
-            "brand": newbrand,
-            "category": newcategory,
+            "brand": brand_name,
+            "category": category_name,
         }
         serializer = ProductSerializer(data=product_data)
         if serializer.is_valid():
@@ -168,20 +327,148 @@ class ProductViewSet(viewsets.ViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("q", str, required=True),
+            *BREADCRUMBS_PARAMETERS,
+            *SPARSE_FIELDS_PARAMETERS,
+        ],
+        responses=ProductSerializer,
+    )
+    @action(detail=False)
+    @cached_response(Product, Brand, Category)
+    def search(self, request):
+        """
+        Full text search over product, brand and category names and descriptions,
+        best matches first
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        fields = self.sparse_fields(request, ProductSerializer)
+        breadcrumbs = breadcrumbs_requested(request.query_params)
+        queryset = project(self.get_queryset(), with_category(fields) if breadcrumbs else fields)
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(SearchResults(query, queryset), request, view=self)
+        context = {"category_paths": paths_for_products(page)} if breadcrumbs else {}
+        serializer = ProductSerializer(page, many=True, fields=fields, context=context)
+        return paginator.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            *PRODUCT_FILTER_PARAMETERS,
+            *BREADCRUMBS_PARAMETERS,
+            *SPARSE_FIELDS_PARAMETERS,
+        ],
+        request={"application/json": {"type": "object", "properties": {"ids": {"type": "array"}}}},
+    )
+    @action(detail=False, methods=["post"])
+    @read_only
+    def batch(self, request):
+        """
+        The products of the ``ids`` list of the body, for lists too long for ?ids=.
+        At most BATCH_MAX_IDS ids, in one query, missing ids are listed apart
+        """
+        if not isinstance(request.data, dict) or "ids" not in request.data:
+            return Response(
+                {"error": "Expected an object with an ids list, at most %d" % batch_max_ids()},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        fields = self.sparse_fields(request, ProductSerializer)
+        breadcrumbs = breadcrumbs_requested(request.query_params)
+        queryset = filter_products(self.get_queryset(), request.query_params)
+        ids = parse_ids(request.data["ids"])
+        return Response(fetch_batch(queryset, ids, fields, breadcrumbs))
+
+    @extend_schema(request=ProductSerializer(many=True))
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """
+        Create or update (items with an "id") many products in one request
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "Expected a list of products"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        max_items = getattr(settings, "BULK_MAX_ITEMS", 5000)
+        if len(items) > max_items:
+            return Response(
+                {"error": "A bulk request can hold at most %d products" % max_items},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = bulk_upsert_products(items)
+        errors = sum(1 for result in results if result["status"] == "error")
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif errors == len(results):
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response(
+            {"succeeded": len(results) - errors, "failed": errors, "results": results},
+            status=response_status,
+        )
+
+    @extend_schema(parameters=PRODUCT_FILTER_PARAMETERS)
+    @action(detail=False)
+    @conditional_response(Product, Brand, Category)
+    @cached_response(Product, Brand, Category)
+    def facets(self, request):
+        """
+        Product counts per brand, per category (subcategories included) and per
+        is_digital, for the same filter parameters as the product list
+        """
+        queryset = filter_products(Product.objects.all(), request.query_params)
+        return Response(product_facets(queryset))
+
+    @extend_schema(responses={(200, "application/x-ndjson"): str, (200, "text/csv"): str})
+    @action(detail=False, renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream the whole catalog as NDJSON (default) or CSV (?format=csv),
+        filtered with the same parameters as the product list
+        """
+        rows = export_rows(filter_products(Product.objects.all(), request.query_params))
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            STREAMERS[renderer.format](rows),
+            content_type="%s; charset=utf-8" % renderer.media_type,
+        )
+        response["Content-Disposition"] = 'attachment; filename="catalog.%s"' % renderer.format
+        return response
+
     # retrieve each product separately
-    @extend_schema(request=ProductSerializer, responses=ProductSerializer)
+    @extend_schema(
+        parameters=[*BREADCRUMBS_PARAMETERS, *SPARSE_FIELDS_PARAMETERS],
+        request=ProductSerializer,
+        responses=ProductSerializer,
+    )
+    @conditional_response(
+        Product,
+        Brand,
+        Category,
+        timestamp_fields=("updated_at", "brand__updated_at", "category__updated_at"),
+        depends_on=breadcrumb_tables,
+    )
+    @cached_response(Product, Brand, Category)
     def retrieve(self, request, pk):
+        fields = self.sparse_fields(request, ProductSerializer)
+        breadcrumbs = breadcrumbs_requested(request.query_params)
+        queryset = project(self.get_queryset(), with_category(fields) if breadcrumbs else fields)
         try:
-            retrieved_product = Product.objects.get(pk=pk)
+            retrieved_product = queryset.get(pk=pk)
         except Product.DoesNotExist:
             return Response({"error": "Product not found"}, status=status.HTTP_400_BAD_REQUEST)
-        serializer = ProductSerializer(retrieved_product)
+        context = {"category_paths": paths_for_products([retrieved_product])} if breadcrumbs else {}
+        serializer = ProductSerializer(retrieved_product, fields=fields, context=context)
         return Response(serializer.data)
 
     @extend_schema(request=ProductSerializer, responses=ProductSerializer)
     def update(self, request, pk):
         try:
-            requested_data = Product.objects.get(pk=pk)
+            requested_data = self.get_queryset().get(pk=pk)
         except Product.DoesNotExist:
             return Response(
                 {"error": "Product does not exists"}, status=status.HTTP_400_BAD_REQUEST
@@ -189,16 +476,16 @@ class ProductViewSet(viewsets.ViewSet):
 
         updated_data = request.data
         brand_name = updated_data["brand"]
-        updated_brand, _ = Brand.objects.get_or_create(names=brand_name)
+        resolve_name(Brand, brand_name)
         category_name = updated_data["category"]
-        updated_category, _ = Category.objects.get_or_create(names=category_name)
+        resolve_name(Category, category_name)
 
         product_data = {
             "names": updated_data["names"],
             "description": updated_data["description"],
             "is_digital": updated_data["is_digital"],
-            "brand": updated_brand,
-            "category": updated_category,
+            "brand": brand_name,
+            "category": category_name,
         }
         serializer = ProductSerializer(requested_data, product_data)
         if serializer.is_valid():
@@ -209,7 +496,7 @@ class ProductViewSet(viewsets.ViewSet):
     @extend_schema(request=ProductSerializer, responses=ProductSerializer)
     def partial_update(self, request, pk):
         try:
-            requested_data = Product.objects.get(pk=pk)
+            requested_data = self.get_queryset().get(pk=pk)
         except Product.DoesNotExist:
             return Response(
                 {"error": "Product does not exists"}, status=status.HTTP_400_BAD_REQUEST
@@ -217,16 +504,16 @@ class ProductViewSet(viewsets.ViewSet):
 
         updated_data = request.data
         brand_name = updated_data["brand"]
-        updated_brand, _ = Brand.objects.get_or_create(names=brand_name)
+        resolve_name(Brand, brand_name)
         category_name = updated_data["category"]
-        updated_category, _ = Category.objects.get_or_create(names=category_name)
+        resolve_name(Category, category_name)
 
         product_data = {
             "names": updated_data["names"],
             "description": updated_data["description"],
             "is_digital": updated_data["is_digital"],
-            "brand": updated_brand,
-            "category": updated_category,
+            "brand": brand_name,
+            "category": category_name,
         }
         serializer = ProductSerializer(requested_data, product_data, partial=True)
         if serializer.is_valid():
@@ -242,3 +529,86 @@ class ProductViewSet(viewsets.ViewSet):
             return Response({"error": "Product not found"}, status=status.HTTP_400_BAD_REQUEST)
         data_to_destroy.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter("q", str, required=True, description="name prefix"),
+        OpenApiParameter("limit", int, description="suggestions to return, 10 by default"),
+        OpenApiParameter("type", str, description="comma separated product, brand, category"),
+    ],
+    responses=dict,
+)
+@api_view(["GET"])
+def autocomplete(request):
+    """
+    Product, brand and category names starting with ?q=, from an in memory index
+    """
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+    max_results = autocomplete_settings()["MAX_RESULTS"]
+    limit = request.query_params.get("limit", "10")
+    if not limit.isdigit() or not 1 <= int(limit) <= max_results:
+        return Response(
+            {"error": "limit must be between 1 and %d" % max_results},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    kinds = [kind for kind in request.query_params.get("type", "").split(",") if kind]
+    if any(kind not in CODES for kind in kinds):
+        return Response(
+            {"error": "type must be product, brand or category"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response({"results": autocomplete_index.suggest(query, int(limit), kinds)})
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter("token", str, description="next_token of the previous page"),
+        OpenApiParameter("limit", int, description="changes per page"),
+    ],
+    responses=dict,
+)
+@api_view(["GET"])
+def catalog_changes(request):
+    """
+    Products, brands and categories written or deleted since ?token=, oldest first.
+    Without a token the whole catalog, page through with next_token while has_more
+    """
+    limit = request.query_params.get("limit")
+    if limit is not None and (not limit.isdigit() or int(limit) < 1):
+        return Response(
+            {"error": "limit must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        page = changes(request.query_params.get("token"), int(limit) if limit else None)
+    except InvalidToken:
+        return Response({"error": "Invalid sync token"}, status=status.HTTP_400_BAD_REQUEST)
+    except ExpiredToken:
+        return Response(
+            {"error": "The sync token has expired, sync again without a token"},
+            status=status.HTTP_410_GONE,
+        )
+    return Response(page)
+
+
+@extend_schema(responses=dict)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def response_cache_stats(request):
+    """
+    Hit and miss counters of the response cache in this process, for staff users
+    """
+    return Response(cache_stats.snapshot())
+
+
+@extend_schema(exclude=True)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def request_metrics(request):
+    """
+    Request metrics of this process in the Prometheus text format, for staff users.
+    Scrape it with the basic_auth of a staff account.
+    """
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
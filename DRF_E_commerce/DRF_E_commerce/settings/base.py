@@ -26,6 +26,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first so it times everything below it, a no-op unless PERFORMANCE_METRICS is enabled
+    "DRF_E_commerce.product.middleware.PerformanceMiddleware",
+    # pins writes and the reads right after them to the primary, a no-op without replicas
+    "DRF_E_commerce.product.middleware.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -97,8 +101,81 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-REST_FRAMEWORK = {"DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema"}
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "drf-e-commerce",
+    }
+}
+
+# cache of the catalog GET endpoints, invalidated through per model version counters.
+# the counters live in the cache, so run several workers on a shared cache backend
+RESPONSE_CACHE = {
+    "ALIAS": "default",
+    "TIMEOUT": 300,
+    "ENABLED": True,
+}
+
+# per request SQL/serializer/render timings, Server-Timing header, /api/metrics/
+# histograms and a slow request log, see product/metrics.py for the other options
+PERFORMANCE_METRICS = {
+    "ENABLED": os.environ.get("PERFORMANCE_METRICS", "").lower() in ("1", "true", "yes"),
+    "SLOW_REQUEST_MS": 500,
+}
+
+# the catalog reads of API requests go to the replica aliases of DATABASES listed here,
+# commands and background threads read the primary, see product/routers.py
+DATABASE_ROUTERS = ["DRF_E_commerce.product.routers.ReplicaRouter"]
+
+DATABASE_REPLICAS = {
+    "ALIASES": [],
+    # a client reads from the primary for this long after one of its writes
+    "READ_YOUR_WRITES_SECONDS": 5,
+    "MAX_LAG_SECONDS": 30,
+    "HEALTH_CHECK_INTERVAL": 10,
+}
+
+REST_FRAMEWORK = {
+    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # same bytes as DRF's JSONRenderer, encoded with orjson when it is installed
+    "DEFAULT_RENDERER_CLASSES": [
+        "DRF_E_commerce.product.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# default number of products per page, clients can ask for more with ?page_size=
+PRODUCT_PAGE_SIZE = 50
+# upper bound for ?page_size= (products) and ?limit= (brands, categories)
+MAX_PAGE_SIZE = 500
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "Django DRF Ecommerce",
 }
+
+# bulk product endpoint: rows per INSERT/UPDATE statement and max items per request
+BULK_BATCH_SIZE = 500
+BULK_MAX_ITEMS = 5000
+# /api/sync/ changes feed, see product/sync.py for the other options. Run
+# `manage.py purge_tombstones` daily, tokens older than the retention get a 410
+CATALOG_SYNC = {
+    "PAGE_SIZE": 500,
+    "SAFETY_WINDOW_SECONDS": 5,
+    "TOMBSTONE_RETENTION_DAYS": 30,
+}
+# /api/autocomplete/ in memory name index, see product/autocomplete.py. MAX_ENTRIES
+# bounds its memory, about 180 bytes per name
+AUTOCOMPLETE = {
+    "MAX_ENTRIES": 1_000_000,
+    "MAX_AGE_SECONDS": 600,
+}
+# category writes journaled and the tree renumbered in the background in batches,
+# see product/deferred_tree.py. Bulk category inserts go through the worker even
+# with DEFERRED off. WORKER None leaves it to `manage.py rebuild_category_tree --watch`
+CATEGORY_TREE = {
+    "DEFERRED": False,
+    "WORKER": "thread",
+    "COALESCE_SECONDS": 1.0,
+}
+# ids of one batch retrieve, GET /api/product/?ids= or POST /api/product/batch/
+BATCH_MAX_IDS = 200
@@ -10,3 +10,14 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+
+# SQLITE_REPLICAS=2 adds two replica files, copies of db.sqlite3 made by
+# `manage.py sync_replicas`, to try the replica routing locally
+for index in range(int(os.environ.get("SQLITE_REPLICAS", 0))):
+    alias = "replica_%d" % index
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / ('db.replica%d.sqlite3' % index),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS["ALIASES"].append(alias)
@@ -0,0 +1,64 @@
+import argparse
+
+import pytest
+
+from DRF_E_commerce.benchmarks.load import load, mix_item, summary, windows
+
+
+class FakeTarget:
+    def __init__(self):
+        self.requests = []
+
+    def get_json(self, path, query):
+        return {
+            "/api/product/": {"results": [{"id": 1}, {"id": 2}]},
+            "/api/brand/": {"results": [{"id": 3, "names": "Acme"}]},
+            "/api/category/tree/": [
+                {
+                    "id": 4,
+                    "names": "Books",
+                    "children": [{"id": 5, "names": "Novels", "children": []}],
+                }
+            ],
+        }[path]
+
+    def request(self, method, path, query, body):
+        self.requests.append((method, path))
+        if method == "POST":
+            return 500, b"database is locked", True
+        return 200, b"{}", False
+
+
+class TestLoad:
+    def test_mix_item(self):
+        assert mix_item("product.list=3") == ("product.list", 3.0)
+        assert mix_item("brand.create") == ("brand.create", 1.0)
+        with pytest.raises(argparse.ArgumentTypeError):
+            mix_item("order.list=1")
+
+    def test_windows(self):
+        samples = [
+            (0.1, "product.list", 10.0, 200, False),
+            (0.9, "product.create", 30.0, 500, True),
+            (2.5, "product.list", 20.0, 200, False),
+        ]
+        first, empty, last = windows(samples, 1)
+        assert (first["requests"], first["errors"], first["locked"]) == (2, 1, 1)
+        assert empty["requests"] == 0
+        assert last["start_s"] == 2 and last["p50_ms"] == 20.0
+
+    def test_run(self):
+        target = FakeTarget()
+        mix = {"product.retrieve": 1, "category.retrieve": 1, "product.create": 1}
+        recorder = load(target, mix, concurrency=2, duration=0.2, interval=0.1)
+        results = summary(recorder.samples, 0.2, 0.1)
+        assert set(results["operations"]) == set(mix)
+        create = results["operations"]["product.create"]
+        assert create["errors"] == create["locked"] == create["requests"] > 0
+        assert {path for _, path in target.requests} <= {
+            "/api/product/",
+            "/api/product/1/",
+            "/api/product/2/",
+            "/api/category/4/",
+            "/api/category/5/",
+        }
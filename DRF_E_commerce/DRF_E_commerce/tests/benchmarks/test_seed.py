@@ -0,0 +1,22 @@
+import pytest
+
+from DRF_E_commerce.benchmarks.seed import seed_catalog
+from DRF_E_commerce.product.models import Category, Product
+
+pytestmark = pytest.mark.django_db
+
+
+class TestSeedCatalog:
+    def test_seeded_tree_matches_mptt(self):
+        seed_catalog(50, brands=3, categories=40, fanout=3)
+        assert Product.objects.count() == 50
+
+        def tree_fields():
+            return list(
+                Category.objects.order_by("id").values_list("tree_id", "lft", "rght", "level")
+            )
+
+        seeded = tree_fields()
+        # a rebuild from the parent links must not move anything
+        Category.objects.rebuild()
+        assert tree_fields() == seeded
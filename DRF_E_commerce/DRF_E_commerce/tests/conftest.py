@@ -1,7 +1,16 @@
+from contextlib import contextmanager
+
 import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from pytest_factoryboy import register
 from rest_framework.test import APIClient
 
+from DRF_E_commerce.product.autocomplete import autocomplete_index
+from DRF_E_commerce.product.lookups import name_cache
+from DRF_E_commerce.product.routers import ReplicaRouter, replica_health
+
 from .factories import BrandFactory, CategoryFactory, ProductFactory
 
 register(CategoryFactory)
@@ -12,6 +21,62 @@ register(ProductFactory)
 # provides a way to include the resources that we created more than once
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # the local memory cache outlives the test database, start every test empty
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_name_cache():
+    # ids of rolled back rows would be reused by the next test
+    name_cache.clear()
+    yield
+    name_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_autocomplete_index():
+    # built from the rows of the test that first used it
+    autocomplete_index.reset()
+    yield
+    autocomplete_index.reset()
+
+
 @pytest.fixture
 def api_client():
     return APIClient
+
+
+@pytest.fixture
+def query_budget():
+    # fails the test when the block runs more queries than the budget allows,
+    # use the same budget for several result sizes to catch N+1 queries
+    @contextmanager
+    def _query_budget(budget):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = [query["sql"] for query in context.captured_queries]
+        assert len(executed) <= budget, "%d queries, budget is %d:\n%s" % (
+            len(executed),
+            budget,
+            "\n".join(executed),
+        )
+
+    return _query_budget
+
+
+REPLICAS = ["replica_0", "replica_1"]
+
+
+@pytest.fixture
+def replicas(settings, monkeypatch):
+    settings.DATABASE_REPLICAS = {"ALIASES": REPLICAS, "READ_YOUR_WRITES_SECONDS": 5}
+    # the test settings have no replica connection, a read routed there fails
+    monkeypatch.setattr(ReplicaRouter, "replicas", lambda self: REPLICAS)
+    for alias in REPLICAS:
+        replica_health.mark(alias, True)
+    yield
+    replica_health.reset()
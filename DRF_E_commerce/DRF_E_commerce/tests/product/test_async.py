@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.django_db
+
+
+class TestAsyncViews:
+    # the async views must answer exactly like the sync viewsets
+
+    @pytest.mark.parametrize("resource", ["product", "brand", "category"])
+    def test_list_matches_sync(self, resource, product_factory, api_client):
+        product_factory.create_batch(3)
+        sync = api_client().get("/api/%s/" % resource)
+        response = api_client().get("/api/async/%s/" % resource)
+        assert response.status_code == 200
+        assert json.loads(response.content) == json.loads(sync.content)
+
+    @pytest.mark.parametrize("resource", ["product", "brand", "category"])
+    def test_retrieve_matches_sync(self, resource, product_factory, api_client):
+        product = product_factory()
+        pk = {"product": product, "brand": product.brand, "category": product.category}[
+            resource
+        ].pk
+        sync = api_client().get("/api/%s/%d/" % (resource, pk))
+        response = api_client().get("/api/async/%s/%d/" % (resource, pk))
+        assert response.status_code == 200
+        assert json.loads(response.content) == json.loads(sync.content)
+
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"ids": True},
+            {"ids": True, "breadcrumbs": "true", "fields": "names"},
+            {"breadcrumbs": "true"},
+            {"breadcrumbs": "maybe"},
+        ],
+    )
+    def test_batch_and_breadcrumbs_match_sync(
+        self, params, product_factory, category_factory, api_client
+    ):
+        category = category_factory(parent=category_factory(names="Home"))
+        products = product_factory.create_batch(3, category=category)
+        if params.get("ids"):
+            params["ids"] = "%d,%d,999" % (products[2].pk, products[0].pk)
+        sync = api_client().get("/api/product/", params)
+        response = api_client().get("/api/async/product/", params)
+        assert response.status_code == sync.status_code
+        assert json.loads(response.content) == json.loads(sync.content)
+
+        sync = api_client().get("/api/product/%d/" % products[0].pk, params)
+        response = api_client().get("/api/async/product/%d/" % products[0].pk, params)
+        assert json.loads(response.content) == json.loads(sync.content)
+
+    def test_product_cursor_pages(self, product_factory, api_client):
+        ids = [product.id for product in product_factory.create_batch(5)]
+        client = api_client()
+        seen, url = [], "/api/async/product/?page_size=2"
+        while url:
+            data = json.loads(client.get(url).content)
+            seen += [row["id"] for row in data["results"]]
+            url = data["next"]
+        assert seen == ids
+        previous = json.loads(client.get(data["previous"]).content)
+        assert [row["id"] for row in previous["results"]] == ids[2:4]
+
+    def test_product_filters(self, product_factory, api_client):
+        product_factory(is_digital=True)
+        product_factory(is_digital=False)
+        response = api_client().get("/api/async/product/", {"is_digital": "true"})
+        results = json.loads(response.content)["results"]
+        assert [row["is_digital"] for row in results] == [True]
+
+        response = api_client().get("/api/async/product/", {"is_digital": "maybe"})
+        assert response.status_code == 400
+
+    def test_brand_limit_offset(self, brand_factory, api_client):
+        brand_factory.create_batch(10)
+        response = api_client().get("/api/async/brand/", {"limit": 3, "offset": 6})
+        data = json.loads(response.content)
+        assert data["count"] == 10
+        assert len(data["results"]) == 3
+
+    def test_unknown_and_read_only(self, api_client):
+        response = api_client().get("/api/async/product/999/")
+        assert response.status_code == 400
+        assert json.loads(response.content) == {"error": "Product not found"}
+        assert api_client().post("/api/async/brand/", {}).status_code == 405
@@ -0,0 +1,112 @@
+import pytest
+
+from DRF_E_commerce.product import autocomplete
+from DRF_E_commerce.product.autocomplete import PrefixIndex, autocomplete_index, fold
+
+pytestmark = pytest.mark.django_db
+
+ENDPOINT = "/api/autocomplete/"
+
+
+def names(response):
+    return [(row["type"], row["names"]) for row in response.json()["results"]]
+
+
+class TestAutocomplete:
+    def test_ranked_suggestions(self, brand_factory, category_factory, product_factory, api_client):
+        brand = brand_factory(names="Phone Co")
+        category = category_factory(names="Phones")
+        product_factory(names="Phone", brand=brand, category=category)
+        product_factory(names="Photo frame", brand=brand, category=category)
+        product_factory(names="Tablet", brand=brand, category=category)
+
+        response = api_client().get(ENDPOINT, {"q": "pho"})
+        assert names(response) == [
+            ("product", "Phone"),
+            ("category", "Phones"),
+            ("brand", "Phone Co"),
+            ("product", "Photo frame"),
+        ]
+        response = api_client().get(ENDPOINT, {"q": "PHO", "limit": 1, "type": "brand"})
+        assert names(response) == [("brand", "Phone Co")]
+
+    def test_follows_committed_writes(
+        self, product_factory, api_client, django_capture_on_commit_callbacks
+    ):
+        product = product_factory(names="Kettle")
+        client = api_client()
+        assert names(client.get(ENDPOINT, {"q": "ket"})) == [("product", "Kettle")]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            product.names = "Toaster"
+            product.save()
+        assert names(client.get(ENDPOINT, {"q": "ket"})) == []
+        assert names(client.get(ENDPOINT, {"q": "toa"})) == [("product", "Toaster")]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            product.delete()
+        assert names(client.get(ENDPOINT, {"q": "toa"})) == []
+
+    def test_bulk_writes_mark_the_index_stale(
+        self, brand_factory, category_factory, api_client, django_capture_on_commit_callbacks
+    ):
+        brand, category = brand_factory(), category_factory()
+        api_client().get(ENDPOINT, {"q": "x"})
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client().post(
+                "/api/product/bulk/",
+                [{"names": "Bulk", "brand": brand.names, "category": category.names}],
+                format="json",
+            )
+        assert autocomplete_index._stale
+
+    @pytest.mark.parametrize(
+        "params", [{}, {"q": "a", "limit": "0"}, {"q": "a", "limit": "51"}, {"q": "a", "type": "x"}]
+    )
+    def test_bad_parameters(self, params, api_client):
+        assert api_client().get(ENDPOINT, params).status_code == 400
+
+
+class TestPrefixIndex:
+    def index(self, count):
+        index = PrefixIndex()
+        index._entries, index._built_at = [], 0
+        for pk in range(count):
+            index.upsert("product", pk, "Item %03d" % pk)
+        return index
+
+    def test_memoized_wide_prefixes(self, settings):
+        settings.AUTOCOMPLETE = {"SCAN_LIMIT": 5, "MAX_AGE_SECONDS": None}
+        index = self.index(20)
+        assert [row["names"] for row in index.suggest("item", 2)] == ["Item 000", "Item 001"]
+        assert "item" in index._memo
+        # a write under the prefix drops its ranking
+        index.upsert("brand", 1, "Item")
+        assert "item" not in index._memo
+        assert index.suggest("item", 1) == [{"type": "brand", "id": 1, "names": "Item"}]
+
+    def test_bounded(self, settings):
+        settings.AUTOCOMPLETE = {"MAX_ENTRIES": 3, "MAX_AGE_SECONDS": None}
+        index = self.index(5)
+        assert index.stats()["entries"] == 3
+        assert index.stats()["full"]
+
+    def test_single_background_rebuild(self, settings, monkeypatch):
+        settings.AUTOCOMPLETE = {"MAX_AGE_SECONDS": None}
+        started = []
+        monkeypatch.setattr(
+            autocomplete.threading.Thread, "start", lambda thread: started.append(thread)
+        )
+        index = self.index(1)
+        index.mark_stale()
+        for _ in range(3):
+            index.ensure_built()
+        assert len(started) == 1
+        # once it ran, a later bulk write gets its own rebuild
+        started[0].run()
+        index.mark_stale()
+        index.ensure_built()
+        assert len(started) == 2
+
+    def test_fold(self):
+        assert fold("Crème BRÛLÉE") == "creme brulee"
@@ -0,0 +1,135 @@
+import json
+
+import pytest
+from rest_framework.exceptions import ValidationError
+
+from DRF_E_commerce.product.cache import cache_stats
+from DRF_E_commerce.product.lookups import name_cache, resolve_name
+from DRF_E_commerce.product.models import Brand, Category
+from DRF_E_commerce.product.serializers import ProductSerializer
+
+pytestmark = pytest.mark.django_db
+
+
+class TestResponseCache:
+    endpoint = "/api/product/"
+
+    def test_second_request_is_served_from_cache(
+        self, product_factory, api_client, query_budget
+    ):
+        cache_stats.reset()
+        product_factory.create_batch(3)
+        client = api_client()
+        first = client.get(self.endpoint)
+        with query_budget(0):
+            second = client.get(self.endpoint)
+        assert first.content == second.content
+        assert cache_stats.snapshot()["ProductViewSet.list"] == {"hits": 1, "misses": 1}
+
+    def test_query_string_is_part_of_the_key(self, product_factory, api_client):
+        product_factory.create_batch(3)
+        client = api_client()
+        client.get(self.endpoint)
+        response = client.get(self.endpoint, {"page_size": 1})
+        assert len(json.loads(response.content)["results"]) == 1
+
+    def test_save_invalidates(self, product_factory, api_client):
+        product = product_factory(names="before")
+        client = api_client()
+        client.get(self.endpoint)
+        # a brand rename changes the product list too
+        product.brand.names = "renamed_brand"
+        product.brand.save()
+        row = json.loads(client.get(self.endpoint).content)["results"][0]
+        assert row["brand"] == "renamed_brand"
+
+    def test_delete_invalidates(self, brand_factory, api_client):
+        brands = brand_factory.create_batch(2)
+        client = api_client()
+        client.get("/api/brand/")
+        client.delete("/api/brand/%d/" % brands[0].id)
+        assert len(json.loads(client.get("/api/brand/").content)) == 1
+
+    def test_bulk_endpoint_invalidates(self, brand_factory, category_factory, api_client):
+        brand, category = brand_factory(), category_factory()
+        client = api_client()
+        client.get(self.endpoint)
+        item = {"names": "new", "brand": brand.names, "category": category.names}
+        client.post(self.endpoint + "bulk/", [item], format="json")
+        assert len(json.loads(client.get(self.endpoint).content)["results"]) == 1
+
+    def test_stats_endpoint(self, api_client, admin_user):
+        cache_stats.reset()
+        client = api_client()
+        client.get("/api/category/")
+        assert client.get("/api/cache/stats/").status_code == 403
+        client.force_authenticate(admin_user)
+        stats = json.loads(client.get("/api/cache/stats/").content)
+        assert stats == {"CategoryViewSet.list": {"hits": 0, "misses": 1}}
+
+
+class TestNameLookupCache:
+    def test_resolve_name(self, brand_factory, query_budget):
+        brand = brand_factory()
+        assert resolve_name(Brand, brand.names) == brand.id
+        with query_budget(0):
+            assert resolve_name(Brand, brand.names) == brand.id
+
+    def test_creates_missing(self):
+        category_id = resolve_name(Category, "new_category")
+        assert Category.objects.get(names="new_category").id == category_id
+
+    def test_rename_invalidates(self, brand_factory):
+        brand = brand_factory(names="before")
+        resolve_name(Brand, "before")
+        brand.names = "after"
+        brand.save()
+        assert name_cache.get(Brand, "before") is None
+        assert resolve_name(Brand, "before") != brand.id
+
+    def test_delete_invalidates(self, category_factory):
+        category = category_factory()
+        resolve_name(Category, category.names)
+        category.delete()
+        assert name_cache.get(Category, category.names) is None
+
+    def test_bounded(self, settings):
+        settings.NAME_LOOKUP_CACHE = {"MAX_SIZE": 2}
+        name_cache.set(Brand, "a", 1)
+        name_cache.set(Brand, "b", 2)
+        # a is now the most recently used, b gets evicted
+        assert name_cache.get(Brand, "a") == 1
+        name_cache.set(Brand, "c", 3)
+        assert len(name_cache) == 2
+        assert name_cache.get(Brand, "b") is None
+        assert name_cache.get(Brand, "a") == 1
+
+    def test_expires(self, settings):
+        settings.NAME_LOOKUP_CACHE = {"TIMEOUT": 0}
+        name_cache.set(Brand, "a", 1)
+        assert name_cache.get(Brand, "a") is None
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize("recreated", [True, False])
+    def test_row_deleted_by_another_process(self, recreated, product_factory, brand_factory):
+        product = product_factory()
+        brand = brand_factory(names="gone")
+        Brand.objects.filter(pk=brand.pk).delete()
+        stale_pk = brand.pk
+        if recreated:
+            brand = brand_factory(names="gone")
+        # the name cache of another process still holds the id
+        name_cache.set(Brand, "gone", stale_pk)
+        data = {"names": product.names, "brand": "gone", "category": product.category.names}
+        serializer = ProductSerializer(product, data)
+        assert serializer.is_valid()
+        if recreated:
+            serializer.save()
+            product.refresh_from_db()
+            assert product.brand_id == brand.pk
+            assert name_cache.get(Brand, "gone") == brand.pk
+        else:
+            with pytest.raises(ValidationError) as exc:
+                serializer.save()
+            assert list(exc.value.detail) == ["brand"]
+            assert name_cache.get(Brand, "gone") is None
@@ -0,0 +1,168 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from DRF_E_commerce.product.audit import CanonicalQuery, explain_query, full_scans
+from DRF_E_commerce.product.metrics import metrics
+from DRF_E_commerce.product.models import Category, Product
+from DRF_E_commerce.product.routers import replica_reads
+
+pytestmark = pytest.mark.django_db
+
+
+class TestExportCatalogCommand:
+    def test_export_to_file(self, product_factory, tmp_path):
+        products = product_factory.create_batch(3)
+        output = tmp_path / "catalog.ndjson"
+        call_command("export_catalog", "--output", str(output), "--chunk-size", "2")
+        rows = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [row["id"] for row in rows] == [product.id for product in products]
+
+
+class TestRebuildSearchIndexCommand:
+    def test_rebuild(self, product_factory, api_client):
+        product = product_factory(names="Espresso machine")
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM product_product_fts")
+        assert api_client().get("/api/product/search/", {"q": "espresso"}).data["count"] == 0
+
+        out = io.StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        assert "indexed 1 products" in out.getvalue()
+        response = api_client().get("/api/product/search/", {"q": "espresso"})
+        assert [row["id"] for row in response.data["results"]] == [product.id]
+
+
+class TestExplainQueriesCommand:
+    def test_no_unexpected_full_scans(self, product_factory):
+        product_factory.create_batch(3)
+        out = io.StringIO()
+        # raises CommandError when a canonical query reads a whole table
+        call_command("explain_queries", stdout=out)
+        assert "no unexpected full table scans" in out.getvalue()
+
+    def test_flags_full_scans(self):
+        plan = "SCAN product_product\nSEARCH product_brand USING INTEGER PRIMARY KEY (rowid=?)"
+        assert full_scans(plan, "sqlite") == ["product_product"]
+        index_scan = "SCAN product_product USING COVERING INDEX product_names_idx"
+        assert full_scans(index_scan, "sqlite") == ["product_product"]
+        assert full_scans(index_scan, "sqlite", index_scans=False) == []
+        search = "SEARCH product_product USING INDEX product_names_idx (names=?)"
+        assert full_scans(search, "sqlite") == []
+        assert full_scans("Seq Scan on product_product  (cost=0.00..1.01)", "postgresql") == [
+            "product_product"
+        ]
+
+    def test_flags_unindexed_filter_sorted_by_an_index(self):
+        # no index on description, SQLite walks the whole names index to skip the sort
+        queryset = Product.objects.filter(description="x").order_by("names")
+        query = CanonicalQuery("product.by_description", lambda: list(queryset), False)
+        [(sql, plan)] = explain_query(query)
+        assert "USING INDEX" in plan
+        assert full_scans(plan, connection.vendor) == ["product_product"]
+
+
+class TestImportCatalogCommand:
+    def run(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_catalog", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_round_trip_with_export(self, product_factory, tmp_path):
+        product_factory.create_batch(4)
+        export = tmp_path / "catalog.csv"
+        call_command("export_catalog", "--format", "csv", "--output", str(export))
+        expected = list(
+            Product.objects.order_by("id").values_list("id", "names", "brand__names")
+        )
+        Product.objects.all().delete()
+
+        out, _ = self.run(str(export), "--batch-size", "3")
+        assert "4 rows: 4 created, 0 updated, 0 errors" in out
+        assert (
+            list(Product.objects.order_by("id").values_list("id", "names", "brand__names"))
+            == expected
+        )
+        # the ids are upserted, importing again changes nothing
+        out, _ = self.run(str(export))
+        assert "0 created, 4 updated" in out
+        assert Product.objects.count() == 4
+
+    def test_category_paths_build_a_valid_tree(self, brand_factory, tmp_path, query_budget):
+        brand = brand_factory()
+        source = tmp_path / "catalog.jsonl"
+        rows = [
+            {"names": "p%d" % i, "brand": brand.names, "category": path}
+            for i, path in enumerate(
+                ["Home > Kitchen > Knives", "Home > Kitchen", "Home > Garden", "Toys"] * 5
+            )
+        ]
+        source.write_text("\n".join(json.dumps(row) for row in rows))
+        # one insert per tree level and per table, one renumbering of the tree
+        with query_budget(30):
+            self.run(str(source), "--category-separator", ">", "--batch-size", "50")
+
+        home = Category.objects.get(names="Home")
+        assert [c.names for c in home.get_descendants()] == ["Garden", "Kitchen", "Knives"]
+        assert Category.objects.get(names="Knives").parent.names == "Kitchen"
+        assert Product.objects.filter(category__names="Knives").count() == 5
+        assert Category.objects.filter(lft=0).count() == 0
+
+    def test_tree_is_renumbered_once(self, brand_factory, tmp_path):
+        brand = brand_factory()
+        source = tmp_path / "catalog.jsonl"
+        rows = [{"names": "p", "brand": brand.names, "category": "c%d" % i} for i in range(6)]
+        source.write_text("\n".join(json.dumps(row) for row in rows))
+        metrics.reset()
+        # three batches creating categories, readers follow the parent links meanwhile
+        self.run(str(source), "--batch-size", "2")
+        assert "category_tree_rebuild_seconds_count 1" in metrics.render()
+        assert metrics.tree_writes == 6
+        assert sorted(Category.objects.values_list("tree_id", flat=True)) == list(range(1, 7))
+
+    @pytest.mark.django_db(transaction=True)
+    def test_category_paths_with_replicas(self, brand_factory, replicas, tmp_path):
+        brand = brand_factory()
+        source = tmp_path / "catalog.jsonl"
+        row = {"names": "p", "brand": brand.names, "category": "Root > Leaf"}
+        source.write_text(json.dumps(row))
+        # the new categories are read back from the primary, the replicas lag behind
+        with replica_reads():
+            out, _ = self.run(str(source), "--category-separator", ">")
+        assert "1 rows: 1 created" in out
+        assert Category.objects.get(names="Leaf").parent.names == "Root"
+
+    def test_resume_and_errors(self, brand_factory, category_factory, tmp_path):
+        brand, category = brand_factory(), category_factory()
+        source = tmp_path / "catalog.jsonl"
+        rows = [
+            {"names": "p%d" % i, "brand": brand.names, "category": category.names}
+            for i in range(5)
+        ]
+        rows[4]["brand"] = ""
+        source.write_text("\n".join(json.dumps(row) for row in rows))
+        # an earlier run committed the first two rows and stopped
+        (tmp_path / "catalog.jsonl.checkpoint").write_text(
+            json.dumps({"rows": 2, "created": 2, "updated": 0, "errors": 0, "categories": 0})
+        )
+
+        out, err = self.run(str(source), "--resume", "--batch-size", "2")
+        assert "resuming after row 2" in out
+        assert "5 rows: 4 created, 0 updated, 1 errors" in out
+        assert err.startswith("line 5: ")
+        assert list(Product.objects.values_list("names", flat=True)) == ["p2", "p3"]
+        assert not (tmp_path / "catalog.jsonl.checkpoint").exists()
+
+    def test_malformed_lines_are_reported(self, brand_factory, category_factory, tmp_path):
+        brand, category = brand_factory(), category_factory()
+        row = {"names": "p", "brand": brand.names, "category": category.names}
+        source = tmp_path / "catalog.jsonl"
+        source.write_text("\n".join([json.dumps(row), "{not json", "[1]", json.dumps(row)]))
+
+        out, err = self.run(str(source))
+        assert "4 rows: 2 created, 0 updated, 2 errors" in out
+        assert [line.split(":")[0] for line in err.splitlines()] == ["line 2", "line 3"]
+        assert "Invalid JSON" in err
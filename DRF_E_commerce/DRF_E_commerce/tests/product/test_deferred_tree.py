@@ -0,0 +1,172 @@
+import io
+import re
+from unittest.mock import ANY
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from DRF_E_commerce.product.deferred_tree import (
+    TREE_FIELDS,
+    live_positions,
+    nested_sets,
+    process_journal,
+)
+from DRF_E_commerce.product.metrics import metrics
+from DRF_E_commerce.product.models import Category, CategoryJournal, CategoryTreeLock
+from DRF_E_commerce.product.routers import replica_reads
+
+pytestmark = pytest.mark.django_db
+
+
+def tree_fields():
+    return {
+        pk: tuple(position)
+        for pk, *position in Category.objects.values_list("id", *TREE_FIELDS)
+    }
+
+
+@pytest.fixture
+def deferred(settings):
+    settings.CATEGORY_TREE = {"DEFERRED": True, "WORKER": None}
+
+
+@pytest.fixture
+def tree(category_factory):
+    # built by mptt before deferred mode is on
+    music = category_factory(names="Music")
+    audio = category_factory(names="Audio", parent=music)
+    category_factory(names="Speakers", parent=audio)
+    category_factory(names="Headphones", parent=audio)
+    category_factory(names="Books")
+    return {category.names: category for category in Category.objects.all()}
+
+
+class TestNestedSets:
+    def test_same_numbering_as_mptt(self, tree):
+        links = Category.objects.order_by("names", "id").values_list("id", "parent")
+        positions = nested_sets(links)
+        assert {pk: position[:4] for pk, position in positions.items()} == tree_fields()
+        assert positions[tree["Audio"].id][4] == tree["Music"].id
+
+    def test_parent_cycle_left_out(self):
+        assert nested_sets([(1, None), (2, 3), (3, 2)]) == {1: (1, 1, 2, 0, None)}
+
+
+class TestDeferredWrites:
+    endpoint = "/api/category/"
+
+    def test_writes_leave_other_rows_alone(self, tree, deferred, api_client):
+        before = tree_fields()
+        client = api_client()
+        response = client.post(self.endpoint, {"names": "Art"}, format="json")
+        assert response.status_code == 201
+        response = client.patch(
+            "%s%d/" % (self.endpoint, tree["Speakers"].id), {"names": "Amplifiers"}, format="json"
+        )
+        assert response.json() == {"names": "Amplifiers"}
+        # with mptt the new first root would have shifted every tree
+        after = tree_fields()
+        assert all(after[pk] == position for pk, position in before.items())
+        assert CategoryJournal.objects.count() == 2
+
+    def test_reads_follow_pending_writes(self, tree, deferred, api_client, product_factory):
+        client = api_client()
+        client.post(self.endpoint, {"names": "Art"}, format="json")
+        client.post(self.endpoint, {"names": "Zines"}, format="json")
+        client.patch(
+            "%s%d/" % (self.endpoint, tree["Speakers"].id), {"names": "Amplifiers"}, format="json"
+        )
+        art = Category.objects.get(names="Art")
+        product_factory(category=art)
+        product_factory(category=tree["Headphones"])
+        assert live_positions() is not None
+
+        nodes = client.get(self.endpoint + "tree/").json()
+        assert [node["names"] for node in nodes] == ["Art", "Books", "Music", "Zines"]
+        audio = nodes[2]["children"][0]
+        assert [node["names"] for node in audio["children"]] == ["Amplifiers", "Headphones"]
+
+        response = client.get(
+            "/api/product/",
+            {"category": tree["Music"].id, "include_descendants": "true", "breadcrumbs": "true"},
+        )
+        paths = [row["category_path"] for row in response.json()["results"]]
+        assert [[node["names"] for node in path] for path in paths] == [
+            ["Music", "Audio", "Headphones"]
+        ]
+        response = client.get("/api/product/", {"category": art.id, "breadcrumbs": "true"})
+        # Art and Zines both have the placeholder position in the table
+        assert response.json()["results"][0]["category_path"] == [{"id": art.id, "names": "Art"}]
+
+        facets = client.get("/api/product/facets/").json()["category"]
+        totals = {facet["names"]: facet["total_product_count"] for facet in facets}
+        assert totals == {"Art": 1, "Music": 1, "Audio": 1, "Headphones": 1}
+
+    def test_large_subtrees_filter_with_a_recursive_query(
+        self, tree, deferred, settings, api_client, product_factory
+    ):
+        settings.RESPONSE_CACHE = {"ENABLED": False}
+        api_client().post(self.endpoint, {"names": "Art"}, format="json")
+        for name in ["Music", "Speakers", "Headphones", "Books"]:
+            product_factory(category=tree[name])
+        params = {"category": tree["Music"].id, "include_descendants": "true"}
+        listed = api_client().get("/api/product/", params).json()["results"]
+        assert len(listed) == 3
+
+        settings.CATEGORY_TREE = {**settings.CATEGORY_TREE, "MAX_SUBTREE_IDS": 2}
+        with CaptureQueriesContext(connection) as captured:
+            assert api_client().get("/api/product/", params).json()["results"] == listed
+        assert any("WITH RECURSIVE" in query["sql"] for query in captured)
+
+    def test_rebuild_applies_the_journal(self, tree, deferred, api_client):
+        client = api_client()
+        client.post(self.endpoint, {"names": "Art"}, format="json")
+        client.put("%s%d/" % (self.endpoint, tree["Books"].id), {"names": "Zoo"}, format="json")
+        tree_before = client.get(self.endpoint + "tree/").json()
+        metrics.reset()
+
+        assert process_journal().writes == 2
+        assert not CategoryJournal.objects.exists()
+        assert live_positions() is None
+        rebuilt = tree_fields()
+        Category.objects.rebuild()
+        assert rebuilt == tree_fields()
+        assert client.get(self.endpoint + "tree/").json() == tree_before
+        assert metrics.tree_writes == 2
+        assert "category_tree_rebuild_seconds_count 1" in metrics.render()
+        assert process_journal().writes == 0
+
+    @pytest.mark.django_db(transaction=True)
+    def test_rebuild_reads_the_primary(self, tree, deferred, replicas, api_client):
+        client = api_client()
+        client.post(self.endpoint, {"names": "Art"}, format="json")
+        client.post(self.endpoint, {"names": "Zines"}, format="json")
+        # like a worker started from a request reading the replicas, which lag behind
+        with replica_reads():
+            assert process_journal() == (2, 7, ANY)
+        rebuilt = tree_fields()
+        Category.objects.rebuild()
+        assert rebuilt == tree_fields()
+
+    def test_rebuilds_lock_one_row(self, tree, deferred):
+        # created by the migration, but flushed by transactional tests
+        CategoryTreeLock.objects.all().delete()
+        process_journal(force=True)
+        assert CategoryTreeLock.objects.count() == 1
+
+    def test_command(self, tree, deferred, api_client):
+        api_client().post(self.endpoint, {"names": "Art"}, format="json")
+        out = io.StringIO()
+        call_command("rebuild_category_tree", stdout=out)
+        # Art is the first tree, every tree after it is renumbered
+        assert re.fullmatch(
+            r"1 journaled writes applied, 6 categories renumbered in \d+\.\d{3}s\n", out.getvalue()
+        )
+        assert Category.objects.get(names="Art").tree_id == 1
+
+    def test_immediate_mode_unchanged(self, tree, api_client):
+        api_client().post(self.endpoint, {"names": "Art"}, format="json")
+        assert Category.objects.get(names="Art").tree_id == 1
+        assert not CategoryJournal.objects.exists()
@@ -2,6 +2,11 @@ import json
 
 import pytest
 
+from DRF_E_commerce.product.deferred_tree import live_positions, process_journal
+from DRF_E_commerce.product.export import stream_csv, stream_ndjson
+from DRF_E_commerce.product.models import Category, Product
+from DRF_E_commerce.product.pagination import ProductCursorPagination
+
 # so the tests can have acces to the database
 pytestmark = pytest.mark.django_db
 
@@ -32,6 +37,14 @@ class TestBrandEndpoints:
         assert response.status_code == 200
         assert len(json.loads(response.content)) == 10
 
+    def test_brand_get_limit_offset_is_opt_in(self, brand_factory, api_client):
+        brand_factory.create_batch(10)
+        response = api_client().get(self.endpoint, {"limit": 3, "offset": 6})
+        assert response.status_code == 200
+        data = json.loads(response.content)
+        assert data["count"] == 10
+        assert len(data["results"]) == 3
+
 
 class TestProductEndpoints:
     endpoint = "/api/product/"
@@ -40,5 +53,494 @@ class TestProductEndpoints:
         product_factory.create_batch(4)
         response = api_client().get(self.endpoint)
         assert response.status_code == 200
-        # we can change
-        assert len(json.loads(response.content)) == 4
+        # the product list is paginated, the rows are under "results"
+        assert len(json.loads(response.content)["results"]) == 4
+
+    def test_product_filter_by_category_descendants(
+        self, product_factory, category_factory, brand_factory, api_client, query_budget
+    ):
+        electronics = category_factory(names="Electronics")
+        audio = category_factory(names="Audio", parent=electronics)
+        headphones = category_factory(names="Headphones", parent=audio)
+        brand = brand_factory()
+        in_tree = [
+            product_factory(category=electronics, brand=brand),
+            product_factory(category=headphones, brand=brand),
+            product_factory(category=headphones, brand=brand, is_digital=False),
+        ]
+        product_factory(category=audio)
+        product_factory(category=category_factory(names="Books"), brand=brand)
+
+        params = {"category": "Electronics", "include_descendants": "true", "brand": brand.id}
+        # the page and the three ETag aggregates
+        with query_budget(4):
+            response = api_client().get(self.endpoint, params)
+        ids = [row["id"] for row in json.loads(response.content)["results"]]
+        assert ids == [product.id for product in in_tree]
+
+        params.update(category=audio.id, is_digital="false")
+        response = api_client().get(self.endpoint, params)
+        ids = [row["id"] for row in json.loads(response.content)["results"]]
+        assert ids == [in_tree[2].id]
+
+    def test_product_filter_without_descendants(
+        self, product_factory, category_factory, api_client
+    ):
+        parent = category_factory()
+        product = product_factory(category=parent)
+        product_factory(category=category_factory(parent=parent))
+        response = api_client().get(self.endpoint, {"category": parent.names})
+        assert [row["id"] for row in json.loads(response.content)["results"]] == [product.id]
+
+    def test_product_filter_by_digit_names(
+        self, product_factory, brand_factory, category_factory, api_client, query_budget
+    ):
+        year = brand_factory(names="2024")
+        other = brand_factory()
+        named = product_factory(brand=year, category=category_factory(names=str(other.id)))
+        by_id = product_factory(brand=other)
+        client = api_client()
+        # the brand called "2024" and, no brand being called that, the brand of that id
+        with query_budget(4):
+            response = client.get(self.endpoint, {"brand": "2024"})
+        assert [row["id"] for row in response.json()["results"]] == [named.id]
+        response = client.get(self.endpoint, {"brand": other.id})
+        assert [row["id"] for row in response.json()["results"]] == [by_id.id]
+        # a category named like the id of another one is matched by name
+        params = {"category": other.id, "include_descendants": "true"}
+        response = client.get(self.endpoint, params)
+        assert [row["id"] for row in response.json()["results"]] == [named.id]
+
+    def test_product_filter_unknown_category(self, product_factory, api_client):
+        product_factory()
+        params = {"category": "nope", "include_descendants": "true"}
+        response = api_client().get(self.endpoint, params)
+        assert json.loads(response.content)["results"] == []
+
+    def test_product_get_cursor_pages(self, product_factory, api_client):
+        products = product_factory.create_batch(5)
+        client = api_client()
+        response = client.get(self.endpoint, {"page_size": 2})
+        data = json.loads(response.content)
+        seen = [row["id"] for row in data["results"]]
+        assert data["previous"] is None
+        while data["next"]:
+            data = json.loads(client.get(data["next"]).content)
+            seen += [row["id"] for row in data["results"]]
+        # every product exactly once, in primary key order
+        assert seen == sorted(product.id for product in products)
+
+    def test_product_get_page_size_is_capped(self, product_factory, api_client, monkeypatch):
+        monkeypatch.setattr(ProductCursorPagination, "max_page_size", 2)
+        product_factory.create_batch(3)
+        response = api_client().get(self.endpoint, {"page_size": 10**6})
+        assert response.status_code == 200
+        assert len(json.loads(response.content)["results"]) == 2
+
+
+class TestProductBulkEndpoint:
+    endpoint = "/api/product/bulk/"
+
+    def test_bulk_create_and_update(self, product_factory, brand_factory, api_client):
+        existing = product_factory()
+        brand = brand_factory()
+        items = [
+            {"names": "p1", "description": "", "brand": brand.names, "category": "new_category"},
+            {"names": "p2", "brand": "new_brand", "category": "new_category"},
+            {
+                "id": existing.id,
+                "names": "renamed",
+                "brand": brand.names,
+                "category": existing.category.names,
+            },
+        ]
+        response = api_client().post(self.endpoint, items, format="json")
+        assert response.status_code == 201
+        results = json.loads(response.content)["results"]
+        assert [result["status"] for result in results] == ["created", "created", "updated"]
+        existing.refresh_from_db()
+        assert existing.names == "renamed"
+        assert existing.brand == brand
+        assert Product.objects.get(pk=results[1]["id"]).brand.names == "new_brand"
+
+    def test_new_categories_are_renumbered_after_the_request(
+        self, brand_factory, category_factory, api_client
+    ):
+        brand = brand_factory()
+        category_factory(names="Music")
+        client = api_client()
+        for names in [["Zines", "Art"], ["Books"]]:
+            items = [{"names": "p", "brand": brand.names, "category": name} for name in names]
+            assert client.post(self.endpoint, items, format="json").status_code == 201
+        # pending, the readers of the tree follow the parent links
+        tree = client.get("/api/category/tree/").json()
+        assert [node["names"] for node in tree] == ["Art", "Books", "Music", "Zines"]
+
+        # what the worker runs once the requests committed
+        assert process_journal().writes == 3
+        assert live_positions() is None
+        fields = ["names", "tree_id", "lft", "rght", "level"]
+        numbered = list(Category.objects.order_by("tree_id").values_list(*fields))
+        assert [row[0] for row in numbered] == ["Art", "Books", "Music", "Zines"]
+        Category.objects.rebuild()
+        assert numbered == list(Category.objects.order_by("tree_id").values_list(*fields))
+
+    def test_bulk_reports_item_errors(self, brand_factory, category_factory, api_client):
+        brand, category = brand_factory(), category_factory()
+        items = [
+            {"names": "ok", "brand": brand.names, "category": category.names},
+            {"brand": brand.names, "category": category.names},
+            {"id": 10**6, "names": "missing", "brand": brand.names, "category": category.names},
+        ]
+        response = api_client().post(self.endpoint, items, format="json")
+        assert response.status_code == 207
+        data = json.loads(response.content)
+        assert (data["succeeded"], data["failed"]) == (1, 2)
+        assert "names" in data["results"][1]["errors"]
+        assert "id" in data["results"][2]["errors"]
+        assert Product.objects.count() == 1
+
+    def test_bulk_resolves_names_in_constant_queries(
+        self, brand_factory, category_factory, api_client, query_budget
+    ):
+        brands, categories = brand_factory.create_batch(5), category_factory.create_batch(5)
+        items = [
+            {"names": "p%d" % i, "brand": brands[i % 5].names, "category": categories[i % 3].names}
+            for i in range(50)
+        ]
+        with query_budget(6):
+            response = api_client().post(self.endpoint, items, format="json")
+        assert response.status_code == 201
+
+
+class TestProductBatchRetrieve:
+    endpoint = "/api/product/"
+
+    @pytest.mark.parametrize("size", [2, 20])
+    def test_ids_in_request_order(self, product_factory, api_client, query_budget, size):
+        products = product_factory.create_batch(size)
+        ids = [product.id for product in reversed(products)] + [10**6]
+        # the batch and the three ETag aggregates, whatever the number of ids
+        with query_budget(4):
+            response = api_client().get(self.endpoint, {"ids": ",".join(map(str, ids))})
+        data = response.json()
+        assert [row["id"] for row in data["results"]] == ids[:-1]
+        assert data["results"][0]["brand"] == products[-1].brand.names
+        assert data["missing"] == [10**6]
+
+    def test_post_with_fields_and_duplicates(self, product_factory, api_client):
+        first, second = product_factory.create_batch(2)
+        response = api_client().post(
+            self.endpoint + "batch/?fields=names",
+            {"ids": [second.id, first.id, second.id]},
+            format="json",
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            "results": [{"names": second.names}, {"names": first.names}],
+            "missing": [],
+        }
+
+    @pytest.mark.parametrize("ids", ["1,x", "", "-1", "1,2,3"])
+    def test_invalid_or_too_many_ids(self, ids, api_client, settings):
+        settings.BATCH_MAX_IDS = 2
+        response = api_client().get(self.endpoint, {"ids": ids})
+        assert response.status_code == 400
+        assert "ids" in response.json()
+
+    def test_post_requires_ids(self, api_client):
+        response = api_client().post(self.endpoint + "batch/", [1, 2], format="json")
+        assert response.status_code == 400
+
+
+class TestProductExportEndpoint:
+    endpoint = "/api/product/export/"
+
+    def test_export_ndjson(self, product_factory, api_client):
+        products = product_factory.create_batch(3)
+        response = api_client().get(self.endpoint)
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        assert [row["id"] for row in rows] == [product.id for product in products]
+        assert rows[0]["brand"] == products[0].brand.names
+
+    def test_export_csv_filtered(self, product_factory, api_client):
+        product_factory(is_digital=False)
+        digital = product_factory(is_digital=True)
+        response = api_client().get(self.endpoint, {"format": "csv", "is_digital": "true"})
+        assert response.status_code == 200
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        assert lines[0] == "id,names,description,is_digital,brand,category"
+        assert len(lines) == 2
+        assert lines[1].startswith("%d," % digital.id)
+
+    @pytest.mark.parametrize("streamer", [stream_ndjson, stream_csv])
+    def test_first_row_is_sent_before_the_chunk_fills(self, streamer):
+        read = []
+
+        def rows():
+            for pk in range(5):
+                read.append(pk)
+                yield (pk, "p%d" % pk, "", False, "brand", None)
+
+        chunks = streamer(rows(), chunk_size=3)
+        first = "".join(next(chunks) for _ in range(2 if streamer is stream_csv else 1))
+        assert read == [0]
+        assert "p0" in first
+        assert [chunk.count("\n") for chunk in chunks] == [3, 1]
+
+    def test_export_rejects_bad_boolean(self, api_client):
+        response = api_client().get(self.endpoint, {"is_digital": "maybe"})
+        assert response.status_code == 400
+
+
+class TestCategoryTreeEndpoint:
+    endpoint = "/api/category/tree/"
+
+    def test_tree_single_query(self, category_factory, api_client, query_budget):
+        electronics = category_factory(names="Electronics")
+        audio = category_factory(names="Audio", parent=electronics)
+        category_factory(names="Headphones", parent=audio)
+        category_factory(names="Books")
+        # the tree and the two ETag aggregates
+        with query_budget(3):
+            response = api_client().get(self.endpoint)
+        tree = json.loads(response.content)
+        assert [node["names"] for node in tree] == ["Books", "Electronics"]
+        assert tree[1]["children"][0]["children"][0]["names"] == "Headphones"
+
+    def test_subtree_with_product_counts(
+        self, category_factory, product_factory, api_client, query_budget
+    ):
+        electronics = category_factory(names="Electronics")
+        audio = category_factory(names="Audio", parent=electronics)
+        product_factory.create_batch(2, category=audio)
+        product_factory(category=electronics)
+        product_factory(category=category_factory(names="Books"))
+        with query_budget(4):
+            response = api_client().get(
+                self.endpoint, {"root": electronics.id, "product_counts": "true"}
+            )
+        (root,) = json.loads(response.content)
+        assert (root["product_count"], root["total_product_count"]) == (1, 3)
+        assert root["children"][0]["product_count"] == 2
+
+    def test_unknown_root(self, api_client):
+        response = api_client().get(self.endpoint, {"root": 12345})
+        assert response.status_code == 400
+
+
+class TestProductFacetsEndpoint:
+    endpoint = "/api/product/facets/"
+
+    def test_facet_counts(
+        self, category_factory, product_factory, brand_factory, api_client, query_budget
+    ):
+        electronics = category_factory(names="Electronics")
+        audio = category_factory(names="Audio", parent=electronics)
+        headphones = category_factory(names="Headphones", parent=audio)
+        category_factory(names="Video", parent=electronics)
+        books = category_factory(names="Books")
+        acme, other = brand_factory(names="Acme"), brand_factory(names="Other")
+        product_factory.create_batch(2, category=headphones, brand=acme, is_digital=False)
+        product_factory(category=audio, brand=acme, is_digital=True)
+        product_factory(category=books, brand=other, is_digital=True)
+        product_factory(category=None, brand=other, is_digital=False)
+
+        # four grouped queries and the three ETag aggregates
+        with query_budget(7):
+            response = api_client().get(self.endpoint)
+        facets = response.json()
+        assert facets["total"] == 5
+        assert [(b["names"], b["count"]) for b in facets["brand"]] == [("Acme", 3), ("Other", 2)]
+        assert facets["is_digital"] == [
+            {"value": False, "count": 3},
+            {"value": True, "count": 2},
+        ]
+        # tree order like /api/category/tree/, empty categories left out
+        assert [
+            (c["names"], c["product_count"], c["total_product_count"]) for c in facets["category"]
+        ] == [("Books", 1, 1), ("Electronics", 0, 3), ("Audio", 1, 3), ("Headphones", 2, 2)]
+
+    def test_facets_follow_filters(self, category_factory, product_factory, api_client):
+        electronics = category_factory(names="Electronics")
+        audio = category_factory(names="Audio", parent=electronics)
+        product_factory(category=audio, is_digital=True)
+        product_factory(category=electronics, is_digital=False)
+        response = api_client().get(self.endpoint, {"is_digital": "true"})
+        facets = response.json()
+        assert facets["total"] == 1
+        assert [c["total_product_count"] for c in facets["category"]] == [1, 1]
+
+        assert api_client().get(self.endpoint, {"is_digital": "maybe"}).status_code == 400
+
+
+class TestProductSearchEndpoint:
+    endpoint = "/api/product/search/"
+
+    def test_search_ranks_and_paginates(self, product_factory, brand_factory, api_client):
+        phone = product_factory(names="Smart phone", description="")
+        case = product_factory(names="Leather case", description="fits every phone")
+        product_factory(names="Desk lamp", description="")
+        phones_brand = product_factory(names="Charger", brand=brand_factory(names="Phones4u"))
+
+        response = api_client().get(self.endpoint, {"q": "phone"})
+        assert response.status_code == 200
+        data = json.loads(response.content)
+        # the last word is a prefix, a match on the name ranks above brand and description
+        ids = [row["id"] for row in data["results"]]
+        assert ids == [phone.id, phones_brand.id, case.id]
+        assert data["count"] == 3
+
+        data = json.loads(api_client().get(self.endpoint, {"q": "phone", "limit": 1}).content)
+        assert len(data["results"]) == 1 and data["next"]
+
+    def test_index_follows_writes(self, product_factory, api_client):
+        product = product_factory(names="Coffee grinder")
+        product.brand.names = "Barista"
+        product.brand.save()
+        response = api_client().get(self.endpoint, {"q": "barista"})
+        assert [row["id"] for row in response.data["results"]] == [product.id]
+        product.delete()
+        assert api_client().get(self.endpoint, {"q": "coffee"}).data["count"] == 0
+
+    def test_operators_are_escaped(self, product_factory, api_client):
+        product_factory(names="AND OR NOT")
+        response = api_client().get(self.endpoint, {"q": 'NOT "AND'})
+        assert response.status_code == 200
+        assert response.data["count"] == 1
+
+    def test_query_is_required(self, api_client):
+        assert api_client().get(self.endpoint).status_code == 400
+
+
+class TestSparseFieldsets:
+    def test_product_list_fields(self, product_factory, api_client, query_budget):
+        product_factory.create_batch(3)
+        with query_budget(4) as queries:
+            response = api_client().get("/api/product/", {"fields": "names,id"})
+        # the selection keeps the serializer order
+        assert [list(row) for row in response.json()["results"]] == [["id", "names"]] * 3
+        page_sql = next(q["sql"] for q in queries.captured_queries if "LIMIT" in q["sql"])
+        assert "description" not in page_sql
+        assert "JOIN" not in page_sql
+
+    def test_product_list_omit(self, product_factory, api_client):
+        product_factory()
+        response = api_client().get("/api/product/", {"omit": "description,updated_at"})
+        row = response.json()["results"][0]
+        assert list(row) == ["id", "brand", "category", "names", "is_digital"]
+
+    def test_product_retrieve_joins_selected_relation(
+        self, product_factory, api_client, query_budget
+    ):
+        product = product_factory()
+        with query_budget(2) as queries:
+            response = api_client().get("/api/product/%d/" % product.id, {"fields": "brand"})
+        assert response.json() == {"brand": product.brand.names}
+        sql = queries.captured_queries[-1]["sql"]
+        assert "product_brand" in sql
+        assert "product_category" not in sql
+
+    def test_brand_and_async_views(self, brand_factory, api_client):
+        brand_factory.create_batch(2)
+        for endpoint in ["/api/brand/", "/api/async/brand/"]:
+            response = api_client().get(endpoint, {"omit": "updated_at"})
+            assert [list(row) for row in response.json()] == [["id", "names"]] * 2
+
+    @pytest.mark.parametrize(
+        "params", [{"fields": "names,price"}, {"omit": "nope"}, {"fields": "id", "omit": "id"}]
+    )
+    def test_bad_selection(self, params, api_client):
+        for endpoint in ["/api/product/", "/api/async/product/"]:
+            assert api_client().get(endpoint, params).status_code == 400
+
+
+class TestProductBreadcrumbs:
+    endpoint = "/api/product/"
+
+    @pytest.fixture
+    def tree(self, category_factory):
+        root = category_factory(names="Electronics")
+        audio = category_factory(names="Audio", parent=root)
+        headphones = category_factory(names="Headphones", parent=audio)
+        return root, audio, headphones
+
+    def path(self, *categories):
+        return [{"id": category.id, "names": category.names} for category in categories]
+
+    # the page, one ancestor query and the three ETag aggregates, whatever the
+    # number of products and categories
+    @pytest.mark.parametrize("size", [1, 10, 40])
+    def test_list_queries_do_not_grow(
+        self, tree, category_factory, product_factory, api_client, query_budget, size
+    ):
+        depths = {}
+        for n in range(size):
+            product = product_factory(category=category_factory(parent=tree[n % 3]))
+            depths[product.id] = n % 3 + 2
+        with query_budget(5):
+            response = api_client().get(self.endpoint, {"breadcrumbs": "true"})
+        results = response.json()["results"]
+        assert {row["id"]: len(row["category_path"]) for row in results} == depths
+        assert all(row["category_path"][0] == self.path(tree[0])[0] for row in results)
+
+    def test_paths_are_memoized(self, tree, product_factory, api_client, query_budget):
+        product_factory(category=tree[2])
+        client = api_client()
+        client.get(self.endpoint, {"breadcrumbs": "true"})
+        # another url: the page only, the paths and the ETag state come from the cache
+        with query_budget(1):
+            response = client.get(self.endpoint, {"breadcrumbs": "true", "fields": "id"})
+        assert response.json()["results"][0]["category_path"] == self.path(*tree)
+
+    def test_paths_on_every_endpoint(self, tree, product_factory, api_client):
+        product = product_factory(category=tree[2])
+        expected = self.path(*tree)
+        client = api_client()
+        response = client.get(self.endpoint, {"breadcrumbs": "1", "fields": "names"})
+        assert response.json()["results"] == [{"names": product.names, "category_path": expected}]
+        response = client.get("%s%d/" % (self.endpoint, product.id), {"breadcrumbs": "true"})
+        assert response.json()["category_path"] == expected
+        response = client.get(self.endpoint, {"ids": product.id, "breadcrumbs": "true"})
+        assert response.json()["results"][0]["category_path"] == expected
+        response = client.get(self.endpoint + "search/", {"q": "test", "breadcrumbs": "true"})
+        assert response.json()["results"][0]["category_path"] == expected
+        assert "category_path" not in client.get(self.endpoint).json()["results"][0]
+
+    def test_rename_and_move_refresh_paths(
+        self, tree, category_factory, product_factory, api_client
+    ):
+        root, audio, headphones = tree
+        product = product_factory(category=headphones)
+        client = api_client()
+        url = "%s%d/" % (self.endpoint, product.id)
+        first = client.get(url, {"breadcrumbs": "true"})
+        assert first.json()["category_path"] == self.path(root, audio, headphones)
+
+        root.names = "Devices"
+        root.save()
+        # the product and its category are untouched, the ETag must change all the same
+        response = client.get(url, {"breadcrumbs": "true"}, HTTP_IF_NONE_MATCH=first["ETag"])
+        assert response.status_code == 200
+        assert response.json()["category_path"][0]["names"] == "Devices"
+
+        other = category_factory(names="Other")
+        audio.move_to(other)
+        response = client.get(self.endpoint, {"breadcrumbs": "true"})
+        assert response.json()["results"][0]["category_path"] == self.path(
+            other, audio, headphones
+        )
+
+    def test_product_without_category(self, product_factory, api_client):
+        product_factory(category=None)
+        response = api_client().get(self.endpoint, {"breadcrumbs": "true"})
+        assert response.json()["results"][0]["category_path"] is None
+
+    def test_invalid_value(self, product_factory, api_client):
+        product = product_factory()
+        for url in [self.endpoint, "%s%d/" % (self.endpoint, product.id)]:
+            response = api_client().get(url, {"breadcrumbs": "maybe"})
+            assert response.status_code == 400
@@ -0,0 +1,80 @@
+import logging
+import re
+
+import pytest
+
+from DRF_E_commerce.product.metrics import metrics
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def enabled(settings):
+    # the middleware reads the settings when the client builds its handler
+    settings.PERFORMANCE_METRICS = {"ENABLED": True, "SLOW_REQUEST_MS": None}
+    settings.RESPONSE_CACHE = {"ENABLED": False}
+    metrics.reset()
+    yield settings.PERFORMANCE_METRICS
+    metrics.reset()
+
+
+def timings(response):
+    return {
+        match.group(1): (float(match.group(2)), match.group(3))
+        for match in re.finditer(
+            r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', response["Server-Timing"]
+        )
+    }
+
+
+class TestPerformanceMiddleware:
+    def test_server_timing(self, enabled, product_factory, api_client):
+        product_factory.create_batch(3)
+        response = api_client().get("/api/product/")
+        phases = timings(response)
+        assert set(phases) == {"db", "serialize", "render", "total"}
+        # the page and the three ETag aggregates
+        assert phases["db"][1] == "4 queries"
+        assert phases["serialize"][0] > 0
+        assert phases["render"][0] > 0
+        assert phases["total"][0] >= phases["db"][0]
+
+    def test_async_views(self, enabled, product_factory, api_client):
+        product = product_factory()
+        response = api_client().get("/api/async/product/%d/" % product.id)
+        assert timings(response)["db"][1] == "1 queries"
+
+    def test_disabled(self, settings, api_client):
+        settings.PERFORMANCE_METRICS = {"ENABLED": False}
+        assert not api_client().get("/api/brand/").has_header("Server-Timing")
+
+    def test_prometheus_metrics(self, enabled, brand_factory, api_client, admin_user):
+        brand = brand_factory()
+        client = api_client()
+        client.get("/api/brand/")
+        client.get("/api/brand/")
+        client.get("/api/brand/%d/" % brand.id)
+
+        assert client.get("/api/metrics/").status_code == 403
+        client.force_authenticate(admin_user)
+        response = client.get("/api/metrics/")
+        assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+        text = response.content.decode()
+        assert 'http_requests_total{route="brand-list",method="GET",status="200"} 2' in text
+        assert (
+            'http_request_duration_seconds_bucket{route="brand-list",method="GET",le="+Inf"} 2'
+            in text
+        )
+        assert 'http_request_db_queries_count{route="brand-detail",method="GET"} 1' in text
+        assert 'http_request_phase_seconds_total{route="brand-list",method="GET",phase="db"}' in (
+            text
+        )
+
+    def test_slow_request_log(self, enabled, product_factory, api_client, caplog):
+        enabled["SLOW_REQUEST_MS"] = 0
+        product = product_factory()
+        with caplog.at_level(logging.WARNING, logger="DRF_E_commerce.performance"):
+            api_client().get("/api/product/%d/" % product.id)
+        (record,) = caplog.records
+        assert record.getMessage().startswith("slow request GET /api/product/%d/" % product.id)
+        assert 'FROM "product_product"' in record.getMessage()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.django_db
+
+
+class TestProductQueryBudget:
+    endpoint = "/api/product/"
+
+    # the budget stays the same whatever the number of rows:
+    # the page itself plus one ETag/Last-Modified aggregate per table
+    @pytest.mark.parametrize("size", [1, 10, 40])
+    def test_list_queries_do_not_grow(self, product_factory, api_client, query_budget, size):
+        product_factory.create_batch(size)
+        with query_budget(4):
+            response = api_client().get(self.endpoint)
+        assert len(json.loads(response.content)["results"]) == size
+
+    def test_retrieve_single_query(self, product_factory, api_client, query_budget):
+        product = product_factory()
+        # the product and its timestamps for the ETag
+        with query_budget(2):
+            response = api_client().get("%s%d/" % (self.endpoint, product.id))
+        assert json.loads(response.content)["brand"] == product.brand.names
+
+    @pytest.mark.parametrize("size", [1, 10])
+    def test_update_response_does_not_query_relations(
+        self, product_factory, api_client, query_budget, size
+    ):
+        products = product_factory.create_batch(size)
+        payload = {
+            "names": "renamed",
+            "description": "",
+            "is_digital": False,
+            "brand": products[0].brand.names,
+            "category": products[0].category.names,
+        }
+        # fetch product, brand and category get_or_create, update: the serializer finds
+        # the names in the name cache
+        with query_budget(4):
+            response = api_client().put(
+                "%s%d/" % (self.endpoint, products[-1].id), payload, format="json"
+            )
+        assert response.status_code == 200
+        assert json.loads(response.content)["category"] == products[0].category.names
+
+    def test_repeated_writes_skip_name_lookups(self, product_factory, api_client, query_budget):
+        product = product_factory()
+        payload = {
+            "names": "renamed",
+            "description": "",
+            "is_digital": False,
+            "brand": product.brand.names,
+            "category": product.category.names,
+        }
+        client = api_client()
+        client.put("%s%d/" % (self.endpoint, product.id), payload, format="json")
+        # brand and category ids come from the name cache: fetch product, update
+        with query_budget(2):
+            response = client.put("%s%d/" % (self.endpoint, product.id), payload, format="json")
+        assert response.status_code == 200
+        assert json.loads(response.content)["brand"] == product.brand.names
+        product.refresh_from_db()
+        assert product.names == "renamed"
@@ -0,0 +1,170 @@
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils import timezone
+
+from DRF_E_commerce.product import routers
+from DRF_E_commerce.product.middleware import ReplicaPinningMiddleware
+from DRF_E_commerce.product.models import Product
+from DRF_E_commerce.product.routers import (
+    ReplicaRouter,
+    is_pinned,
+    pin_primary,
+    read_source,
+    replica_health,
+    replica_reads,
+    replication_lag,
+)
+
+from ..conftest import REPLICAS
+
+
+class TestReplicaRouter:
+    def test_no_replica(self):
+        with replica_reads():
+            assert ReplicaRouter().db_for_read(Product) == "default"
+
+    def test_round_robin(self, replicas):
+        router = ReplicaRouter()
+        with replica_reads():
+            assert [router.db_for_read(Product) for _ in range(4)] == REPLICAS * 2
+        assert router.db_for_write(Product) == "default"
+
+    def test_primary_by_default(self, replicas):
+        # management commands, threads and on_commit hooks
+        assert ReplicaRouter().db_for_read(Product) == "default"
+        assert read_source() == "primary"
+
+    @pytest.mark.django_db
+    def test_primary_in_transaction(self, replicas):
+        with replica_reads(), transaction.atomic():
+            assert ReplicaRouter().db_for_read(Product) == "default"
+
+    def test_pinned(self, replicas):
+        with replica_reads():
+            with pin_primary():
+                assert ReplicaRouter().db_for_read(Product) == "default"
+            assert ReplicaRouter().db_for_read(Product) in REPLICAS
+
+    def test_unhealthy_replicas(self, replicas):
+        router = ReplicaRouter()
+        replica_health.mark("replica_0", False)
+        with replica_reads():
+            assert {router.db_for_read(Product) for _ in range(4)} == {"replica_1"}
+            replica_health.mark("replica_1", False)
+            assert router.db_for_read(Product) == "default"
+
+    def test_no_migration_on_replicas(self, replicas):
+        assert ReplicaRouter().allow_migrate("replica_0", "product") is False
+        assert ReplicaRouter().allow_migrate("default", "product") is None
+
+    def test_read_source(self, replicas):
+        with replica_reads():
+            assert read_source() == "replica"
+            with pin_primary():
+                assert read_source() == "primary"
+
+
+@pytest.mark.django_db
+class TestReplicaCacheSeparation:
+    def test_pinned_reads_skip_replica_entries(self, product_factory, api_client, monkeypatch):
+        from DRF_E_commerce.product import cache, conditional
+
+        product = product_factory(names="before")
+        # a lagging replica renders and caches the list after the version bump
+        monkeypatch.setattr(cache, "read_source", lambda: "replica")
+        monkeypatch.setattr(conditional, "read_source", lambda: "replica")
+        client = api_client()
+        stale = client.get("/api/product/")
+        Product.objects.filter(pk=product.pk).update(names="after", updated_at=timezone.now())
+
+        monkeypatch.setattr(cache, "read_source", lambda: "primary")
+        monkeypatch.setattr(conditional, "read_source", lambda: "primary")
+        response = client.get("/api/product/", HTTP_IF_NONE_MATCH=stale["ETag"])
+        assert response.status_code == 200
+        assert response.json()["results"][0]["names"] == "after"
+
+
+@pytest.mark.django_db
+class TestReplicaHealth:
+    def test_up_to_date(self, product_factory):
+        product_factory()
+        assert replication_lag("default") == 0
+
+    def test_lagging(self, settings, monkeypatch):
+        settings.DATABASE_REPLICAS = {"MAX_LAG_SECONDS": 30}
+        monkeypatch.setattr(routers, "replication_lag", lambda alias: 31)
+        assert not replica_health.check("replica_0", 30)
+        monkeypatch.setattr(routers, "replication_lag", lambda alias: 29)
+        assert replica_health.check("replica_0", 30)
+
+    def test_unavailable(self, monkeypatch):
+        def unavailable(alias):
+            raise DatabaseError("connection refused")
+
+        monkeypatch.setattr(routers, "replication_lag", unavailable)
+        assert not replica_health.check("replica_0", 30)
+
+    def test_checked_once_per_interval(self, settings, monkeypatch):
+        settings.DATABASE_REPLICAS = {"HEALTH_CHECK_INTERVAL": 60}
+        checks = []
+        monkeypatch.setattr(
+            replica_health, "check", lambda alias, max_lag: checks.append(alias) or True
+        )
+        try:
+            assert replica_health.healthy("replica_0")
+            assert replica_health.healthy("replica_0")
+            assert checks == ["replica_0"]
+        finally:
+            replica_health.reset()
+
+
+class TestReplicaPinningMiddleware:
+    def middleware(self, seen):
+        def get_response(request):
+            seen.append(is_pinned())
+            return HttpResponse(status=201 if request.method == "POST" else 200)
+
+        return ReplicaPinningMiddleware(get_response)
+
+    def test_read_your_writes(self, replicas):
+        seen = []
+        middleware = self.middleware(seen)
+        factory = RequestFactory()
+
+        response = middleware(factory.post("/api/product/"))
+        cookie = response.cookies["read_primary_until"]
+        assert cookie["max-age"] == 5
+        assert cookie["httponly"]
+
+        middleware(factory.get("/api/product/"))
+        request = factory.get("/api/product/")
+        request.COOKIES["read_primary_until"] = cookie.value
+        middleware(request)
+        assert seen == [True, False, True]
+        # outside of a request
+        assert is_pinned()
+
+    def test_read_only_post(self, replicas):
+        seen = []
+        middleware = self.middleware(seen)
+        factory = RequestFactory()
+        response = middleware(factory.post("/api/product/batch/", {"ids": [1]}))
+        assert "read_primary_until" not in response.cookies
+        middleware(factory.post("/api/product/bulk/"))
+        assert seen == [False, True]
+
+    def test_expired_cookie(self, replicas):
+        seen = []
+        request = RequestFactory().get("/api/product/")
+        request.COOKIES["read_primary_until"] = "1.0"
+        response = self.middleware(seen)(request)
+        assert seen == [False]
+        assert "read_primary_until" not in response.cookies
+
+
+def test_sync_replicas_without_replicas():
+    with pytest.raises(CommandError, match="no replica configured"):
+        call_command("sync_replicas")
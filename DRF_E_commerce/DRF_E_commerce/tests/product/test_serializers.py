@@ -0,0 +1,69 @@
+import datetime
+import decimal
+
+import pytest
+from rest_framework.renderers import JSONRenderer
+
+from DRF_E_commerce.product.breadcrumbs import paths_for_products
+from DRF_E_commerce.product.models import Product
+from DRF_E_commerce.product.renderers import FastJSONRenderer
+from DRF_E_commerce.product.serializers import ProductListSerializer, ProductSerializer
+
+pytestmark = pytest.mark.django_db
+
+
+class TestProductListSerializer:
+    def test_same_bytes_as_model_serializer(self, product_factory):
+        product_factory(names="Café \u2028 \"quoted\"", description="line\nbreak \U0001f600")
+        product_factory(category=None, is_digital=True)
+        product_factory.create_batch(3)
+        queryset = Product.objects.select_related("brand", "category").order_by("id")
+
+        expected = JSONRenderer().render(ProductSerializer(queryset, many=True).data)
+        rows = ProductListSerializer.values(queryset)
+        actual = FastJSONRenderer().render(ProductListSerializer(rows, many=True).data)
+        assert actual == expected
+
+    @pytest.mark.parametrize("fields", [None, ["names", "updated_at"]])
+    def test_same_bytes_with_breadcrumbs(self, fields, product_factory, category_factory):
+        product_factory(category=category_factory(parent=category_factory()))
+        product_factory(category=None)
+        queryset = Product.objects.select_related("brand", "category").order_by("id")
+        paths = paths_for_products(queryset)
+
+        expected = JSONRenderer().render(
+            ProductSerializer(
+                queryset, many=True, fields=fields, context={"category_paths": paths}
+            ).data
+        )
+        rows = ProductListSerializer.values(queryset, fields, breadcrumbs=True)
+        serializer = ProductListSerializer(rows, fields=fields, category_paths=paths)
+        assert FastJSONRenderer().render(serializer.data) == expected
+
+    def test_list_endpoint_uses_same_schema(self, product_factory, api_client):
+        product = product_factory()
+        response = api_client().get("/api/product/")
+        assert response.content.startswith(b'{"next":null,"previous":null,"results":[')
+        assert response.json()["results"] == [ProductSerializer(product).data]
+
+
+class TestFastJSONRenderer:
+    @pytest.mark.parametrize(
+        "data",
+        [
+            {"text": "é\u2028\u2029", "none": None, "flag": True, "list": [1, 2.5]},
+            {"when": datetime.datetime(2023, 7, 1, 12, 30, 15, 123456, datetime.timezone.utc)},
+            {"day": datetime.date(2023, 7, 1), "price": decimal.Decimal("9.90"), 1: "int key"},
+            [],
+            None,
+        ],
+    )
+    def test_same_bytes_as_json_renderer(self, data):
+        assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+    def test_indented_output_falls_back(self):
+        data = {"a": [1]}
+        context = {"indent": 4}
+        assert FastJSONRenderer().render(data, renderer_context=context) == (
+            JSONRenderer().render(data, renderer_context=context)
+        )
@@ -0,0 +1,115 @@
+import datetime
+import io
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from DRF_E_commerce.product.conditional import _table_state
+from DRF_E_commerce.product.models import Brand, Tombstone
+
+pytestmark = pytest.mark.django_db
+
+ENDPOINT = "/api/sync/"
+
+
+@pytest.fixture
+def no_window(settings):
+    settings.CATALOG_SYNC = {"SAFETY_WINDOW_SECONDS": 0}
+
+
+def sync(client, token=None, limit=None):
+    params = {key: value for key, value in [("token", token), ("limit", limit)] if value}
+    response = client.get(ENDPOINT, params)
+    assert response.status_code == 200, response.content
+    return response.json()
+
+
+def drain(client, token=None, limit=None):
+    changes = []
+    while True:
+        page = sync(client, token, limit)
+        changes += page["changes"]
+        token = page["next_token"]
+        if not page["has_more"]:
+            return changes, token
+
+
+class TestCatalogSync:
+    def test_full_sync_in_pages(self, no_window, product_factory, api_client, query_budget):
+        products = product_factory.create_batch(3)
+        client = api_client()
+        with query_budget(4):
+            first = sync(client, limit=4)
+        assert len(first["changes"]) == 4 and first["has_more"]
+
+        changes, token = drain(client, first["next_token"], limit=4)
+        changes = first["changes"] + changes
+        assert sorted((c["type"], c["id"]) for c in changes) == sorted(
+            [("product", p.id) for p in products]
+            + [("brand", p.brand_id) for p in products]
+            + [("category", p.category_id) for p in products]
+        )
+        # relations by id
+        upsert = next(c for c in changes if c["type"] == "product")
+        product = next(p for p in products if p.id == upsert["id"])
+        assert upsert["data"]["brand"] == product.brand_id
+        assert sync(client, token)["changes"] == []
+
+    def test_changes_since_token(self, no_window, product_factory, api_client):
+        kept, removed = product_factory.create_batch(2)
+        client = api_client()
+        _, token = drain(client)
+
+        kept.names = "renamed"
+        kept.save()
+        removed.brand.delete()
+        changes, _ = drain(client, token)
+        assert [(c["type"], c["op"], c["id"]) for c in changes] == [
+            ("product", "upsert", kept.id),
+            # the product goes with its brand
+            ("product", "delete", removed.id),
+            ("brand", "delete", removed.brand_id),
+        ]
+        assert changes[0]["data"]["names"] == "renamed"
+
+    def test_category_delete_updates_products(self, no_window, product_factory, api_client):
+        product = product_factory()
+        client = api_client()
+        _, token = drain(client)
+        product.category.delete()
+        changes, _ = drain(client, token)
+        assert ("product", "upsert", product.id) in [(c["type"], c["op"], c["id"]) for c in changes]
+        upsert = next(c for c in changes if c["type"] == "product")
+        assert upsert["data"]["category"] is None
+
+    def test_safety_window(self, settings, product_factory, api_client):
+        settings.CATALOG_SYNC = {"SAFETY_WINDOW_SECONDS": 60}
+        product_factory()
+        assert sync(api_client())["changes"] == []
+
+    def test_bad_and_expired_tokens(self, settings, api_client):
+        client = api_client()
+        assert client.get(ENDPOINT, {"token": "nope"}).status_code == 400
+        assert client.get(ENDPOINT, {"limit": "0"}).status_code == 400
+        token = sync(client)["next_token"]
+        settings.CATALOG_SYNC = {"TOMBSTONE_RETENTION_DAYS": 0}
+        assert client.get(ENDPOINT, {"token": token}).status_code == 410
+
+
+class TestTombstones:
+    def test_deletions_move_last_modified(self, brand_factory):
+        brand_factory()
+        last_modified = _table_state(Brand)
+        later = last_modified + datetime.timedelta(minutes=1)
+        Tombstone.objects.create(model="brand", object_id=10**6, deleted_at=later)
+        assert _table_state(Brand) == later
+
+    def test_purge(self):
+        old = timezone.now() - datetime.timedelta(days=31)
+        Tombstone.objects.create(model="brand", object_id=1, deleted_at=old)
+        Tombstone.objects.create(model="brand", object_id=2)
+        out = io.StringIO()
+        call_command("purge_tombstones", stdout=out)
+        assert out.getvalue().strip() == "1 tombstones deleted"
+        assert list(Tombstone.objects.values_list("object_id", flat=True)) == [2]
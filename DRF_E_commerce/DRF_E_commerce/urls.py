@@ -3,16 +3,31 @@ from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework.routers import DefaultRouter
 
-from DRF_E_commerce.product import views
+from DRF_E_commerce.product import async_views, views
 
 router = DefaultRouter()
 router.register(r"category", views.CategoryViewSet)
 router.register(r"brand", views.BrandViewSet)
 router.register(r"product", views.ProductViewSet)
 
+# native async read views for ASGI deployments, same payloads as the viewsets
+async_urlpatterns = [
+    path("product/", async_views.product_list, name="async-product-list"),
+    path("product/<int:pk>/", async_views.product_detail, name="async-product-detail"),
+    path("brand/", async_views.brand_list, name="async-brand-list"),
+    path("brand/<int:pk>/", async_views.brand_detail, name="async-brand-detail"),
+    path("category/", async_views.category_list, name="async-category-list"),
+    path("category/<int:pk>/", async_views.category_detail, name="async-category-detail"),
+]
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(router.urls)),
+    path("api/async/", include(async_urlpatterns)),
+    path("api/autocomplete/", views.autocomplete, name="autocomplete"),
+    path("api/sync/", views.catalog_changes, name="catalog-changes"),
+    path("api/cache/stats/", views.response_cache_stats, name="response-cache-stats"),
+    path("api/metrics/", views.request_metrics, name="request-metrics"),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/schema/docs", SpectacularSwaggerView.as_view(url_name="schema")),
 ]
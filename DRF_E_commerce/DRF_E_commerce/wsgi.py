@@ -11,6 +11,11 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DRF_E_commerce.settings')
+from DRF_E_commerce.settings import base
+
+if base.DEBUG:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DRF_E_commerce.settings.local')
+else:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DRF_E_commerce.settings.production')
 
 application = get_wsgi_application()